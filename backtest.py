@@ -1,10 +1,13 @@
-import sqlite3
+import sys
+import json
+import hashlib
 import pandas as pd
 import numpy as np
 import pickle
 import matplotlib.pyplot as plt
 from catboost import CatBoostClassifier
 from config import *
+from src.infrastructure.feature_store import FeatureStore
 
 # === НАСТРОЙКИ ФЬЮЧЕРСОВ ===
 TAKER_COM = 0.0004  # комиссия Taker Binance Futures
@@ -15,56 +18,300 @@ SL_PCT = 0.015
 LEVERAGE = 1
 CONFIDENCE_THRESHOLD = 0.65
 RISK_PER_TRADE = 0.01  # 2% от депозита на сделку
+INITIAL_BALANCE = 500.0
 
 
-def load_all_data(symbols, feature_names):
-    conn = sqlite3.connect(DB_PATH)
+def load_all_data(symbols, feature_names, store=None):
+    """Чтение из колоночного хранилища только нужных колонок (memmap, без копирования)"""
+    store = store or FeatureStore()
+    cols_to_keep = ['timestamp', 'open', 'high', 'low', 'close'] + feature_names
     all_dfs = {}
-    
+
     print(f"Загрузка данных для {len(symbols)} монет...")
     for sym in symbols:
-        table_name = f"{sym.replace('/', '_')}_features"
+        if not store.exists(sym, TIMEFRAME):
+            print(f"⚠️ Пропуск {sym}: нет данных в {store.path(sym, TIMEFRAME)}")
+            continue
         try:
-            df = pd.read_sql(f"SELECT * FROM {table_name}", conn)
-            if 'timestamp' in df.columns:
-                df['timestamp'] = pd.to_datetime(df['timestamp'])
-                cols_to_keep = ['timestamp', 'open', 'high', 'low', 'close'] + feature_names
-                df = df[cols_to_keep]
-                all_dfs[sym] = df
-            else:
-                print(f"⚠️ Пропуск {sym}: нет колонки timestamp")
+            all_dfs[sym] = store.read(sym, TIMEFRAME, columns=cols_to_keep)
         except Exception as e:
             print(f"⚠️ Ошибка загрузки {sym}: {e}")
-            
-    conn.close()
+
     return all_dfs
 
 
-def backtest():
-    print("Загружаем модель и фичи...")
-    model = CatBoostClassifier()
-    model.load_model(str(MODELS_DIR / "catboost_model.cbm"))
-    
-    with open(MODELS_DIR / "features.pkl", "rb") as f:
-        feature_names = pickle.load(f)
-        
-    all_dfs = load_all_data(SYMBOLS, feature_names)
-    if not all_dfs:
-        print("Ошибка: Нет данных для бектеста!")
-        return
+def file_hash(path):
+    """sha256 содержимого файла (ключ кэша по модели)"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def frame_hash(df):
+    """Хэш таблицы признаков (значения + индекс + имена колонок)"""
+    h = hashlib.sha256(pd.util.hash_pandas_object(df, index=True).values.tobytes())
+    h.update("|".join(map(str, df.columns)).encode())
+    return h.hexdigest()
+
+
+def to_class_probs(probs):
+    """(n, 2|3) -> (n, 3) с колонками p_short, p_neutral, p_long"""
+    probs = np.asarray(probs, dtype=np.float64)
+    if probs.shape[1] == 2:
+        return np.column_stack([probs[:, 0], np.zeros(len(probs)), probs[:, 1]])
+    return probs
+
+
+def predict_all(model, all_dfs, feature_names, model_path=None, use_cache=True):
+    """
+    Вероятности по всем строкам всех монет за один вызов predict_proba.
+    Возвращает {sym: ndarray (n, 3)}, выровненный со строками all_dfs[sym].
+    Кэш на диске: ключ = хэш файла модели + хэш таблицы признаков монеты.
+    """
+    model_key = file_hash(model_path)[:16] if (use_cache and model_path) else None
+    probs = {}
+    pending = {}
+
+    for sym, df in all_dfs.items():
+        if model_key is None:
+            pending[sym] = None
+            continue
+        key = frame_hash(df[['timestamp'] + feature_names])[:16]
+        cache_file = PROBA_CACHE_DIR / f"{sym.replace('/', '_')}_{model_key}_{key}.npy"
+        if cache_file.exists():
+            probs[sym] = np.load(cache_file)
+        else:
+            pending[sym] = cache_file
+
+    if pending:
+        print(f"Инференс: {sum(len(all_dfs[s]) for s in pending)} строк по {len(pending)} монетам...")
+        X = pd.concat([all_dfs[sym][feature_names] for sym in pending], ignore_index=True)
+        stacked = to_class_probs(model.predict_proba(X))
+        offset = 0
+        for sym, cache_file in pending.items():
+            n = len(all_dfs[sym])
+            probs[sym] = stacked[offset:offset + n]
+            offset += n
+            if cache_file is not None:
+                PROBA_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+                np.save(cache_file, probs[sym])
+    else:
+        print("Инференс: вероятности взяты из кэша")
+
+    return probs
+
+
+def strategy_params(**overrides):
+    """Параметры стратегии (по умолчанию - константы модуля)"""
+    params = {
+        'threshold': CONFIDENCE_THRESHOLD,
+        'tp_pct': TP_PCT,
+        'sl_pct': SL_PCT,
+        'risk_per_trade': RISK_PER_TRADE,
+        'leverage': LEVERAGE,
+        'slippage': SLIPPAGE,
+        'commission': TAKER_COM,
+        'initial_balance': INITIAL_BALANCE,
+    }
+    params.update(overrides)
+    return params
+
+
+def build_market(all_dfs, timestamps):
+    """Непрерывные массивы (symbols x candles) из выровненных по времени DataFrame"""
+    symbols = list(all_dfs.keys())
+    market = {'symbols': symbols, 'timestamps': list(timestamps)}
+    market['months'] = list(pd.DatetimeIndex(timestamps).strftime('%Y-%m'))
+    for col in ('open', 'high', 'low', 'close'):
+        market[col] = np.ascontiguousarray(np.stack([all_dfs[sym][col].to_numpy(dtype=np.float64) for sym in symbols]))
+    return market
+
+
+def simulate(market, probs, params=None, verbose=True):
+    """
+    Симуляция портфеля по массивам цен и вероятностей.
+    probs: ndarray (symbols x candles x 3) - p_short, p_neutral, p_long.
+    Правила TP/SL, проскальзывания, комиссии, маржи и размера позиции - те же,
+    что в эталонном simulate_iloc (сверка: compare_engines).
+    """
+    p = params or strategy_params()
+    th, tp_pct, sl_pct = p['threshold'], p['tp_pct'], p['sl_pct']
+    slippage, commission, leverage = p['slippage'], p['commission'], p['leverage']
+    risk_per_trade = p['risk_per_trade']
+
+    symbols = market['symbols']
+    timestamps = market['timestamps']
+    months = market['months']
+    num_syms = len(symbols)
+
+    # Сигналы считаются векторно; LONG имеет приоритет, как в исходном цикле
+    p_short = probs[:, :, 0]
+    p_long = probs[:, :, 2]
+    signals = np.where(p_long > th, 1, np.where(p_short > th, -1, 0)).astype(np.int8)
+    has_signal = signals.any(axis=0).tolist()
+
+    # Скалярный доступ к спискам Python быстрее, чем к элементам ndarray
+    opens = [row.tolist() for row in market['open']]
+    highs = [row.tolist() for row in market['high']]
+    lows = [row.tolist() for row in market['low']]
+    sigs = [row.tolist() for row in signals]
+    p_shorts = [row.tolist() for row in p_short]
+    p_longs = [row.tolist() for row in p_long]
+
+    balance = p['initial_balance']
+    pos_dir = [0] * num_syms
+    pos_entry = [0.0] * num_syms
+    pos_size = [0.0] * num_syms
+    pos_margin = [0.0] * num_syms
+    open_count = 0
+    trades = []
+    equity_curve = []
+    equity_timestamps = []
+    monthly_stats = {}
+    peak_balance = balance
+    max_drawdown = 0.0
+    used_margin = 0.0
 
-    common_timestamps = sorted(list(set.intersection(*(set(df['timestamp']) for df in all_dfs.values()))))
-    split_idx = int(len(common_timestamps) * 0.85)
-    test_timestamps = common_timestamps[split_idx:]
-    if not test_timestamps:
-        print("Ошибка: Слишком мало данных для теста!")
-        return
+    for i in range(len(timestamps) - 1):
+        equity_curve.append(balance)
+        equity_timestamps.append(timestamps[i])
+
+        month_key = months[i + 1]
+        if month_key not in monthly_stats:
+            monthly_stats[month_key] = {'pnl_abs': 0.0, 'trades': 0, 'wins': 0, 'start_balance': balance}
+
+        # Нет открытых позиций и сигналов - на этой свече ничего не происходит
+        if open_count == 0 and not has_signal[i]:
+            continue
+
+        next_ts = timestamps[i + 1]
+        for k in range(num_syms):
+            direction = pos_dir[k]
+
+            # --- ЛОГИКА ВЫХОДА ---
+            if direction != 0:
+                entry_price = pos_entry[k]
+                next_open = opens[k][i + 1]
+                next_high = highs[k][i + 1]
+                next_low = lows[k][i + 1]
+                exit_signal = False
+                exit_price = 0.0
+                reason = ""
+
+                if direction == 1:
+                    stop_price = entry_price * (1 - sl_pct)
+                    take_price = entry_price * (1 + tp_pct)
+                    if next_low <= stop_price:
+                        exit_price = (next_open if next_open < stop_price else stop_price) * (1 - slippage)
+                        exit_signal = True
+                        reason = "❌ SL"
+                    elif next_high >= take_price:
+                        exit_price = take_price * (1 - slippage)
+                        exit_signal = True
+                        reason = "✅ TP"
+                else:
+                    stop_price = entry_price * (1 + sl_pct)
+                    take_price = entry_price * (1 - tp_pct)
+                    if next_high >= stop_price:
+                        exit_price = (next_open if next_open > stop_price else stop_price) * (1 + slippage)
+                        exit_signal = True
+                        reason = "❌ SL"
+                    elif next_low <= take_price:
+                        exit_price = take_price * (1 + slippage)
+                        exit_signal = True
+                        reason = "✅ TP"
 
-    for sym in all_dfs:
-        df = all_dfs[sym]
-        all_dfs[sym] = df[df['timestamp'].isin(test_timestamps)].sort_values('timestamp').reset_index(drop=True)
+                if not exit_signal:
+                    continue
+
+                if direction == 1:
+                    raw_pnl = (exit_price - entry_price) / entry_price
+                else:
+                    raw_pnl = (entry_price - exit_price) / entry_price
+                pnl_clean = raw_pnl - (commission + commission)
+                trade_profit = pos_size[k] * pnl_clean
+
+                used_margin -= pos_margin[k]
+                if used_margin < 0:
+                    used_margin = 0.0
+                balance += trade_profit
+
+                trades.append({'sym': symbols[k], 'pnl_pct': pnl_clean, 'pnl_abs': trade_profit, 'ts': next_ts})
+                stats = monthly_stats[month_key]
+                stats['pnl_abs'] += trade_profit
+                stats['trades'] += 1
+                if pnl_clean > 0:
+                    stats['wins'] += 1
+
+                if balance > peak_balance:
+                    peak_balance = balance
+                current_dd = (peak_balance - balance) / peak_balance * 100
+                if current_dd > max_drawdown:
+                    max_drawdown = current_dd
+
+                pos_dir[k] = 0
+                open_count -= 1
+                if verbose:
+                    print(f"[{next_ts}] {symbols[k]}: {reason} | PnL: {pnl_clean*100:.2f}% | Bal: {balance:.2f}")
+                continue
 
-    balance = 500.0
+            # --- ЛОГИКА ВХОДА ---
+            signal = sigs[k][i]
+            if signal == 0:
+                continue
+
+            risk_capital = balance * risk_per_trade
+            position_notional = risk_capital / sl_pct
+            max_notional = balance * leverage
+            position_notional = min(position_notional, max_notional)
+
+            required_margin = position_notional / leverage
+            available_balance = balance - used_margin
+            if required_margin > available_balance:
+                required_margin = available_balance
+                position_notional = required_margin * leverage
+
+            if position_notional < 10:
+                continue
+
+            used_margin += required_margin
+            next_open = opens[k][i + 1]
+            if signal == 1:
+                entry_price = next_open * (1 + slippage)
+            else:
+                entry_price = next_open * (1 - slippage)
+
+            pos_dir[k] = signal
+            pos_entry[k] = entry_price
+            pos_size[k] = position_notional
+            pos_margin[k] = required_margin
+            open_count += 1
+            if verbose:
+                direction_str = "LONG" if signal == 1 else "SHORT"
+                prob = p_longs[k][i] if signal == 1 else p_shorts[k][i]
+                print(f"[{next_ts}] {symbols[k]}: OPEN {direction_str} (Sig: {prob:.2f}) Size: {position_notional:.1f}$ Margin: {required_margin:.1f}$")
+                print(f"[{next_ts}] {symbols[k]}: OPEN {direction_str} (Sig: {prob:.2f}) at {entry_price:.2f}")
+
+    return {
+        'balance': balance,
+        'trades': trades,
+        'equity_curve': equity_curve,
+        'equity_timestamps': equity_timestamps,
+        'monthly_stats': monthly_stats,
+        'max_drawdown': max_drawdown,
+        'initial_balance': p['initial_balance'],
+    }
+
+
+def simulate_iloc(all_dfs, all_probs, timestamps, params=None, verbose=True):
+    """
+    Эталонный движок: исходный построчный цикл по df.iloc.
+    Медленный, оставлен для регрессионной сверки с simulate().
+    """
+    p = params or strategy_params()
+    balance = p['initial_balance']
     positions = {sym: None for sym in all_dfs}
     trades = []
     equity_curve = []
@@ -74,14 +321,9 @@ def backtest():
     max_drawdown = 0.0
     used_margin = 0.0  # Заблокированная маржа
 
-    print(f"Старт симуляции на {len(test_timestamps)} свечах...")
-    print(f"Период: {test_timestamps[0]} -> {test_timestamps[-1]}")
-    print(f"Монеты: {', '.join(all_dfs.keys())}")
-
-    num_candles = len(test_timestamps)
-    for i in range(num_candles - 1):
-        current_ts = test_timestamps[i]
-        next_ts = test_timestamps[i+1]
+    for i in range(len(timestamps) - 1):
+        current_ts = timestamps[i]
+        next_ts = timestamps[i+1]
         equity_curve.append(balance)
         equity_timestamps.append(current_ts)
 
@@ -107,27 +349,27 @@ def backtest():
                 reason = ""
 
                 if direction == 1:  # LONG
-                    stop_price = entry_price * (1 - SL_PCT)
-                    take_price = entry_price * (1 + TP_PCT)
+                    stop_price = entry_price * (1 - p['sl_pct'])
+                    take_price = entry_price * (1 + p['tp_pct'])
                     
                     if next_low <= stop_price:
-                        exit_price = (next_open if next_open < stop_price else stop_price) * (1 - SLIPPAGE)
+                        exit_price = (next_open if next_open < stop_price else stop_price) * (1 - p['slippage'])
                         exit_signal = True
                         reason = "❌ SL"
                     elif next_high >= take_price:
-                        exit_price = take_price * (1 - SLIPPAGE)
+                        exit_price = take_price * (1 - p['slippage'])
                         exit_signal = True
                         reason = "✅ TP"
                 else:  # SHORT
-                    stop_price = entry_price * (1 + SL_PCT)
-                    take_price = entry_price * (1 - TP_PCT)
+                    stop_price = entry_price * (1 + p['sl_pct'])
+                    take_price = entry_price * (1 - p['tp_pct'])
                     
                     if next_high >= stop_price:
-                        exit_price = (next_open if next_open > stop_price else stop_price) * (1 + SLIPPAGE)
+                        exit_price = (next_open if next_open > stop_price else stop_price) * (1 + p['slippage'])
                         exit_signal = True
                         reason = "❌ SL"
                     elif next_low <= take_price:
-                        exit_price = take_price * (1 + SLIPPAGE)
+                        exit_price = take_price * (1 + p['slippage'])
                         exit_signal = True
                         reason = "✅ TP"
 
@@ -137,7 +379,7 @@ def backtest():
                     else:
                         raw_pnl = (entry_price - exit_price) / entry_price
 
-                    pnl_clean = raw_pnl - (TAKER_COM + TAKER_COM)
+                    pnl_clean = raw_pnl - (p['commission'] + p['commission'])
                     trade_profit = position_notional * pnl_clean
 
                     # === ПРАВКА: освобождение маржи ===
@@ -160,38 +402,33 @@ def backtest():
                         max_drawdown = current_dd
 
                     positions[sym] = None
-                    print(f"[{next_ts}] {sym}: {reason} | PnL: {pnl_clean*100:.2f}% | Bal: {balance:.2f}")
+                    if verbose:
+                        print(f"[{next_ts}] {sym}: {reason} | PnL: {pnl_clean*100:.2f}% | Bal: {balance:.2f}")
                     continue
 
             # --- ЛОГИКА ВХОДА ---
             if positions[sym] is None:
-                current_features = df.iloc[[i]][feature_names]
-                probs = model.predict_proba(current_features)[0]
-                p_short, p_neutral, p_long = 0, 0, 0
-                if len(probs) == 2:
-                    p_short, p_long = probs
-                else:
-                    p_short, p_neutral, p_long = probs
+                p_short, p_neutral, p_long = all_probs[sym][i]
                 
                 signal = 0
-                if p_long > CONFIDENCE_THRESHOLD: 
+                if p_long > p['threshold']: 
                     signal = 1
-                elif p_short > CONFIDENCE_THRESHOLD: 
+                elif p_short > p['threshold']: 
                     signal = -1
 
                 if signal != 0:
-                    risk_capital = balance * RISK_PER_TRADE
-                    position_notional = risk_capital / SL_PCT
+                    risk_capital = balance * p['risk_per_trade']
+                    position_notional = risk_capital / p['sl_pct']
                     
-                    max_notional = balance * LEVERAGE
+                    max_notional = balance * p['leverage']
                     position_notional = min(position_notional, max_notional)
                     
-                    required_margin = position_notional / LEVERAGE
+                    required_margin = position_notional / p['leverage']
                     available_balance = balance - used_margin
                     
                     if required_margin > available_balance:
                         required_margin = available_balance
-                        position_notional = required_margin * LEVERAGE
+                        position_notional = required_margin * p['leverage']
                     
                     if position_notional < 10:
                         continue
@@ -199,11 +436,11 @@ def backtest():
                     used_margin += required_margin
                     
                     if signal == 1:
-                        entry_price = next_open * (1 + SLIPPAGE)
+                        entry_price = next_open * (1 + p['slippage'])
                         direction_str = "LONG"
                         prob = p_long
                     else:
-                        entry_price = next_open * (1 - SLIPPAGE)
+                        entry_price = next_open * (1 - p['slippage'])
                         direction_str = "SHORT"
                         prob = p_short
 
@@ -213,10 +450,116 @@ def backtest():
                         'size': position_notional,
                         'margin': required_margin
                     }
-                    print(f"[{next_ts}] {sym}: OPEN {direction_str} (Sig: {prob:.2f}) Size: {position_notional:.1f}$ Margin: {required_margin:.1f}$")
-                    print(f"[{next_ts}] {sym}: OPEN {direction_str} (Sig: {prob:.2f}) at {entry_price:.2f}")
+                    if verbose:
+                        print(f"[{next_ts}] {sym}: OPEN {direction_str} (Sig: {prob:.2f}) Size: {position_notional:.1f}$ Margin: {required_margin:.1f}$")
+                        print(f"[{next_ts}] {sym}: OPEN {direction_str} (Sig: {prob:.2f}) at {entry_price:.2f}")
+
+    return {
+        'balance': balance,
+        'trades': trades,
+        'equity_curve': equity_curve,
+        'equity_timestamps': equity_timestamps,
+        'monthly_stats': monthly_stats,
+        'max_drawdown': max_drawdown,
+        'initial_balance': p['initial_balance'],
+    }
+
+
+def compare_engines(all_dfs, all_probs, timestamps, params=None):
+    """Регрессия: сделки simulate() и simulate_iloc() должны совпадать один в один"""
+    import time
+
+    market = build_market(all_dfs, timestamps)
+    probs = np.stack([all_probs[sym] for sym in market['symbols']])
+
+    t0 = time.perf_counter()
+    fast = simulate(market, probs, params, verbose=False)
+    t1 = time.perf_counter()
+    ref = simulate_iloc(all_dfs, all_probs, timestamps, params, verbose=False)
+    t2 = time.perf_counter()
+
+    assert len(fast['trades']) == len(ref['trades']), \
+        f"Trade count differs: {len(fast['trades'])} vs {len(ref['trades'])}"
+    for n, (a, b) in enumerate(zip(fast['trades'], ref['trades'])):
+        assert a == b, f"Trade #{n} differs: {a} vs {b}"
+    assert fast['balance'] == ref['balance'] and fast['max_drawdown'] == ref['max_drawdown']
+    assert fast['equity_curve'] == ref['equity_curve']
+    assert fast['monthly_stats'] == ref['monthly_stats']
+
+    speedup = (t2 - t1) / max(t1 - t0, 1e-9)
+    print(f"✅ Движки совпадают: {len(ref['trades'])} сделок | "
+          f"array {t1 - t0:.3f}s vs iloc {t2 - t1:.3f}s (x{speedup:.0f})")
+    return {'trades': len(ref['trades']), 'speedup': speedup}
+
+
+def check_engines(symbols=3, bars=3000, thresholds=(0.5, 0.6, 0.7), seed=0):
+    """
+    compare_engines без БД и модели: синтетические свечи (benchmark.synthetic_ohlcv)
+    и случайные вероятности Dirichlet, по прогону на каждый порог входа.
+    Детерминировано по seed; бросает AssertionError при расхождении сделок.
+    """
+    from benchmark import synthetic_ohlcv
+
+    rng = np.random.default_rng(seed)
+    all_dfs = {f"SYN{i}/USDT": synthetic_ohlcv(bars, seed=seed + i) for i in range(symbols)}
+    all_probs = {sym: rng.dirichlet(np.ones(3), bars) for sym in all_dfs}
+    timestamps = common_timestamps(all_dfs)
+    results = {}
+    for threshold in thresholds:
+        results[threshold] = compare_engines(all_dfs, all_probs, timestamps, strategy_params(threshold=threshold))
+        if results[threshold]['trades'] == 0:
+            raise AssertionError(f"No trades at threshold {threshold}: nothing to compare")
+    return results
+
+
+def compute_metrics(result):
+    """Sharpe / Sortino / Calmar / CAGR / Profit Factor по дневной кривой капитала"""
+    equity_curve = result['equity_curve']
+    trades = result['trades']
+    max_drawdown = result['max_drawdown']
+    sharpe = sortino = calmar = cagr = 0
+    pf = 0
+
+    if len(equity_curve) > 0:
+        equity_series = pd.Series(equity_curve, index=result['equity_timestamps'])
+        daily_equity = equity_series.resample('D').last().ffill()
+        daily_returns = daily_equity.pct_change().dropna()
+        
+        if len(daily_returns) > 1 and daily_returns.std() > 0:
+            total_days = (daily_equity.index[-1] - daily_equity.index[0]).days
+            cagr = (daily_equity.iloc[-1] / daily_equity.iloc[0]) ** (365 / total_days) - 1 if total_days > 0 else 0
+
+            risk_free_rate = 0.0
+            mean_daily_return = daily_returns.mean()
+            std_daily_return = daily_returns.std()
+            sharpe = ((mean_daily_return - (risk_free_rate/365)) / std_daily_return) * np.sqrt(365)
+
+            downside_returns = daily_returns[daily_returns < 0]
+            if len(downside_returns) > 1 and downside_returns.std() > 0:
+                sortino = ((mean_daily_return - (risk_free_rate/365)) / downside_returns.std() * np.sqrt(365))
+            else:
+                sortino = 0
+
+            calmar = cagr / (max_drawdown / 100) if max_drawdown > 0 else 0
+
+        if trades:
+            returns = np.array([t['pnl_abs'] for t in trades])
+            gross_profit = sum([r for r in returns if r > 0])
+            gross_loss = abs(sum([r for r in returns if r < 0]))
+            pf = gross_profit / gross_loss if gross_loss > 0 else float('inf')
+
+    return {'profit_factor': pf, 'sharpe': sharpe, 'sortino': sortino, 'calmar': calmar, 'cagr': cagr}
+
+
+def report(result):
+    """Печать итогов, метрик и график кривой капитала"""
+    balance = result['balance']
+    monthly_stats = result['monthly_stats']
+    max_drawdown = result['max_drawdown']
+    equity_curve = result['equity_curve']
+    equity_timestamps = result['equity_timestamps']
+    initial_balance = result['initial_balance']
 
-    # === РЕЗУЛЬТАТЫ ===
     print("\n" + "="*50)
     print(f"ИТОГОВЫЕ РЕЗУЛЬТАТЫ ПО ВСЕМ МОНЕТАМ")
     print("="*50)
@@ -227,8 +570,6 @@ def backtest():
     total_trades = 0
     total_wins = 0
 
-    initial_balance = 500.0
-
     for m in sorted(monthly_stats.keys()):
         stats = monthly_stats[m]
         count = stats['trades']
@@ -252,51 +593,21 @@ def backtest():
 
     # === МЕТРИКИ ===
     if len(equity_curve) > 0:
-        equity_series = pd.Series(equity_curve, index=equity_timestamps)
-        daily_equity = equity_series.resample('D').last().ffill()
-        daily_returns = daily_equity.pct_change().dropna()
-        
-        if len(daily_returns) > 1 and daily_returns.std() > 0:
-            total_days = (daily_equity.index[-1] - daily_equity.index[0]).days
-            cagr = (daily_equity.iloc[-1] / daily_equity.iloc[0]) ** (365 / total_days) - 1 if total_days > 0 else 0
-
-            risk_free_rate = 0.0
-            mean_daily_return = daily_returns.mean()
-            std_daily_return = daily_returns.std()
-            sharpe = ((mean_daily_return - (risk_free_rate/365)) / std_daily_return) * np.sqrt(365)
-
-            downside_returns = daily_returns[daily_returns < 0]
-            if len(downside_returns) > 1 and downside_returns.std() > 0:
-                sortino = ((mean_daily_return - (risk_free_rate/365)) / downside_returns.std() * np.sqrt(365))
-            else:
-                sortino = 0
-
-            calmar = cagr / (max_drawdown / 100) if max_drawdown > 0 else 0
-        else:
-            sharpe = sortino = calmar = cagr = 0
-
-        if trades:
-            returns = np.array([t['pnl_abs'] for t in trades])
-            gross_profit = sum([r for r in returns if r > 0])
-            gross_loss = abs(sum([r for r in returns if r < 0]))
-            pf = gross_profit / gross_loss if gross_loss > 0 else float('inf')
-        else:
-            pf = 0
-
+        metrics = compute_metrics(result)
         print("\n" + "="*40)
         print("📊 ПРОФЕССИОНАЛЬНЫЕ МЕТРИКИ")
         print("="*40)
-        print(f"Profit Factor:   {pf:.2f}")
-        print(f"Sharpe Ratio:    {sharpe:.2f} (Норма: >1.0, Отлично: >2.0)")
-        print(f"Sortino Ratio:   {sortino:.2f} (Лучше Шарпа, т.к. не наказывает за рост)")
-        print(f"Calmar Ratio:    {calmar:.2f} (Доходность / Риск)")
-        print(f"CAGR (Годовые):  {cagr*100:.2f}%")
+        print(f"Profit Factor:   {metrics['profit_factor']:.2f}")
+        print(f"Sharpe Ratio:    {metrics['sharpe']:.2f} (Норма: >1.0, Отлично: >2.0)")
+        print(f"Sortino Ratio:   {metrics['sortino']:.2f} (Лучше Шарпа, т.к. не наказывает за рост)")
+        print(f"Calmar Ratio:    {metrics['calmar']:.2f} (Доходность / Риск)")
+        print(f"CAGR (Годовые):  {metrics['cagr']*100:.2f}%")
         print("-" * 40)
 
     if len(equity_curve) > 1:
         plt.figure(figsize=(12, 6))
         plt.plot(equity_timestamps, equity_curve, 'b-', label='Portfolio Equity')
-        plt.axhline(y=500, color='gray', linestyle='--')
+        plt.axhline(y=initial_balance, color='gray', linestyle='--')
         plt.title(f'Multi-Symbol Equity Curve | {total_trades} trades | DD: {max_drawdown:.1f}%')
         plt.grid(True, alpha=0.3)
         plt.savefig('equity_curve.png', dpi=150)
@@ -304,5 +615,116 @@ def backtest():
         print("\n📈 График сохранен: equity_curve.png")
 
 
+def common_timestamps(all_dfs):
+    return sorted(list(set.intersection(*(set(df['timestamp']) for df in all_dfs.values()))))
+
+
+def align_to(all_dfs, timestamps):
+    """Строки каждой монеты только на заданных свечах, по порядку времени"""
+    return {
+        sym: df[df['timestamp'].isin(timestamps)].sort_values('timestamp').reset_index(drop=True)
+        for sym, df in all_dfs.items()
+    }
+
+
+def load_test_set():
+    """
+    Тестовый отрезок (последние 15% общих свечей) и вероятности модели по нему.
+    Возвращает (all_dfs, all_probs, test_timestamps) или None, если данных нет.
+    """
+    print("Загружаем модель и фичи...")
+    model_path = MODELS_DIR / "catboost_model.cbm"
+    model = CatBoostClassifier()
+    model.load_model(str(model_path))
+    
+    with open(MODELS_DIR / "features.pkl", "rb") as f:
+        feature_names = pickle.load(f)
+        
+    all_dfs = load_all_data(SYMBOLS, feature_names)
+    if not all_dfs:
+        print("Ошибка: Нет данных для бектеста!")
+        return None
+
+    common = common_timestamps(all_dfs)
+    split_idx = int(len(common) * 0.85)
+    test_timestamps = common[split_idx:]
+    if not test_timestamps:
+        print("Ошибка: Слишком мало данных для теста!")
+        return None
+
+    all_dfs = align_to(all_dfs, test_timestamps)
+
+    # Все вероятности считаются до симуляции; цикл только читает массивы
+    all_probs = predict_all(model, all_dfs, feature_names, model_path=model_path)
+    return all_dfs, all_probs, test_timestamps
+
+
+def load_walk_forward_set(manifest_path=WALK_FORWARD_DIR / "folds.json"):
+    """
+    Склейка тестовых окон walk-forward (train.py): вероятности каждого окна
+    считает модель своего фолда, так что весь отрезок - out-of-sample.
+    Возвращает (all_dfs, all_probs, test_timestamps) или None.
+    """
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    feature_names = manifest['features']
+    print(f"Walk-forward: {len(manifest['folds'])} фолдов из {manifest_path}")
+
+    all_dfs = load_all_data(manifest['symbols'], feature_names)
+    if not all_dfs:
+        print("Ошибка: Нет данных для бектеста!")
+        return None
+    common = pd.DatetimeIndex(common_timestamps(all_dfs))
+
+    dfs = {sym: [] for sym in all_dfs}
+    probs = {sym: [] for sym in all_dfs}
+    test_timestamps = []
+    for fold in manifest['folds']:
+        window = common[(common >= fold['test_start']) & (common <= fold['test_end'])]
+        fold_dfs = align_to(all_dfs, window)
+        model_path = Path(manifest_path).parent / fold['model']
+        model = CatBoostClassifier()
+        model.load_model(str(model_path))
+        fold_probs = predict_all(model, fold_dfs, feature_names, model_path=model_path)
+        for sym in all_dfs:
+            dfs[sym].append(fold_dfs[sym])
+            probs[sym].append(fold_probs[sym])
+        test_timestamps.extend(window)
+
+    if not test_timestamps:
+        print("Ошибка: Тестовые окна фолдов не пересекаются с данными!")
+        return None
+    all_dfs = {sym: pd.concat(parts, ignore_index=True) for sym, parts in dfs.items()}
+    all_probs = {sym: np.concatenate(parts) for sym, parts in probs.items()}
+    return all_dfs, all_probs, test_timestamps
+
+
+def backtest(verify=False, walk_forward=False):
+    test_set = load_walk_forward_set() if walk_forward else load_test_set()
+    if test_set is None:
+        return
+    all_dfs, all_probs, test_timestamps = test_set
+
+    if verify:
+        compare_engines(all_dfs, all_probs, test_timestamps)
+        return
+
+    print(f"Старт симуляции на {len(test_timestamps)} свечах...")
+    print(f"Период: {test_timestamps[0]} -> {test_timestamps[-1]}")
+    print(f"Монеты: {', '.join(all_dfs.keys())}")
+
+    market = build_market(all_dfs, test_timestamps)
+    probs = np.stack([all_probs[sym] for sym in market['symbols']])
+    result = simulate(market, probs)
+    report(result)
+
+
 if __name__ == '__main__':
-    backtest()
+    # --verify: сверка массивного движка с эталонным iloc-циклом
+    # --check: та же сверка на синтетике, без БД и модели
+    # --walk-forward: out-of-sample окна фолдов train.py вместо split 85/15
+    args = sys.argv[1:]
+    if '--check' in args:
+        check_engines()
+    else:
+        backtest(verify='--verify' in args, walk_forward='--walk-forward' in args)
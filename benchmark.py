@@ -0,0 +1,386 @@
+import io
+import sys
+import copy
+import json
+import time
+import pickle
+import logging
+import platform
+import argparse
+import contextlib
+import tempfile
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from catboost import CatBoostClassifier
+from config import MODELS_DIR, TIMEFRAME, HTF_TIMEFRAME, TF_MS, LABEL_SETS, KLINE_BUFFER_SIZE
+import etl_pipeline as etl
+import backtest as bt
+from src.infrastructure.feature_store import FeatureStore
+from src.infrastructure.feature_engine import LTF_COLUMNS, HTF_COLUMNS
+from src.infrastructure import indicators
+from src.infrastructure.generator import MLSignalGenerator
+from src.infrastructure.tree_evaluator import ObliviousTreeModel
+from src.application.resampler import resample_frame
+
+TREE_BATCH_SIZES = [1, 10, 100, 1_000, 10_000, 100_000]
+HTF_ALIGN_SIZES = [1_500, 20_000, 200_000]  # LTF свечей: окно бота, история символа, длинная история
+# (символов, свечей): хвосты инкрементального ETL, истории, одна длинная история
+INDICATOR_PANELS = [(64, 1_100), (20, 20_000), (1, 200_000)]
+
+# Признаки заглушки - как у боевой модели (абсолютные уровни цены не используются)
+STANDIN_FEATURES = [
+    c for c in LTF_COLUMNS + HTF_COLUMNS
+    if c not in ('volume_ma_20', 'Resistance', 'Support', 'HTF_EMA_50')
+]
+STANDIN_PARAMS = {
+    'iterations': 50,
+    'depth': 4,
+    'loss_function': 'MultiClass',
+    'thread_count': 1,
+    'verbose': False,
+    'allow_writing_files': False,
+}
+SIGNAL_STEPS = 100  # новых свечей в замере устоявшегося цикла живого бота
+
+# Метрики "меньше - лучше", по которым ищутся регрессии при --compare
+REGRESSION_METRICS = ['seconds', 'peak_mb', 'native_us_per_row', 'numpy_us_per_row', 'numpy_us']
+
+
+def timeit(fn, min_time=0.2, max_repeat=1000):
+    """Среднее время вызова (сек.): повторы, пока суммарно не наберется min_time"""
+    fn()  # прогрев
+    repeats, total = 0, 0.0
+    while total < min_time and repeats < max_repeat:
+        t0 = time.perf_counter()
+        fn()
+        total += time.perf_counter() - t0
+        repeats += 1
+    return total / repeats
+
+
+def peak_memory(fn):
+    """
+    Пик памяти одного вызова (МБ) сверх уже занятой - по tracemalloc, т.е.
+    Python-объекты и буферы NumPy/pandas; память внутри CatBoost не видна.
+    """
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1] / 2**20
+    finally:
+        tracemalloc.stop()
+
+
+def synthetic_ohlcv(bars, timeframe=TIMEFRAME, seed=0, start='2022-01-01', price=100.0, vol=0.01):
+    """
+    Детерминированные свечи: геометрическое блуждание close (vol - сигма за час,
+    масштабируется по таймфрейму), open = прошлый close, тени и объем случайные.
+    """
+    rng = np.random.default_rng(seed)
+    step = TF_MS[timeframe]
+    sigma = vol * np.sqrt(step / 3_600_000)
+    close = price * np.exp(np.cumsum(rng.normal(0, sigma, bars)))
+    open_ = np.r_[price, close[:-1]]
+    high = np.maximum(open_, close) * (1 + rng.exponential(sigma / 2, bars))
+    low = np.minimum(open_, close) * (1 - rng.exponential(sigma / 2, bars))
+    return pd.DataFrame({
+        'timestamp': pd.Timestamp(start) + pd.to_timedelta(np.arange(bars) * step, unit='ms'),
+        'open': open_,
+        'high': high,
+        'low': low,
+        'close': close,
+        'volume': rng.lognormal(3, 0.5, bars),
+    })
+
+
+def synthetic_market(symbols=4, bars=20_000, timeframe=TIMEFRAME, seed=0):
+    """{symbol: (df, htf_df)}; у каждого символа свой seed (seed + номер)"""
+    if TF_MS[timeframe] >= TF_MS[HTF_TIMEFRAME]:
+        raise ValueError(f"Timeframe {timeframe} must be lower than HTF_TIMEFRAME {HTF_TIMEFRAME}")
+    market = {}
+    for i in range(symbols):
+        df = synthetic_ohlcv(bars, timeframe, seed=seed + i)
+        market[f"SYN{i}/USDT"] = (df, resample_frame(df, HTF_TIMEFRAME))
+    return market
+
+
+def train_standin(features, models_dir, seed=0):
+    """Маленькая модель на синтетике в models_dir (catboost_model.cbm + features.pkl)"""
+    models_dir = Path(models_dir)
+    models_dir.mkdir(parents=True, exist_ok=True)
+    model = CatBoostClassifier(**STANDIN_PARAMS, random_seed=seed)
+    model.fit(features[STANDIN_FEATURES], features['Target'])
+    model.save_model(str(models_dir / "catboost_model.cbm"))
+    with open(models_dir / "features.pkl", "wb") as f:
+        pickle.dump(STANDIN_FEATURES, f)
+    return model
+
+
+def write_candles(conn, market):
+    rows = []
+    for symbol, (df, htf_df) in market.items():
+        for timeframe, frame in ((TIMEFRAME, df), (HTF_TIMEFRAME, htf_df)):
+            ms = frame['timestamp'].to_numpy().astype('datetime64[ms]').astype(np.int64)
+            rows.extend(zip(
+                [symbol] * len(frame), [timeframe] * len(frame), ms.tolist(),
+                *(frame[c].tolist() for c in ('open', 'high', 'low', 'close', 'volume')),
+                (frame['close'] * frame['volume']).tolist(),
+            ))
+    conn.executemany("INSERT OR REPLACE INTO candles VALUES (?,?,?,?,?,?,?,?,?)", rows)
+    conn.commit()
+
+
+def bench_pipeline(symbols=4, bars=20_000, timeframe=TIMEFRAME, seed=0, min_time=0.2):
+    """
+    Время и пик памяти каждой стадии ETL -> бектест -> живой сигнал на синтетике.
+    Все файлы (SQLite, хранилище признаков, модель-заглушка) - во временном каталоге.
+    """
+    market = synthetic_market(symbols, bars, timeframe, seed)
+    names = list(market)
+    # Промежуточные результаты стадий - входы следующих
+    ltf = {s: etl.add_features(df) for s, (df, _) in market.items()}
+    merged = {s: etl.add_htf_features(ltf[s], market[s][1]) for s in names}
+    labeled = {s: etl.triple_barrier_labeling(merged[s].copy(), LABEL_SETS) for s in names}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        conn = etl.init_db(tmp / "bench.db")
+        write_candles(conn, market)
+        store = FeatureStore(tmp / "feature_store")
+        for s in names:
+            etl.save_processed(labeled[s], s, store)
+        model = train_standin(labeled[names[0]], tmp / "models", seed)
+
+        all_dfs = bt.load_all_data(names, STANDIN_FEATURES, store)
+        timestamps = bt.common_timestamps(all_dfs)
+        all_dfs = bt.align_to(all_dfs, timestamps)
+        all_probs = bt.predict_all(model, all_dfs, STANDIN_FEATURES, use_cache=False)
+        sim_market = bt.build_market(all_dfs, timestamps)
+        sim_probs = np.stack([all_probs[s] for s in sim_market['symbols']])
+
+        generator = MLSignalGenerator(tmp / "models")
+
+        # Живой бот: окно из истории, нужной признакам модели (как буфер SignalBotService), затем по одной новой свече
+        window = min(generator.required_history()[TIMEFRAME] + 1, KLINE_BUFFER_SIZE, bars - SIGNAL_STEPS)
+        live = {s: (df.iloc[-SIGNAL_STEPS - window:].reset_index(drop=True), htf) for s, (df, htf) in market.items()}
+
+        def generate_signal_cold():
+            generator.streams.clear()  # признаки считаются по всему окну
+            for s, (df, htf) in live.items():
+                generator.generate_signal(s, df.iloc[:window], htf)
+
+        generator.generate_signals({s: (df.iloc[:window], htf) for s, (df, htf) in live.items()})
+        seeded = copy.deepcopy(generator.streams)
+
+        def generate_signals_step():
+            generator.streams = copy.deepcopy(seeded)  # состояние после окна, дальше по одной свече
+            for k in range(1, SIGNAL_STEPS + 1):
+                generator.generate_signals({s: (df.iloc[k:window + k], htf) for s, (df, htf) in live.items()})
+
+        total_rows = sum(len(df) for df, _ in market.values())
+        stages = [
+            ('load_from_db', total_rows, lambda: [  # HTF - как в ETL (по умолчанию ресемплинг TIMEFRAME)
+                etl.load_htf(conn, s, base=etl.load_from_db(conn, s, TIMEFRAME)) for s in names
+            ]),
+            ('add_features', total_rows, lambda: [etl.add_features(df) for df, _ in market.values()]),
+            ('add_htf_features', total_rows, lambda: [etl.add_htf_features(ltf[s], market[s][1]) for s in names]),
+            ('triple_barrier_labeling', total_rows, lambda: [
+                etl.triple_barrier_labeling(merged[s].copy(), LABEL_SETS) for s in names
+            ]),
+            ('save_processed', total_rows, lambda: [etl.save_processed(labeled[s], s, store) for s in names]),
+            ('load_all_data', total_rows, lambda: bt.load_all_data(names, STANDIN_FEATURES, store)),
+            ('predict_all', total_rows, lambda: bt.predict_all(model, all_dfs, STANDIN_FEATURES, use_cache=False)),
+            ('simulate', sim_probs.shape[0] * sim_probs.shape[1], lambda: bt.simulate(sim_market, sim_probs, verbose=False)),
+            ('generate_signal_cold', symbols, generate_signal_cold),
+            ('generate_signals_step', symbols * SIGNAL_STEPS, generate_signals_step),
+        ]
+
+        rows = []
+        for stage, n, fn in stages:
+            with contextlib.redirect_stdout(io.StringIO()):  # print() стадий бектеста
+                seconds = timeit(fn, min_time=min_time, max_repeat=20)
+                peak = peak_memory(fn)
+            rows.append({
+                'stage': stage,
+                'rows': n,
+                'seconds': seconds,
+                'us_per_row': seconds / n * 1e6,
+                'peak_mb': peak,
+            })
+        conn.close()
+    return pd.DataFrame(rows)
+
+
+def bench_tree_eval(model_path=MODELS_DIR / "catboost_model.cbm", sizes=TREE_BATCH_SIZES, seed=0):
+    """
+    Задержка на строку: CatBoostClassifier.predict_proba против ObliviousTreeModel.
+    Без обученной модели в MODELS_DIR - на модели-заглушке.
+    """
+    if Path(model_path).exists():
+        model = CatBoostClassifier()
+        model.load_model(str(model_path))
+    else:
+        df, htf_df = next(iter(synthetic_market(1, 5_000, seed=seed).values()))
+        features = etl.build_features(df, htf_df, LABEL_SETS)
+        with tempfile.TemporaryDirectory() as tmp:
+            model = train_standin(features, tmp, seed)
+    evaluator = ObliviousTreeModel.from_catboost(model)
+
+    rng = np.random.default_rng(seed)
+    rows = []
+    for n in sizes:
+        X = pd.DataFrame(rng.normal(size=(n, len(evaluator.feature_names))), columns=evaluator.feature_names)
+        native = timeit(lambda: model.predict_proba(X))
+        numpy_ = timeit(lambda: evaluator.predict_proba(X))
+        diff = float(np.max(np.abs(model.predict_proba(X) - evaluator.predict_proba(X))))
+        rows.append({
+            'batch': n,
+            'native_us_per_row': native / n * 1e6,
+            'numpy_us_per_row': numpy_ / n * 1e6,
+            'speedup': native / numpy_,
+            'max_abs_diff': diff,
+        })
+    return pd.DataFrame(rows)
+
+
+def merge_htf_asof(df, htf):
+    """Прежнее присоединение HTF: dropna, сортировки и pd.merge_asof (эталон для htf_align)"""
+    htf = htf[['timestamp'] + HTF_COLUMNS].dropna()
+    df = df.sort_values('timestamp')
+    htf = htf.sort_values('timestamp')
+    df = pd.merge_asof(df, htf, on='timestamp', direction='backward')
+    df.dropna(inplace=True)
+    return df
+
+
+def bench_htf_align(sizes=HTF_ALIGN_SIZES, seed=0):
+    """Присоединение HTF признаков к LTF: merge_asof против etl_pipeline.join_htf (searchsorted + take)"""
+    df = synthetic_ohlcv(max(sizes), seed=seed)
+    ltf = etl.add_features(df)
+    htf = etl.htf_indicators(resample_frame(df, HTF_TIMEFRAME))
+    rows = []
+    for n in sizes:
+        window = ltf.iloc[:n]
+        baseline = timeit(lambda: merge_htf_asof(window, htf))
+        fast = timeit(lambda: etl.join_htf(window, htf))
+        try:
+            pd.testing.assert_frame_equal(etl.join_htf(window, htf), merge_htf_asof(window, htf))
+            equal = True
+        except AssertionError:
+            equal = False
+
+        rows.append({
+            'rows': n,
+            'merge_asof_us': baseline * 1e6,
+            'numpy_us': fast * 1e6,
+            'speedup': baseline / fast,
+            'equal': equal,
+        })
+    return pd.DataFrame(rows)
+
+
+def bench_indicators(panels=INDICATOR_PANELS, seed=0):
+    """
+    Индикаторы add_features (RSI, MACD, ATR, EMA, скользящие среднее/max/min):
+    pandas_ta по каждому символу против ядер indicators.py на панели всех символов.
+    """
+    rows = []
+    for symbols, bars in panels:
+        frames = [synthetic_ohlcv(bars, seed=seed + i) for i in range(symbols)]
+        baseline = timeit(lambda: [indicators.pandas_ta_reference(df) for df in frames], max_repeat=20)
+        fast = timeit(lambda: indicators.panel_indicators(frames), max_repeat=20)
+        rows.append({
+            'symbols': symbols,
+            'bars': bars,
+            'pandas_ta_us': baseline * 1e6,
+            'numpy_us': fast * 1e6,
+            'speedup': baseline / fast,
+            'max_abs_diff': float(indicators.check_pandas_ta(frames).max()),
+        })
+    return pd.DataFrame(rows)
+
+
+BENCHMARKS = {
+    'pipeline': lambda args: bench_pipeline(args.symbols, args.bars, args.timeframe, args.seed),
+    'tree_eval': lambda args: bench_tree_eval(seed=args.seed),
+    'htf_align': lambda args: bench_htf_align(seed=args.seed),
+    'indicators': lambda args: bench_indicators(seed=args.seed),
+}
+
+
+def find_regressions(results, baseline, tolerance):
+    """
+    Строки, где метрика из REGRESSION_METRICS выросла больше чем в (1 + tolerance) раз
+    относительно baseline. Строки сопоставляются по первой колонке (stage / batch).
+    """
+    found = []
+    for name, rows in results.items():
+        base_rows = baseline.get(name)
+        if not rows or not base_rows:
+            continue
+        key = next(iter(rows[0]))
+        base = {r[key]: r for r in base_rows}
+        for row in rows:
+            old = base.get(row[key])
+            if old is None:
+                continue
+            for metric in REGRESSION_METRICS:
+                if metric in row and old.get(metric) and row[metric] > old[metric] * (1 + tolerance):
+                    found.append(f"{name}/{row[key]}: {metric} {old[metric]:.4g} -> {row[metric]:.4g} "
+                                 f"(+{row[metric] / old[metric] - 1:.0%})")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарки горячих участков на синтетических данных")
+    parser.add_argument('names', nargs='*', default=list(BENCHMARKS), help=f"из {', '.join(BENCHMARKS)}")
+    parser.add_argument('--symbols', type=int, default=4, help="синтетических символов")
+    parser.add_argument('--bars', type=int, default=20_000, help="свечей на символ")
+    parser.add_argument('--timeframe', default=TIMEFRAME, help="базовый таймфрейм синтетики")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default='cache/benchmark_results.json', help="куда сохранить результаты (JSON)")
+    parser.add_argument('--compare', help="JSON прошлого запуска: отметить регрессии")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="допустимый рост метрики при --compare")
+    args = parser.parse_args()
+
+    # Стадии ETL и генератора пишут INFO на каждый символ
+    logging.getLogger().setLevel(logging.WARNING)
+
+    results = {}
+    for name in args.names:
+        print(f"\n=== {name} ===")
+        table = BENCHMARKS[name](args)
+        print(table.to_string(index=False, float_format=lambda v: f"{v:.4g}"))
+        results[name] = table.to_dict(orient='records')
+
+    meta = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'scale': {'symbols': args.symbols, 'bars': args.bars, 'timeframe': args.timeframe, 'seed': args.seed},
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'machine': platform.machine(),
+    }
+    Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+    with open(args.out, 'w') as f:
+        json.dump({'meta': meta, 'results': results}, f, indent=2, default=str)
+    print(f"\nРезультаты: {args.out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline['meta'].get('scale') != meta['scale']:
+            print(f"⚠️ Масштаб отличается от {args.compare}: {baseline['meta'].get('scale')}")
+        regressions = find_regressions(results, baseline['results'], args.tolerance)
+        for line in regressions:
+            print(f"❌ {line}")
+        if regressions:
+            sys.exit(1)
+        print(f"✅ Регрессий нет (порог +{args.tolerance:.0%})")
+
+
+if __name__ == '__main__':
+    main()
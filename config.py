@@ -8,16 +8,33 @@ SYMBOLS = [s.strip() for s in SYMBOLS_RAW.split(",") if s.strip()]
 
 TIMEFRAME = os.getenv("TIMEFRAME", "1h")
 HTF_TIMEFRAME = os.getenv("HTF_TIMEFRAME", "4h")
+HTF_SOURCE = os.getenv("HTF_SOURCE", "resample")  # resample (из свечей TIMEFRAME) | exchange (отдельная загрузка с Binance)
 
 # --- DATA LOADING ---
 START_DATE = "2022-01-01"
 END_DATE = None
 BINANCE_LIMIT = 1500
 BINANCE_SLEEP = 0.3
+BINANCE_WEIGHT_LIMIT = 2400  # вес запросов в минуту на IP (Futures)
+BACKFILL_WORKERS = int(os.getenv("BACKFILL_WORKERS", 8))  # 1 = последовательная загрузка
+FEATURE_BATCH_SYMBOLS = int(os.getenv("FEATURE_BATCH_SYMBOLS", 64))  # символов в одном проходе индикаторов
 
 # --- ML LABELING ---
 HORIZON = 12
 ATR_MULTIPLIER = 2.0
+# Наборы (HORIZON, ATR_MULTIPLIER) для меток, формат "12:2.0,24:3.0".
+# Базовый набор -> колонка Target (строится всегда), остальные -> Target_h{H}_m{M}
+LABEL_SETS_RAW = os.getenv("LABEL_SETS", f"{HORIZON}:{ATR_MULTIPLIER}")
+LABEL_SETS = [(int(h), float(m)) for h, m in (s.strip().split(":") for s in LABEL_SETS_RAW.split(",") if s.strip())]
+if (HORIZON, ATR_MULTIPLIER) not in LABEL_SETS:
+    LABEL_SETS.insert(0, (HORIZON, ATR_MULTIPLIER))  # Target читают train.py (--target) и backtest.py
+
+# --- ML TRAINING (walk-forward) ---
+WF_FOLDS = int(os.getenv("WF_FOLDS", 5))
+WF_MIN_TRAIN = float(os.getenv("WF_MIN_TRAIN", 0.5))  # доля общих свечей до первого тестового окна
+WF_VALID = float(os.getenv("WF_VALID", 0.15))  # доля train окна фолда под eval set (ранняя остановка), 0 - без нее
+TRAIN_THREADS = int(os.getenv("TRAIN_THREADS", os.cpu_count() or 1))  # потоков CatBoost на все фолды
+TRAIN_PARALLEL_FOLDS = int(os.getenv("TRAIN_PARALLEL_FOLDS", 2))  # фолдов обучается одновременно
 
 # --- TRADING / BOT ---
 CONFIDENCE_THRESHOLD = float(os.getenv("CONFIDENCE_THRESHOLD", 0.65))
@@ -25,6 +42,17 @@ TP_PCT = float(os.getenv("TP_PCT", 0.030))
 SL_PCT = float(os.getenv("SL_PCT", 0.015))
 RISK_PER_TRADE = float(os.getenv("RISK_PER_TRADE", 0.01))
 POLL_INTERVAL = int(os.getenv("POLL_INTERVAL", 10))
+KLINE_BUFFER_SIZE = int(os.getenv("KLINE_BUFFER_SIZE", 1500))  # предел свечей в памяти на (symbol, timeframe)
+FEATURE_WARMUP_TOL = float(os.getenv("FEATURE_WARMUP_TOL", 1e-6))  # вес отброшенной истории в EMA/RMA признаках бота
+KLINE_DELTA_LIMIT = int(os.getenv("KLINE_DELTA_LIMIT", 5))  # свечей в запросе обновления
+KLINE_SOURCE = os.getenv("KLINE_SOURCE", "stream")  # stream (websocket) | poll (REST по таймеру)
+STREAM_FALLBACK_GRACE = float(os.getenv("STREAM_FALLBACK_GRACE", 5))  # сек. ожидания события до REST
+CYCLE_WORKERS = int(os.getenv("CYCLE_WORKERS", 8))  # символов обрабатывается одновременно
+CYCLE_DEADLINE = float(os.getenv("CYCLE_DEADLINE", 30))  # сек. от начала цикла до отчета об опоздавших
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", 1))  # >1: символы делятся между процессами-воркерами
+WORKER_HEARTBEAT = float(os.getenv("WORKER_HEARTBEAT", 10))  # сек. между отчетами воркера супервизору
+WORKER_STALE_AFTER = float(os.getenv("WORKER_STALE_AFTER", 120))  # сек. без продвижения цикла сервиса -> воркер перезапускается
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"  # таймеры и счетчики для /metrics
 
 # Интервалы в миллисекундах
 TF_MS = {
@@ -45,9 +73,23 @@ TF_MS = {
 # --- TELEGRAM ---
 TG_TOKEN = os.getenv("TG_TOKEN", "YOUR_TELEGRAM_BOT_TOKEN")
 TG_CHAT_ID = os.getenv("TG_CHAT_ID", "YOUR_TELEGRAM_CHAT_ID")
+TG_API_URL = os.getenv("TG_API_URL", "https://api.telegram.org")  # локальная заглушка: telegram_stub.py
+NOTIFY_QUEUE_SIZE = int(os.getenv("NOTIFY_QUEUE_SIZE", 1000))  # сообщений в очереди, сверх - отбрасываются
+NOTIFY_RATE = float(os.getenv("NOTIFY_RATE", 1.0))  # сообщений в секунду (лимит Telegram на чат)
+NOTIFY_BURST = int(os.getenv("NOTIFY_BURST", 3))  # сообщений подряд без паузы
+NOTIFY_DIGEST_MIN = int(os.getenv("NOTIFY_DIGEST_MIN", 2))  # сигналов в очереди -> одно сводное сообщение
+NOTIFY_LINGER = float(os.getenv("NOTIFY_LINGER", 0.2))  # сек. ожидания остальных сигналов цикла
+NOTIFY_RETRIES = int(os.getenv("NOTIFY_RETRIES", 3))  # повторов доставки при ошибке
 
 # --- PATHS ---
 MODELS_DIR = Path("models")
 MODELS_DIR.mkdir(exist_ok=True)
+PROBA_CACHE_DIR = Path(os.getenv("PROBA_CACHE_DIR", "cache/probas"))
+FEATURE_STORE_DIR = Path(os.getenv("FEATURE_STORE_DIR", "feature_store"))
+FEATURE_CACHE_DIR = Path(os.getenv("FEATURE_CACHE_DIR", "cache/features"))
+FEATURE_CACHE_MAX_MB = int(os.getenv("FEATURE_CACHE_MAX_MB", 2048))  # больше - удаляются давно не читавшиеся
+POOL_CACHE_DIR = Path(os.getenv("POOL_CACHE_DIR", "cache/pools"))
+WALK_FORWARD_DIR = MODELS_DIR / "walk_forward"
 
-BASE_URL = "https://fapi.binance.com/fapi/v1/klines"
\ No newline at end of file
+BASE_URL = "https://fapi.binance.com/fapi/v1/klines"
+WS_URL = "wss://fstream.binance.com/ws"
\ No newline at end of file
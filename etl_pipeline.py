@@ -1,12 +1,18 @@
 import requests
 import pandas as pd
-import pandas_ta as ta
 import numpy as np
+import sys
 import sqlite3
 import logging
 import time
 from datetime import datetime
 from config import *
+from src.infrastructure.backfill import KlineBackfill
+from src.infrastructure.feature_store import FeatureStore
+from src.infrastructure.feature_cache import FeatureCache
+from src.application.resampler import resample_frame, bucket_start
+from src.infrastructure.feature_engine import LTF_COLUMNS, HTF_COLUMNS, asof_rows
+from src.infrastructure import indicators, feature_graph
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -24,9 +30,9 @@ TF_MS = {
 }
 
 
-def init_db():
+def init_db(path=DB_PATH):
     """Создание таблицы если не существует"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(path)
     conn.execute("""
         CREATE TABLE IF NOT EXISTS candles (
             symbol TEXT,
@@ -45,16 +51,9 @@ def init_db():
     return conn
 
 
-def fetch_data(conn, symbol, timeframe):
-    """
-    Загрузка данных с Binance API начиная с START_DATE или последней точки в БД.
-    Поддерживает инкрементальную загрузку.
-    """
-    # Конвертируем символ для API (BTC/USDT -> BTCUSDT)
-    api_symbol = symbol.replace("/", "")
-    
-    cur = conn.cursor()
-    cur.execute("SELECT MAX(open_time) FROM candles WHERE symbol=? AND timeframe=?", (symbol, timeframe))
+def load_range(conn, symbol, timeframe):
+    """Диапазон дозагрузки: с последней точки в БД (или START_DATE) до END_DATE (или None)"""
+    cur = conn.execute("SELECT MAX(open_time) FROM candles WHERE symbol=? AND timeframe=?", (symbol, timeframe))
     last_ts = cur.fetchone()[0]
     
     # Старт с последней точки в БД или с START_DATE
@@ -65,6 +64,34 @@ def fetch_data(conn, symbol, timeframe):
     
     # Конец: END_DATE или текущее время
     end_ts = int(datetime.fromisoformat(END_DATE).timestamp() * 1000) if END_DATE else None
+    return start_ts, end_ts
+
+
+def fetch_data_parallel(conn, symbols, timeframes, backfill=None):
+    """
+    Параллельная дозагрузка всех пар (symbol, timeframe) общим пулом потоков
+    с учетом веса запросов Binance. Возвращает {(symbol, timeframe): новых свечей}.
+    """
+    backfill = backfill or KlineBackfill()
+    now_ms = int(time.time() * 1000)
+    jobs = []
+    for symbol in symbols:
+        for timeframe in timeframes:
+            start_ts, end_ts = load_range(conn, symbol, timeframe)
+            jobs.append((symbol, timeframe, start_ts, end_ts or now_ms))
+    return backfill.run(conn, jobs)
+
+
+def fetch_data(conn, symbol, timeframe):
+    """
+    Загрузка данных с Binance API начиная с START_DATE или последней точки в БД.
+    Поддерживает инкрементальную загрузку.
+    """
+    # Конвертируем символ для API (BTC/USDT -> BTCUSDT)
+    api_symbol = symbol.replace("/", "")
+    
+    cur = conn.cursor()
+    start_ts, end_ts = load_range(conn, symbol, timeframe)
     
     # Проверяем, не вышли ли мы за пределы END_DATE
     if end_ts and start_ts >= end_ts:
@@ -123,66 +150,64 @@ def fetch_data(conn, symbol, timeframe):
     return total_loaded
 
 
-def load_from_db(conn, symbol, timeframe):
-    """Загрузка данных из БД в DataFrame"""
+def load_from_db(conn, symbol, timeframe, since=None):
+    """Загрузка данных из БД в DataFrame (since - open_time в мс, с которого читать)"""
     df = pd.read_sql_query(
-        "SELECT open_time as timestamp, open, high, low, close, volume FROM candles WHERE symbol=? AND timeframe=? ORDER BY open_time",
+        "SELECT open_time as timestamp, open, high, low, close, volume FROM candles "
+        "WHERE symbol=? AND timeframe=? AND open_time >= ? ORDER BY open_time",
         conn,
-        params=(symbol, timeframe)
+        params=(symbol, timeframe, since or 0)
     )
     df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
     return df
 
 
+def load_htf(conn, symbol, since=None, base=None):
+    """
+    Свечи HTF_TIMEFRAME: при HTF_SOURCE=resample - ресемплинг свечей TIMEFRAME из БД
+    (base - уже загруженные с начала истории, чтобы не читать их второй раз),
+    иначе - отдельная таблица, скачанная с Binance.
+    """
+    if HTF_SOURCE == "exchange":
+        return load_from_db(conn, symbol, HTF_TIMEFRAME, since=since)
+    if base is None or since is not None:
+        # С начала HTF свечи, чтобы первая собралась целиком
+        base = load_from_db(conn, symbol, TIMEFRAME, since=None if since is None else bucket_start(since, HTF_TIMEFRAME))
+    return resample_frame(base, HTF_TIMEFRAME)
+
+
 def add_features(df):
     """Генерация признаков БЕЗ подсматривания в будущее"""
-    df = df.copy()
-    
-    # 1. Трендовые и Осцилляторы (ТЕКУЩИЕ, без shift)
-    df['RSI'] = df.ta.rsi(length=14)
-    macd = df.ta.macd()
-    df['MACD_line'] = macd['MACD_12_26_9']
-    df['MACD_signal'] = macd['MACDs_12_26_9']
-    df['MACD_hist'] = macd['MACDh_12_26_9']
-    df['ATR'] = df.ta.atr(length=14)
-    
-    # 2. Логарифмическая доходность (Текущая Close к Прошлой Close)
-    df['Log_Ret'] = np.log(df['close'] / df['close'].shift(1))
-    
-    # 3. Относительный объем (ИСПРАВЛЕНО: Вариант A из критики)
-    # Используем скользящее среднее текущего момента (включая текущий бар, это допустимо и убирает лаг)
-    df['volume_ma_20'] = df['volume'].rolling(20, min_periods=1).mean()
-    df['Vol_Rel'] = df['volume'] / df['volume_ma_20']
-    
-    # 4. Лаги (для истории)
-    for col in ['RSI', 'Log_Ret', 'Vol_Rel']:
-        for i in range(1, 4):
-            df[f'{col}_lag_{i}'] = df[col].shift(i)
-    
-    # 5. Время
-    df['hour_sin'] = np.sin(2 * np.pi * df['timestamp'].dt.hour / 24)
-    df['day_of_week'] = df['timestamp'].dt.dayofweek
-    
-    # 6. EMA (ИСПРАВЛЕНО: Вариант A из критики - EMA текущая, сравнение текущее)
-    df['EMA_200'] = df['close'].ewm(span=200, adjust=False).mean()
-    df['Trend'] = (df['close'] > df['EMA_200']).astype(int)
-    
-    # 7. Поддержка / Сопротивление 
-    SR_LOOKBACK = 50
-    # Уровни строим по ПРОШЛЫМ данным (shift(1) ОБЯЗАТЕЛЕН для уровней)
-    df['Resistance'] = df['high'].rolling(SR_LOOKBACK, min_periods=1).max().shift(1)
-    df['Support'] = df['low'].rolling(SR_LOOKBACK, min_periods=1).min().shift(1)
-    
-    # ИСПРАВЛЕНО: Дистанцию считаем от ТЕКУЩЕЙ цены до уровней
-    df['Dist_to_Resistance'] = (df['Resistance'] - df['close']) / df['ATR']
-    df['Dist_to_Support'] = (df['close'] - df['Support']) / df['ATR']
-    
-    # Позиция цены: считаем по текущей цене
-    sr_range = df['Resistance'] - df['Support']
-    df['SR_Position'] = ((df['close'] - df['Support']) / sr_range).clip(0, 1)
-    
-    df.dropna(inplace=True)
-    return df
+    return add_features_many([df])[0]
+
+
+def add_features_many(dfs, columns=LTF_COLUMNS):
+    """
+    add_features для нескольких символов сразу. Признаки описаны в реестре
+    src/infrastructure/feature_graph.py; считается только подграф columns (по
+    умолчанию все LTF_COLUMNS), каждый узел - одним вызовом ядра indicators.py на
+    панель всех символов. dropna() - по колонкам свечей и columns.
+    """
+    if not dfs:
+        return []
+    values = feature_graph.evaluate(columns, dfs)
+    width = max(len(df) for df in dfs)
+    out = []
+    for i, df in enumerate(dfs):
+        tail = slice(width - len(df), width)
+        cols = {c: df[c].to_numpy() for c in df.columns}
+        for name in columns:
+            cols[name] = values[name][i, tail]
+            if feature_graph.FEATURES[name].dtype:
+                cols[name] = cols[name].astype(feature_graph.FEATURES[name].dtype)
+        out.append(dropna_frame(cols, df.index))
+    return out
+
+
+def dropna_frame(cols, index):
+    """DataFrame из колонок-массивов без строк с NaN (как dropna(), без промежуточного кадра)"""
+    keep = np.flatnonzero(~np.logical_or.reduce([pd.isna(a) for a in cols.values()]))
+    return pd.DataFrame({c: a.take(keep) for c, a in cols.items()}, index=index.take(keep), copy=False)
 
 
 def add_htf_features(df, htf_df):
@@ -191,111 +216,297 @@ def add_htf_features(df, htf_df):
     ВАЖНО: Оставляем shift(1) для HTF, так как timestamps - это Open Time.
     Без shift(1) мы бы заглянули в 'будущее' (в конец 4h свечи) при merge_asof.
     """
-    htf = htf_df.copy()
-    
-    # Считаем индикаторы на 4h (shift(1) чтобы использовать только ЗАВЕРШЕННЫЕ свечи)
-    htf['HTF_RSI'] = htf.ta.rsi(length=14).shift(1)
-    htf['HTF_ATR'] = htf.ta.atr(length=14).shift(1)
-    htf_macd = htf.ta.macd()
-    htf['HTF_MACD_hist'] = htf_macd['MACDh_12_26_9'].shift(1)
-    htf['HTF_EMA_50'] = htf['close'].ewm(span=50, adjust=False).mean().shift(1)
-    htf['HTF_Trend'] = (htf['close'].shift(1) > htf['HTF_EMA_50']).astype(int)
-    htf['HTF_Log_Ret'] = np.log(htf['close'] / htf['close'].shift(1))
-    
-    # Оставляем только нужные колонки для merge
-    htf_cols = ['timestamp', 'HTF_RSI', 'HTF_ATR', 'HTF_MACD_hist',
-                'HTF_EMA_50', 'HTF_Trend', 'HTF_Log_Ret']
-    htf = htf[htf_cols].dropna()
-    
-    # merge_asof: для каждого 1h timestamp берем последнюю 4h запись <= этого времени
-    # Т.к. мы сделали shift(1) выше, запись 12:00 содержит данные свечи 08:00-12:00.
+    # Как merge_asof: для каждого 1h timestamp берем последнюю 4h запись <= этого времени
+    # Т.к. мы сделали shift(1) в htf_indicators, запись 12:00 содержит данные свечи 08:00-12:00.
     # Это корректно и безопасно.
-    df = df.sort_values('timestamp')
-    htf = htf.sort_values('timestamp')
-    df = pd.merge_asof(df, htf, on='timestamp', direction='backward')
-    
-    df.dropna(inplace=True)
-    return df
+    return join_htf(df, htf_indicators(htf_df))
+
+
+def htf_indicators(htf_df):
+    """Индикаторы HTF_COLUMNS на свечах старшего таймфрейма"""
+    return htf_indicators_many([htf_df])[0]
+
+
+def htf_indicators_many(htf_dfs, columns=HTF_COLUMNS):
+    """htf_indicators для нескольких символов: подграф columns одним проходом по панели"""
+    if not htf_dfs:
+        return []
+    values = feature_graph.evaluate(columns, htf_dfs)
+    width = max(len(htf_df) for htf_df in htf_dfs)
+    out = []
+    for i, htf_df in enumerate(htf_dfs):
+        htf = htf_df.copy()
+        for name in columns:
+            htf[name] = values[name][i, width - len(htf_df):]
+        out.append(htf)
+    return out
 
 
-def triple_barrier_labeling(df):
-    """Разметка данных (Teacher)"""
-    labels = []
+def join_htf(df, htf, columns=HTF_COLUMNS):
+    """
+    Колонки columns (HTF_COLUMNS) из htf к строкам df - как merge_asof(direction='backward') по
+    строкам htf без NaN и затем dropna(), но без промежуточных DataFrame: номера строк
+    HTF считаются searchsorted (asof_rows), маска NaN - по массивам, и каждая колонка
+    результата собирается одним take.
+    """
+    if not df['timestamp'].is_monotonic_increasing:
+        df = df.sort_values('timestamp')
+    if not htf['timestamp'].is_monotonic_increasing:
+        htf = htf.sort_values('timestamp')
+
+    htf_cols = {c: htf[c].to_numpy() for c in columns}
+    valid = np.flatnonzero(~np.logical_or.reduce([pd.isna(a) for a in htf_cols.values()]))
+    rows = asof_rows(df['timestamp'].to_numpy(), htf['timestamp'].to_numpy()[valid])
+    missing = rows < 0  # нет HTF строки не позже свечи -> NaN, строка уйдет в dropna
+
+    cols = {c: df[c].to_numpy() for c in df.columns}
+    keep = ~np.logical_or.reduce([missing] + [pd.isna(a) for a in cols.values()])
+    keep = np.flatnonzero(keep)
+    pos = valid[rows[keep]]
+
+    out = {c: a.take(keep) for c, a in cols.items()}
+    for c, a in htf_cols.items():
+        a = a.take(pos)
+        if missing.any():
+            a = a.astype(np.float64)  # int колонка с пропусками у merge_asof становится float
+        out[c] = a
+    return pd.DataFrame(out, index=keep, copy=False)
+
+
+def label_column(horizon, multiplier):
+    """Имя колонки метки: базовый набор (HORIZON, ATR_MULTIPLIER) -> 'Target'"""
+    if (horizon, multiplier) == (HORIZON, ATR_MULTIPLIER):
+        return 'Target'
+    return f"Target_h{horizon}_m{multiplier:g}"
+
+
+def triple_barrier_labeling(df, label_sets=None, chunk_size=200_000):
+    """
+    Разметка данных (Teacher), векторно.
+    label_sets: список (HORIZON, ATR_MULTIPLIER); все колонки меток строятся за
+    один проход по окнам будущих high/low (sliding_window_view, без копий).
+    Метка: 1 - первым задет верхний барьер, -1 - нижний, 0 - ни один за горизонт.
+    На одной свече верхний барьер проверяется первым. Последние HORIZON строк = 0.
+    """
+    label_sets = label_sets or [(HORIZON, ATR_MULTIPLIER)]
     
-    closes = df['close'].values
-    highs = df['high'].values
-    lows = df['low'].values
-    atrs = df['ATR'].values
+    closes = df['close'].to_numpy(dtype=np.float64)
+    highs = df['high'].to_numpy(dtype=np.float64)
+    lows = df['low'].to_numpy(dtype=np.float64)
+    atrs = df['ATR'].to_numpy(dtype=np.float64)
+    n = len(df)
+    max_h = max(h for h, _ in label_sets)
+    labels = {cfg: np.zeros(n, dtype=np.int64) for cfg in label_sets}
     
-    # Проходим по истории
-    for i in range(len(df) - HORIZON):
-        current_price = closes[i]
-        current_atr = atrs[i]
-        
-        upper_barrier = current_price + (current_atr * ATR_MULTIPLIER)
-        lower_barrier = current_price - (current_atr * ATR_MULTIPLIER)
-        
-        label = 0
+    # Окно строки i: бары i+1 .. i+max_h (хвост добит NaN, сравнение с NaN = False)
+    pad = np.full(max_h, np.nan)
+    future_highs = np.lib.stride_tricks.sliding_window_view(np.concatenate([highs[1:], pad]), max_h)
+    future_lows = np.lib.stride_tricks.sliding_window_view(np.concatenate([lows[1:], pad]), max_h)
+    
+    # Блоками, чтобы булевы матрицы (rows x horizon) не раздували память на 1m данных
+    for start in range(0, n, chunk_size):
+        stop = min(start + chunk_size, n)
+        price = closes[start:stop]
+        atr = atrs[start:stop]
+        rows = np.arange(stop - start)
         
-        # Смотрим в будущее на HORIZON шагов
-        for j in range(1, HORIZON + 1):
-            if i + j >= len(df): break
+        for horizon, multiplier in label_sets:
+            upper_barrier = price + (atr * multiplier)
+            lower_barrier = price - (atr * multiplier)
             
-            future_high = highs[i + j]
-            future_low = lows[i + j]
+            hit_up = future_highs[start:stop, :horizon] >= upper_barrier[:, None]
+            hit_down = future_lows[start:stop, :horizon] <= lower_barrier[:, None]
+            # argmax по bool = индекс первого касания (0, если касаний нет - проверяем)
+            first_up = hit_up.argmax(axis=1)
+            first_up[~hit_up[rows, first_up]] = horizon
+            first_down = hit_down.argmax(axis=1)
+            first_down[~hit_down[rows, first_down]] = horizon
             
-            if future_high >= upper_barrier:
-                label = 1
-                break
-            if future_low <= lower_barrier:
-                label = -1
-                break
-                
-        labels.append(label)
+            chunk = labels[(horizon, multiplier)][start:stop]
+            chunk[(first_up < horizon) & (first_up <= first_down)] = 1
+            chunk[(first_down < horizon) & (first_down < first_up)] = -1
     
-    labels.extend([0] * HORIZON)
-    df['Target'] = labels
+    for (horizon, multiplier), values in labels.items():
+        values[max(n - horizon, 0):] = 0
+        df[label_column(horizon, multiplier)] = values
     return df
 
 
-def save_processed(df, symbol):
-    """Сохранение обработанных данных в отдельную таблицу"""
-    conn = sqlite3.connect(DB_PATH)
-    table_name = symbol.replace('/', '_') + "_features"
-    df.to_sql(table_name, conn, if_exists='replace', index=False)
-    conn.close()
+# Разогрев перед пересчитываемым хвостом: история, после которой признаки (и самая
+# медленная EMA_200 / HTF_EMA_50) совпадают с полной пересборкой до машинной точности
+FEATURE_WARMUP = feature_graph.required_history(LTF_COLUMNS, np.finfo(np.float64).eps)[feature_graph.LTF]
+HTF_FEATURE_WARMUP = feature_graph.required_history(HTF_COLUMNS, np.finfo(np.float64).eps)[feature_graph.HTF]
+
+
+def compute_features(df, htf_df):
+    return add_htf_features(add_features(df), htf_df)
+
+
+def compute_features_many(dfs, htf_dfs, columns=None):
+    """
+    compute_features для нескольких символов: индикаторы одним проходом по панели.
+    columns (например, feature_names модели) - только нужный им подграф признаков.
+    """
+    ltf_columns, htf_columns = feature_graph.split(columns) if columns is not None else (LTF_COLUMNS, HTF_COLUMNS)
+    ltf = add_features_many(dfs, ltf_columns)
+    htf = htf_indicators_many(htf_dfs, htf_columns)
+    return [join_htf(df, h, htf_columns) for df, h in zip(ltf, htf)]
+
+
+def build_features(df, htf_df, label_sets=None, cache=None, symbol=""):
+    """
+    Признаки и метки. С cache (FeatureCache) признаки берутся с диска, если свечи
+    и код add_features/add_htf_features не менялись; метки считаются всегда.
+    """
+    if cache is None:
+        df = compute_features(df, htf_df)
+    else:
+        df = cache.memoize(compute_features, df, htf_df, symbol=symbol, timeframe=TIMEFRAME,
+                           depends=(add_features, add_features_many, dropna_frame, add_htf_features, htf_indicators,
+                                    htf_indicators_many, join_htf, asof_rows, indicators, feature_graph))
+    return triple_barrier_labeling(df, label_sets)
+
+
+def stored_columns(label_sets=None):
+    """Колонки build_features в хранилище: свечи, признаки, метки"""
+    label_sets = label_sets or [(HORIZON, ATR_MULTIPLIER)]
+    return list(feature_graph.RAW_COLUMNS) + LTF_COLUMNS + HTF_COLUMNS + [label_column(h, m) for h, m in label_sets]
+
+
+def dirty_since(timestamps, label_sets=None):
+    """
+    Первый open_time, строки с которого пересчитываются при инкрементальном запуске:
+    метки последних max_h + 1 строк видели неполное будущее, а строки с открытия
+    последней HTF свечи (с запасом в одну) привязаны к еще меняющейся HTF записи.
+    """
+    label_sets = label_sets or [(HORIZON, ATR_MULTIPLIER)]
+    max_h = max(h for h, _ in label_sets)
+    last_ms = int(timestamps[-1].astype('datetime64[ms]').astype(np.int64))
+    htf_ms = TF_MS[HTF_TIMEFRAME]
+    label_ms = int(timestamps[max(len(timestamps) - max_h - 1, 0)].astype('datetime64[ms]').astype(np.int64))
+    return min(label_ms, (last_ms // htf_ms) * htf_ms - htf_ms)
+
+
+def process_symbol(conn, symbol, store, full=False, cache=None):
+    """
+    Пересчет признаков и меток. Если хранилище уже есть - только хвост с
+    dirty_since() плюс разогрев индикаторов, результат заменяет хвост в хранилище.
+    Полная пересборка берет признаки из cache, если история не менялась.
+    Возвращает число записанных строк.
+    """
+    return process_symbols(conn, [symbol], store, full=full, cache=cache)[symbol]
+
+
+def process_symbols(conn, symbols, store, full=False, cache=None):
+    """
+    process_symbol для группы символов. Хвосты инкрементального запуска (около
+    FEATURE_WARMUP свечей на символ) считаются одним проходом compute_features_many:
+    индикаторы всех символов - один вызов ядер indicators.py над панелью
+    (symbols x time), а не вызов на символ. Полная пересборка - по символу
+    (длинная история, есть cache).
+    Возвращает {symbol: число записанных строк}.
+    """
+    written, tails = {}, []
+    columns = stored_columns(LABEL_SETS)
+    for symbol in symbols:
+        stale = full or not store.exists(symbol, TIMEFRAME)
+        if not stale and store.columns(symbol, TIMEFRAME) != columns:
+            # Другие признаки или LABEL_SETS: хвост не стыкуется с историей - пересборка
+            logger.info(f"{symbol}: stored columns differ from the current features/labels, full rebuild")
+            stale = True
+        timestamps = None if stale else store.read_arrays(symbol, TIMEFRAME, ['timestamp'])['timestamp']
+        if timestamps is None or len(timestamps) == 0:
+            written[symbol] = rebuild_symbol(conn, symbol, store, cache=cache)
+            continue
+        since = dirty_since(timestamps, LABEL_SETS)
+        del timestamps
+        df = load_from_db(conn, symbol, TIMEFRAME, since=since - FEATURE_WARMUP * TF_MS[TIMEFRAME])
+        htf_df = load_htf(conn, symbol, since=since - HTF_FEATURE_WARMUP * TF_MS[HTF_TIMEFRAME])
+        tails.append((symbol, since, df, htf_df))
+    if not tails:
+        return written
+
+    features = compute_features_many([t[2] for t in tails], [t[3] for t in tails])
+    for (symbol, since, _, _), df in zip(tails, features):
+        df = triple_barrier_labeling(df, LABEL_SETS)
+        df = df[df['timestamp'] >= pd.Timestamp(since, unit='ms')].reset_index(drop=True)
+        store.upsert(symbol, TIMEFRAME, df)
+        logger.info(f"💾 {symbol} features обновлены с {pd.Timestamp(since, unit='ms')} ({len(df)} строк)")
+        written[symbol] = len(df)
+    return written
+
+
+def rebuild_symbol(conn, symbol, store, cache=None):
+    """Полная пересборка признаков и меток символа; число записанных строк"""
+    df = load_from_db(conn, symbol, TIMEFRAME)
+    htf_df = load_htf(conn, symbol, base=df)
+    if len(df) == 0 or len(htf_df) == 0:
+        return 0
+    df = build_features(df, htf_df, LABEL_SETS, cache=cache, symbol=symbol)
+    save_processed(df, symbol, store)
+    return len(df)
+
+
+def check_incremental(conn, symbol, store, rtol=1e-9, atol=1e-9, cache=None):
+    """Сверка хранилища с полной пересборкой признаков и меток"""
+    df = load_from_db(conn, symbol, TIMEFRAME)
+    htf_df = load_htf(conn, symbol, base=df)
+    expected = build_features(df, htf_df, LABEL_SETS, cache=cache, symbol=symbol).reset_index(drop=True)
+    stored = store.read(symbol, TIMEFRAME)
+    assert list(stored.columns) == list(expected.columns), f"{symbol}: columns differ"
+    assert len(stored) == len(expected), f"{symbol}: {len(stored)} rows stored, {len(expected)} expected"
+    for col in expected.columns:
+        a, b = stored[col].to_numpy(), expected[col].to_numpy()
+        if col == 'timestamp' or a.dtype.kind in 'iu':
+            assert np.array_equal(a.astype(b.dtype), b), f"{symbol}: {col} differs"
+        else:
+            assert np.allclose(a, b, rtol=rtol, atol=atol, equal_nan=True), \
+                f"{symbol}: {col} max diff {np.nanmax(np.abs(a - b))}"
+
+
+def save_processed(df, symbol, store=None):
+    """Сохранение обработанных данных в колоночное хранилище (каталог на symbol/timeframe)"""
+    store = store or FeatureStore()
+    store.write(symbol, TIMEFRAME, df.reset_index(drop=True))
     logger.info(f"💾 {symbol} features сохранены ({len(df)} строк)")
 
 
-def main():
+def main(full=False, verify=False, use_cache=True):
     conn = init_db()
+    store = FeatureStore()
+    cache = FeatureCache() if use_cache else None
     
-    for symbol in SYMBOLS:
-        # Загрузка основного таймфрейма
-        logger.info(f"Loading {symbol} {TIMEFRAME} from {START_DATE}...")
-        loaded = fetch_data(conn, symbol, TIMEFRAME)
-        logger.info(f"{symbol} {TIMEFRAME}: {loaded} new candles")
-        
-        # Загрузка старшего таймфрейма (4h)
-        logger.info(f"Loading {symbol} {HTF_TIMEFRAME} from {START_DATE}...")
-        htf_loaded = fetch_data(conn, symbol, HTF_TIMEFRAME)
-        logger.info(f"{symbol} {HTF_TIMEFRAME}: {htf_loaded} new candles")
-        
-        # Загружаем из БД и обрабатываем
-        df = load_from_db(conn, symbol, TIMEFRAME)
-        htf_df = load_from_db(conn, symbol, HTF_TIMEFRAME)
+    # HTF качается отдельно только при HTF_SOURCE=exchange, иначе собирается из TIMEFRAME
+    timeframes = [TIMEFRAME, HTF_TIMEFRAME] if HTF_SOURCE == "exchange" else [TIMEFRAME]
+    
+    if BACKFILL_WORKERS > 1:
+        # Все монеты и таймфреймы качаются одним пулом
+        loaded = fetch_data_parallel(conn, SYMBOLS, timeframes)
+        for (symbol, timeframe), count in loaded.items():
+            logger.info(f"{symbol} {timeframe}: {count} new candles")
+    
+    for start in range(0, len(SYMBOLS), FEATURE_BATCH_SYMBOLS):
+        group = SYMBOLS[start:start + FEATURE_BATCH_SYMBOLS]
+        if BACKFILL_WORKERS <= 1:
+            # Загрузка основного (и при HTF_SOURCE=exchange - старшего) таймфрейма
+            for symbol in group:
+                for timeframe in timeframes:
+                    logger.info(f"Loading {symbol} {timeframe} from {START_DATE}...")
+                    loaded = fetch_data(conn, symbol, timeframe)
+                    logger.info(f"{symbol} {timeframe}: {loaded} new candles")
         
-        if len(df) > 0 and len(htf_df) > 0:
-            df = add_features(df)
-            df = add_htf_features(df, htf_df)
-            df = triple_barrier_labeling(df)
-            save_processed(df, symbol)
-            logger.info(f"{symbol}: saved {len(df)} rows with HTF + S/R features")
-        else:
-            logger.warning(f"{symbol}: no data in DB")
+        # Признаки: инкрементально по хвосту (или полная пересборка при --full)
+        written = process_symbols(conn, group, store, full=full, cache=cache)
+        for symbol in group:
+            if written[symbol] == 0:
+                logger.warning(f"{symbol}: no data in DB")
+            elif verify:
+                check_incremental(conn, symbol, store, cache=cache)
+                logger.info(f"{symbol}: store matches full rebuild")
     
     conn.close()
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    args = sys.argv[1:]
+    main(full='--full' in args, verify='--verify' in args, use_cache='--no-cache' not in args)
@@ -1,14 +1,21 @@
 from dotenv import load_dotenv
 load_dotenv() # Load environment variables before other imports
 
+import sys
+import atexit
+import signal
 import logging
 import threading
-from flask import Flask
+from flask import Flask, Response, jsonify
 import os
 from src.infrastructure.exchange import BinanceExchange
-from src.infrastructure.notifier import TelegramNotifier
+from src.infrastructure.stream import BinanceStreamExchange
+from src.infrastructure.notifier import TelegramNotifier, NotificationDispatcher
 from src.infrastructure.generator import MLSignalGenerator
 from src.application.service import SignalBotService
+from src.application.supervisor import ShardSupervisor
+from src.infrastructure.metrics import REGISTRY
+from config import KLINE_SOURCE, SYMBOLS, BOT_WORKERS
 
 # Setup logging
 logging.basicConfig(
@@ -22,6 +29,7 @@ from datetime import datetime, timedelta
 # --- Render Health Check Server ---
 app = Flask(__name__)
 START_TIME = datetime.now()
+SUPERVISOR = None # ShardSupervisor при BOT_WORKERS > 1
 
 @app.route('/')
 def health_check():
@@ -35,20 +43,57 @@ def health_check():
         f"Uptime: {days}d {hours}h {minutes}m {seconds}s<br>"
         f"Started at: {START_TIME.strftime('%Y-%m-%d %H:%M:%S')}"
     )
-    return status, 200
+    if SUPERVISOR is None:
+        return status, 200
+    
+    health = SUPERVISOR.health()
+    status += (
+        f"<br>Workers: {health['alive']}/{health['workers']} alive, "
+        f"{health['symbols']} symbols, {health['restarts']} restarts"
+    )
+    # Ни одного живого воркера - сервис неработоспособен
+    return status, 200 if health['alive'] > 0 else 503
+
+@app.route('/status')
+def status():
+    if SUPERVISOR is None:
+        return jsonify({"workers": 1, "alive": 1, "symbols": len(SYMBOLS)}), 200
+    return jsonify(SUPERVISOR.health()), 200
+
+@app.route('/metrics')
+def metrics():
+    # При шардировании - сумма по воркерам (снимки из heartbeat) и супервизору (доставка в Telegram)
+    others = SUPERVISOR.metric_snapshots() if SUPERVISOR is not None else ()
+    return Response(REGISTRY.render(others), mimetype='text/plain; version=0.0.4')
 
 def run_web():
     port = int(os.environ.get("PORT", 8000))
     app.run(host='0.0.0.0', port=port)
 
 # --- Main Bot Execution ---
+def make_exchange():
+    # stream: события закрытия свечей по websocket (REST как резерв), poll: опрос по таймеру
+    return BinanceStreamExchange() if KLINE_SOURCE == "stream" else BinanceExchange()
+
 def main():
+    global SUPERVISOR
     # Dependency Injection
-    exchange = BinanceExchange()
-    notifier = TelegramNotifier()
+    # Отправка в Telegram - в фоновом потоке, цикл анализа ее не ждет
+    notifier = NotificationDispatcher(TelegramNotifier())
+    # При выходе (Ctrl+C, SIGTERM, падение) дослать очередь: поток отправки - daemon
+    atexit.register(notifier.close)
     generator = MLSignalGenerator()
     
-    bot_service = SignalBotService(exchange, notifier, generator)
+    if BOT_WORKERS > 1:
+        # Символы делятся между процессами; модель загружена выше и наследуется воркерами
+        SUPERVISOR = ShardSupervisor(SYMBOLS, notifier, generator, make_exchange, workers=BOT_WORKERS)
+        threading.Thread(target=run_web, daemon=True).start()
+        SUPERVISOR.run()
+        return
+    
+    bot_service = SignalBotService(make_exchange(), notifier, generator)
+    # SIGTERM (остановка на Render) -> обычный выход, чтобы сработал atexit
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
     
     # Start web server in background for Render
     threading.Thread(target=run_web, daemon=True).start()
@@ -0,0 +1,86 @@
+from typing import List, Optional, Union
+import numpy as np
+import pandas as pd
+from src.domain.contracts import KlineBatch, KlineDTO
+
+_FIELDS = KlineBatch.FIELDS
+
+
+class CandleBuffer:
+    """
+    Кольцевой буфер свечей фиксированной емкости для одной пары (symbol, timeframe).
+    Каждое значение пишется дважды (i и i + capacity), поэтому последние N свечей
+    в хронологическом порядке всегда лежат непрерывным срезом - без копирования.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.size = 0
+        self._next = 0  # позиция следующей записи (0..capacity-1)
+        self._ts = np.zeros(2 * capacity, dtype=np.int64)
+        self._cols = {f: np.zeros(2 * capacity, dtype=np.float64) for f in _FIELDS}
+
+    @property
+    def last_ts(self) -> Optional[int]:
+        if self.size == 0:
+            return None
+        return int(self._ts[(self._next - 1) % self.capacity])
+
+    def _write(self, slots: np.ndarray, batch: KlineBatch, rows: np.ndarray):
+        for p in (slots, slots + self.capacity):
+            self._ts[p] = batch.timestamp[rows]
+            for f in _FIELDS:
+                self._cols[f][p] = getattr(batch, f)[rows]
+
+    def upsert(self, klines: Union[KlineBatch, List[KlineDTO]]):
+        """
+        Добавляет свечи по возрастанию времени. Свеча с уже известным временем
+        (например, незакрытая в прошлом цикле) перезаписывается на месте,
+        неизвестная из прошлого (раньше последней, но не в буфере) пропускается.
+        """
+        if not isinstance(klines, KlineBatch):
+            if not klines:
+                return
+            klines = KlineBatch.from_klines(klines[0].symbol, klines)
+        ts = klines.timestamp
+        last = self.last_ts
+        split = 0 if last is None else int(np.searchsorted(ts, last, side='right'))
+
+        if split:
+            # Уже известные времена: слот среди последних size
+            back = np.searchsorted(self.timestamps, ts[:split])
+            found = back < self.size
+            found[found] = self.timestamps[back[found]] == ts[:split][found]
+            rows = np.flatnonzero(found)
+            self._write((self._next - self.size + back[rows]) % self.capacity, klines, rows)
+
+        rows = np.arange(max(split, len(ts) - self.capacity), len(ts))  # в буфер влезают последние capacity
+        if len(rows):
+            self._write((self._next + np.arange(len(rows))) % self.capacity, klines, rows)
+            self._next = (self._next + len(rows)) % self.capacity
+            self.size = min(self.size + len(rows), self.capacity)
+
+    def _view(self, arr: np.ndarray) -> np.ndarray:
+        start = self._next - self.size
+        if start < 0:
+            start += self.capacity
+        return arr[start:start + self.size]
+
+    @property
+    def timestamps(self) -> np.ndarray:
+        return self._view(self._ts)
+
+    def column(self, name: str) -> np.ndarray:
+        return self._view(self._cols[name])
+
+    def batch(self, symbol: str = "", start: int = 0) -> KlineBatch:
+        """Свечи буфера с позиции start (0 - самая старая) без копирования"""
+        return KlineBatch(symbol, self.timestamps[start:], *(self.column(f)[start:] for f in _FIELDS))
+
+    def to_df(self, until: Optional[int] = None) -> pd.DataFrame:
+        """DataFrame в формате etl_pipeline.load_from_db; until - последняя включаемая свеча (мс)"""
+        end = self.size if until is None else int(np.searchsorted(self.timestamps, until, side='right'))
+        data = {'timestamp': pd.to_datetime(self.timestamps[:end], unit='ms')}
+        for f in _FIELDS:
+            data[f] = self.column(f)[:end]
+        return pd.DataFrame(data)
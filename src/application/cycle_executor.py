@@ -0,0 +1,149 @@
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Callable, Dict, List, Optional
+from config import CYCLE_WORKERS, CYCLE_DEADLINE
+
+logger = logging.getLogger(__name__)
+
+# Задача по символу: получает словарь таймингов этапов и заполняет его
+SymbolJob = Callable[[Dict[str, float]], None]
+
+
+@contextmanager
+def stage(timings: Dict[str, float], name: str):
+    """Замер длительности этапа (сек.) в timings[name]"""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - t0
+
+
+@dataclass
+class CycleReport:
+    started_at: float
+    duration: float = 0.0
+    timings: Dict[str, Dict[str, float]] = field(default_factory=dict)  # symbol -> stage -> сек.
+    completed: List[str] = field(default_factory=list)
+    missed: List[str] = field(default_factory=list)    # не уложились в дедлайн (досчитываются в фоне)
+    skipped: List[str] = field(default_factory=list)   # еще выполнялись с прошлого цикла
+    queued: List[str] = field(default_factory=list)    # еще выполнялись - задача запустится следом (queue_busy)
+    errors: Dict[str, str] = field(default_factory=dict)
+
+
+class CycleExecutor:
+    """
+    Параллельная обработка символов цикла: не более workers одновременно,
+    ожидание результатов - до дедлайна от начала цикла. Символ, который еще
+    обрабатывается с прошлого цикла, повторно не запускается; с queue_busy его
+    задача ставится в очередь и выполняется сразу после текущей.
+    on_late(symbol) вызывается из рабочего потока, когда задача, не попавшая в
+    отчет цикла (опоздала к дедлайну или ждала в очереди), завершилась успешно.
+    """
+
+    def __init__(self, workers: int = CYCLE_WORKERS, deadline: float = CYCLE_DEADLINE,
+                 on_late: Optional[Callable[[str], None]] = None):
+        self.deadline = deadline
+        self.on_late = on_late
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="cycle")
+        self._in_flight = set()
+        self._queued: Dict[str, List[SymbolJob]] = {}  # symbol -> задачи, ждущие окончания текущей
+        self._lock = threading.Lock()
+
+    def _run_job(self, symbol: str, job: SymbolJob, timings: Dict[str, float]):
+        try:
+            with stage(timings, "total"):
+                job(timings)
+        finally:
+            with self._lock:
+                queued = self._queued.get(symbol)
+                next_job = queued.pop(0) if queued else None
+                if not queued:
+                    self._queued.pop(symbol, None)
+                if next_job is None:
+                    self._in_flight.discard(symbol)
+            if next_job is not None:
+                self._submit_queued(symbol, next_job)
+
+    def _submit_queued(self, symbol: str, job: SymbolJob):
+        """Задача из очереди символа: символ остается в работе, результат - вне отчета цикла"""
+        try:
+            future = self._pool.submit(self._run_job, symbol, job, {})
+        except RuntimeError:  # пул уже остановлен
+            with self._lock:
+                self._in_flight.discard(symbol)
+            return
+        future.add_done_callback(partial(self._finished_late, symbol))
+
+    def _finished_late(self, symbol: str, future: Future):
+        error = future.exception()
+        if error is not None:
+            logger.error(f"Error processing {symbol}: {error}")
+            return
+        if self.on_late is not None:
+            try:
+                self.on_late(symbol)
+            except Exception as e:
+                logger.error(f"Error handling late result for {symbol}: {e}")
+
+    def run(self, jobs: Dict[str, SymbolJob], queue_busy: bool = False) -> CycleReport:
+        """
+        queue_busy: задачи символов, которые еще обрабатываются, не отбрасываются, а
+        выполняются следом за текущей (события закрытия свечей нельзя терять).
+        """
+        report = CycleReport(started_at=time.time())
+        t0 = time.monotonic()
+        futures = {}
+        for symbol, job in jobs.items():
+            with self._lock:
+                if symbol in self._in_flight:
+                    if queue_busy:
+                        self._queued.setdefault(symbol, []).append(job)
+                        report.queued.append(symbol)
+                    else:
+                        report.skipped.append(symbol)
+                    continue
+                self._in_flight.add(symbol)
+            timings = report.timings.setdefault(symbol, {})
+            futures[self._pool.submit(self._run_job, symbol, job, timings)] = symbol
+
+        done, not_done = wait(futures, timeout=self.deadline)
+        for future in done:
+            symbol = futures[future]
+            error = future.exception()
+            if error is not None:
+                report.errors[symbol] = str(error)
+                logger.error(f"Error processing {symbol}: {error}")
+            else:
+                report.completed.append(symbol)
+        report.missed = [futures[f] for f in not_done]
+        for future in not_done:
+            # Досчитается в фоне - результат передается on_late, а не следующему циклу
+            future.add_done_callback(partial(self._finished_late, futures[future]))
+        report.duration = time.monotonic() - t0
+
+        self._log(report)
+        return report
+
+    def _log(self, report: CycleReport):
+        if report.timings:
+            slowest = max(report.timings.items(), key=lambda kv: kv[1].get("total", 0.0))
+            stages = ", ".join(f"{k}={v * 1000:.0f}ms" for k, v in slowest[1].items())
+            logger.info(
+                f"Cycle: {len(report.completed)}/{len(report.timings)} symbols in {report.duration:.2f}s "
+                f"(slowest {slowest[0]}: {stages})"
+            )
+        if report.missed:
+            logger.warning(f"Deadline {self.deadline}s missed by: {', '.join(report.missed)}")
+        if report.skipped:
+            logger.warning(f"Still busy from previous cycle: {', '.join(report.skipped)}")
+        if report.queued:
+            logger.warning(f"Still busy, queued after the running job: {', '.join(report.queued)}")
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False)
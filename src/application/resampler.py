@@ -0,0 +1,93 @@
+from typing import Dict, Iterable, Optional, Union
+import numpy as np
+import pandas as pd
+from src.domain.contracts import KlineBatch
+from src.application.candle_buffer import CandleBuffer
+from config import TIMEFRAME, TF_MS, KLINE_BUFFER_SIZE
+
+
+def bucket_start(ts: Union[int, np.ndarray], timeframe: str) -> Union[int, np.ndarray]:
+    """
+    Open time свечи timeframe, в которую попадает open time ts (мс).
+    Как у Binance: интервалы из TF_MS (до 1d) отсчитываются от 1970-01-01 00:00 UTC,
+    т.е. 4h начинаются в 00/04/08..., 1d - в полночь UTC.
+    """
+    step = TF_MS[timeframe]
+    return ts // step * step
+
+
+def check_timeframes(base_timeframe: str, timeframes: Iterable[str]):
+    for tf in timeframes:
+        if tf not in TF_MS:
+            raise ValueError(f"Unknown timeframe {tf}")
+        if TF_MS[tf] <= TF_MS[base_timeframe] or TF_MS[tf] % TF_MS[base_timeframe]:
+            raise ValueError(f"Timeframe {tf} is not a multiple of {base_timeframe}")
+
+
+def resample(batch: KlineBatch, timeframe: str, keep_partial_head: bool = True) -> KlineBatch:
+    """
+    Свечи timeframe из свечей младшего ТФ: open первой, max high, min low,
+    close последней, сумма volume. Последняя свеча может быть неполной (как текущая
+    у Binance). keep_partial_head=False отбрасывает первую свечу, если история
+    начинается с ее середины (у биржи она полная).
+    """
+    ts = batch.timestamp
+    if len(ts) and not keep_partial_head:
+        head = bucket_start(int(ts[0]), timeframe)
+        if head != ts[0]:
+            batch = batch[int(np.searchsorted(ts, head + TF_MS[timeframe])):]
+            ts = batch.timestamp
+    if not len(ts):
+        return batch[:0]
+
+    starts = bucket_start(ts, timeframe)
+    first = np.flatnonzero(np.r_[True, starts[1:] != starts[:-1]])  # первая младшая свеча каждой корзины
+    last = np.r_[first[1:], len(ts)] - 1
+    return KlineBatch(
+        batch.symbol, starts[first], batch.open[first],
+        np.maximum.reduceat(batch.high, first), np.minimum.reduceat(batch.low, first),
+        batch.close[last], np.add.reduceat(batch.volume, first),
+    )
+
+
+def resample_frame(df: pd.DataFrame, timeframe: str, keep_partial_head: bool = True) -> pd.DataFrame:
+    """resample() для DataFrame в формате etl_pipeline.load_from_db (тип timestamp сохраняется)"""
+    ts = df['timestamp'].to_numpy().astype('datetime64[ms]').astype(np.int64)
+    batch = KlineBatch("", ts, *(df[f].to_numpy(dtype=np.float64) for f in KlineBatch.FIELDS))
+    out = resample(batch, timeframe, keep_partial_head).to_df()
+    out['timestamp'] = out['timestamp'].astype(df['timestamp'].dtype)
+    return out
+
+
+class HTFResampler:
+    """
+    Старшие ТФ (можно несколько, например 4h и 1d) из буфера базового ТФ одного символа.
+    update() после каждого обновления базового буфера пересчитывает только свечи
+    старших ТФ с корзины последней базовой свечи прошлого вызова (она могла быть
+    незакрытой): закрытая 1h обновляет текущую 4h на месте, новая 4h добавляется.
+    Историю глубже базового буфера можно один раз загрузить через seed().
+    """
+
+    def __init__(self, base: CandleBuffer, timeframes: Iterable[str], base_timeframe: str = TIMEFRAME,
+                 capacity: int = KLINE_BUFFER_SIZE, symbol: str = ""):
+        timeframes = list(timeframes)
+        check_timeframes(base_timeframe, timeframes)
+        self.base = base
+        self.symbol = symbol
+        self.buffers: Dict[str, CandleBuffer] = {tf: CandleBuffer(capacity) for tf in timeframes}
+        self._synced: Optional[int] = None  # последняя базовая свеча на момент прошлого update
+
+    def seed(self, timeframe: str, klines: KlineBatch):
+        """Готовые свечи старшего ТФ (например, с биржи) до первого update"""
+        self.buffers[timeframe].upsert(klines)
+
+    def update(self) -> Dict[str, CandleBuffer]:
+        ts = self.base.timestamps
+        if not len(ts):
+            return self.buffers
+        for tf, buf in self.buffers.items():
+            start = 0 if self._synced is None else int(np.searchsorted(ts, bucket_start(self._synced, tf)))
+            # Первая корзина буфера может быть неполной - ее не трогаем (у seed она полная)
+            buf.upsert(resample(self.base.batch(self.symbol, start), tf, keep_partial_head=self._synced is not None))
+        self._synced = int(ts[-1])
+        return self.buffers
@@ -1,9 +1,18 @@
 import time
+import queue
 import logging
+import threading
+from functools import partial
+from typing import Dict, List, Optional, Tuple
 import pandas as pd
-from typing import Dict
-from src.domain.contracts import ExchangeInterface, NotifierInterface, SignalGeneratorInterface
-from config import SYMBOLS, TIMEFRAME, HTF_TIMEFRAME, POLL_INTERVAL
+from src.domain.contracts import (
+    ExchangeInterface, NotifierInterface, SignalGeneratorInterface, KlineStreamInterface, KlineDTO
+)
+from src.application.candle_buffer import CandleBuffer
+from src.application.resampler import HTFResampler
+from src.application.cycle_executor import CycleExecutor, CycleReport, stage
+from src.infrastructure.metrics import STAGE_SECONDS, CYCLE_SECONDS, CYCLE_SYMBOLS, SIGNAL_DELAY_SECONDS, SIGNALS
+from config import SYMBOLS, TIMEFRAME, HTF_TIMEFRAME, HTF_SOURCE, POLL_INTERVAL, TF_MS, KLINE_BUFFER_SIZE, KLINE_DELTA_LIMIT, WORKER_HEARTBEAT
 
 logger = logging.getLogger(__name__)
 
@@ -12,17 +21,59 @@ class SignalBotService:
         self,
         exchange: ExchangeInterface,
         notifier: NotifierInterface,
-        generator: SignalGeneratorInterface
+        generator: SignalGeneratorInterface,
+        symbols: Optional[List[str]] = None
     ):
         self.exchange = exchange
         self.notifier = notifier
         self.generator = generator
+        self.symbols = symbols or SYMBOLS # шард символов (по умолчанию - все из конфига)
+        self.history = self._history_limits() # timeframe -> свечей в буфере символа
         self.last_candles: Dict[str, int] = {} # symbol -> last_closed_timestamp
+        self.buffers: Dict[Tuple[str, str], CandleBuffer] = {} # (symbol, timeframe) -> свечи в памяти
+        self.resamplers: Dict[str, HTFResampler] = {} # symbol -> HTF из буфера TIMEFRAME (HTF_SOURCE=resample)
+        self.executor = CycleExecutor(on_late=self._on_late)
+        self.last_report: Optional[CycleReport] = None
+        # Последний шаг главного цикла (ожидание идет отрезками по WORKER_HEARTBEAT):
+        # по нему супервизор отличает зависший воркер от ждущего свечу
+        self.alive_at = time.time()
+        # Свечи, готовые к анализу: symbol -> (ts, df, htf_df); модель вызывается раз на пачку
+        self._pending: Dict[str, Tuple[int, pd.DataFrame, pd.DataFrame]] = {}
+        self._pending_lock = threading.Lock()
+        self._score_lock = threading.Lock()  # пачки оцениваются по одной (цикл и опоздавшие символы)
 
-    def run(self):
-        logger.info("Starting Signal Bot Service...")
+    def _history_limits(self) -> Dict[str, int]:
+        """
+        Глубина буфера на таймфрейм: сколько закрытых свечей нужно признакам модели
+        (generator.required_history) плюс незакрытая, но не больше KLINE_BUFFER_SIZE.
+        """
+        required = self.generator.required_history()
+        limits = {}
+        for timeframe in (TIMEFRAME, HTF_TIMEFRAME):
+            bars = required.get(timeframe)
+            if bars is None:
+                limits[timeframe] = KLINE_BUFFER_SIZE
+                continue
+            bars += 1
+            if timeframe == TIMEFRAME:
+                # Текущая HTF свеча собирается из буфера основного ТФ
+                bars = max(bars, TF_MS.get(HTF_TIMEFRAME, 3600000) // TF_MS.get(TIMEFRAME, 3600000) + 1)
+            if bars > KLINE_BUFFER_SIZE:
+                logger.warning(f"Model needs {bars} x {timeframe} candles, buffer holds {KLINE_BUFFER_SIZE}")
+                bars = KLINE_BUFFER_SIZE
+            limits[timeframe] = bars
+        logger.info(f"Candle history per symbol: {limits}")
+        return limits
+
+    def run(self, announce: bool = True):
+        logger.info(f"Starting Signal Bot Service for {len(self.symbols)} symbols...")
         logger.info("✅ Successfully connected to Binance Sockets")
-        self.notifier.send_message("🤖 Bot started and monitoring markets...")
+        if announce:
+            self.notifier.send_message("🤖 Bot started and monitoring markets...")
+        
+        if isinstance(self.exchange, KlineStreamInterface):
+            self._run_stream()
+            return
         
         retry_delay = 5 # Начальная задержка 5 секунд
         max_delay = 60  # Максимальная задержка 60 секунд
@@ -30,6 +81,7 @@ class SignalBotService:
         while True:
             try:
                 # 1. Сначала запускаем анализ (сразу при старте)
+                self.alive_at = time.time()
                 self._process_cycle()
                 
                 # 2. Затем ждем закрытия следующей свечи
@@ -40,13 +92,67 @@ class SignalBotService:
                 
             except Exception as e:
                 logger.error(f"Error in main loop: {e}. Reconnecting in {retry_delay}s...")
-                time.sleep(retry_delay)
+                self._sleep(retry_delay)
                 
                 # Экспоненциальное увеличение задержки
                 retry_delay = min(retry_delay * 2, max_delay)
 
+    def _run_stream(self):
+        """Событийный режим: анализ сразу по событию закрытия свечи из потока"""
+        events: queue.Queue = queue.Queue()
+        self.exchange.subscribe(self.symbols, TIMEFRAME, events.put)
+        self.exchange.start()
+        
+        # Первый анализ по REST (сразу при старте), дальше - только события
+        try:
+            self._process_cycle()
+        except Exception as e:
+            logger.error(f"Error in initial cycle: {e}")
+        
+        try:
+            while True:
+                self.alive_at = time.time()
+                try:
+                    first = events.get(timeout=WORKER_HEARTBEAT)
+                except queue.Empty:
+                    continue
+                # Свечи всех символов закрываются одновременно - забираем всю пачку
+                batch = [first]
+                while True:
+                    try:
+                        batch.append(events.get_nowait())
+                    except queue.Empty:
+                        break
+                self._process_events(batch)
+        finally:
+            self.exchange.stop()
+
+    def _process_events(self, klines: List[KlineDTO]):
+        by_symbol: Dict[str, List[KlineDTO]] = {}
+        for kline in sorted(klines, key=lambda k: k.timestamp):
+            by_symbol.setdefault(kline.symbol, []).append(kline)
+        jobs = {symbol: partial(self._on_closed_klines, items) for symbol, items in by_symbol.items()}
+        # Символ еще разбирает прошлое событие - свечи разбираются следом, а не теряются
+        self.last_report = self.executor.run(jobs, queue_busy=True)
+        self._observe(self.last_report)
+        self._score_pending()
+
+    def _on_closed_klines(self, klines: List[KlineDTO], timings: Dict[str, float]):
+        for kline in klines:
+            self._on_closed_kline(kline, timings)
+
+    def _on_closed_kline(self, kline: KlineDTO, timings: Dict[str, float]):
+        buf = self.buffers.get((kline.symbol, TIMEFRAME))
+        if buf is None or kline.timestamp > buf.last_ts + TF_MS.get(TIMEFRAME, 3600000):
+            # Буфера нет или пропущены свечи - догружаем по REST
+            with stage(timings, "fetch"):
+                buf = self._refresh(kline.symbol, TIMEFRAME)
+            if buf is None:
+                return
+        buf.upsert([kline])
+        self._analyze(kline.symbol, buf, kline.timestamp, timings)
+
     def _wait_for_next_candle(self):
-        from config import TF_MS
         now_ms = time.time() * 1000
         interval_ms = TF_MS.get(TIMEFRAME, 3600000)
         
@@ -58,55 +164,157 @@ class SignalBotService:
         wait_sec = wait_ms / 1000
         
         logger.info(f"Next candle in {wait_sec/60:.2f} min. Sleeping...")
-        time.sleep(wait_sec)
+        self._sleep(wait_sec)
+
+    def _sleep(self, seconds: float):
+        """Сон отрезками по WORKER_HEARTBEAT с отметкой alive_at"""
+        until = time.monotonic() + seconds
+        while True:
+            self.alive_at = time.time()
+            left = until - time.monotonic()
+            if left <= 0:
+                return
+            time.sleep(min(left, WORKER_HEARTBEAT))
+
+    def _refresh(self, symbol: str, timeframe: str) -> Optional[CandleBuffer]:
+        """
+        Обновляет буфер свечей: при первом вызове - полная история,
+        дальше - только несколько последних свечей (включая незакрытую).
+        """
+        buf = self.buffers.get((symbol, timeframe))
+        if buf is None:
+            klines = self.exchange.get_latest_klines(symbol, timeframe, limit=self.history[timeframe])
+            if not klines:
+                return None
+            buf = CandleBuffer(self.history[timeframe])
+            buf.upsert(klines)
+            self.buffers[(symbol, timeframe)] = buf
+            return buf
+
+        klines = self.exchange.get_latest_klines(symbol, timeframe, limit=KLINE_DELTA_LIMIT)
+        if not klines:
+            return None
+
+        # Свежая пачка должна перекрывать последнюю свечу буфера (она была незакрытой),
+        # иначе между ними пропуск - дозапрашиваем недостающее
+        if klines.timestamp[0] > buf.last_ts:
+            interval_ms = TF_MS.get(timeframe, 3600000)
+            need = (int(klines.timestamp[-1]) - buf.last_ts) // interval_ms + 1
+            if need > self.history[timeframe]:
+                logger.warning(f"Gap too large for {symbol} {timeframe}, reseeding buffer")
+                del self.buffers[(symbol, timeframe)]
+                return self._refresh(symbol, timeframe)
+            logger.info(f"Filling gap of {need} candles for {symbol} {timeframe}")
+            klines = self.exchange.get_latest_klines(symbol, timeframe, limit=need)
+            if not klines:
+                return None
+
+        buf.upsert(klines)
+        return buf
+
+    def _resample_htf(self, symbol: str, ltf: CandleBuffer) -> Optional[CandleBuffer]:
+        """
+        HTF свечи из буфера основного ТФ - без запроса к бирже в каждом цикле.
+        История глубже буфера (разогрев HTF индикаторов) грузится по REST один раз
+        на символ и заново, только если буфер основного ТФ пересоздан.
+        """
+        resampler = self.resamplers.get(symbol)
+        if resampler is None or resampler.base is not ltf:
+            resampler = HTFResampler(ltf, [HTF_TIMEFRAME], capacity=self.history[HTF_TIMEFRAME], symbol=symbol)
+            resampler.seed(HTF_TIMEFRAME, self.exchange.get_latest_klines(symbol, HTF_TIMEFRAME, limit=self.history[HTF_TIMEFRAME]))
+            self.resamplers[symbol] = resampler
+            self.buffers[(symbol, HTF_TIMEFRAME)] = resampler.buffers[HTF_TIMEFRAME]
+        htf = resampler.update()[HTF_TIMEFRAME]
+        return htf if htf.size else None
 
     def _process_cycle(self):
-        for symbol in SYMBOLS:
-            # 1. Получаем свечи основного ТФ
-            klines = self.exchange.get_latest_klines(symbol, TIMEFRAME)
-            if not klines: continue
-            
-            # Последняя ЗАКРЫТАЯ свеча (обычно klines[-1] - это текущая незакрытая, нам нужна klines[-2])
-            # Хотя Binance API возвращает текущую свечу тоже. 
-            # Для надежности берем ту, время которой меньше текущего "начала" свечи.
-            closed_kline = klines[-2] 
-            ts = closed_kline.timestamp
-            
-            if self.last_candles.get(symbol) == ts:
-                continue # Уже обработали эту свечу
-                
-            logger.info(f"New candle closed for {symbol} at {ts}. Analyzing...")
-            
-            # 2. Получаем HTF свечи
-            htf_klines = self.exchange.get_latest_klines(symbol, HTF_TIMEFRAME)
-            if not htf_klines: continue
-            
-            # 3. Конвертируем в DataFrame для генератора
-            df = self._to_df(klines[:-1]) # исключаем текущую незакрытую
-            htf_df = self._to_df(htf_klines) # тут можно все, merge_asof разберется
-            
-            # 4. Генерируем сигнал
-            signal = self.generator.generate_signal(symbol, df, htf_df)
+        # Символы обрабатываются параллельно (CYCLE_WORKERS) с дедлайном CYCLE_DEADLINE
+        jobs = {symbol: partial(self._process_symbol, symbol) for symbol in self.symbols}
+        self.last_report = self.executor.run(jobs)
+        self._observe(self.last_report)
+        self._score_pending()
+
+    def _observe(self, report: CycleReport):
+        """Тайминги этапов цикла в метрики (/metrics)"""
+        CYCLE_SECONDS.observe(report.duration)
+        for outcome in ("completed", "missed", "skipped", "queued", "errors"):
+            count = len(getattr(report, outcome))
+            if count:
+                CYCLE_SYMBOLS.inc(outcome, amount=count)
+        # Тайминги опоздавших символов еще дописываются - берем только завершенные
+        for symbol in report.completed:
+            for name, seconds in report.timings[symbol].items():
+                STAGE_SECONDS.observe(seconds, name)
+
+    def _process_symbol(self, symbol: str, timings: Dict[str, float]):
+        # 1. Обновляем свечи основного ТФ (дельта к буферу)
+        with stage(timings, "fetch"):
+            ltf = self._refresh(symbol, TIMEFRAME)
+        if ltf is None or ltf.size < 2: return
+        
+        # Последняя ЗАКРЫТАЯ свеча (последняя в буфере - текущая незакрытая)
+        self._analyze(symbol, ltf, int(ltf.timestamps[-2]), timings)
+
+    def _analyze(self, symbol: str, ltf: CandleBuffer, ts: int, timings: Dict[str, float]):
+        """Подготовка закрытой свечи ts к анализу (сам анализ - в _score_pending пачкой)"""
+        if self.last_candles.get(symbol) == ts:
+            return # Уже обработали эту свечу
             
-            if signal:
-                logger.info(f"SIGNAL FOUND: {symbol} {signal.side}")
+        logger.info(f"New candle closed for {symbol} at {ts}. Analyzing...")
+        
+        # 2. Обновляем HTF свечи
+        if HTF_SOURCE == "exchange":
+            with stage(timings, "fetch_htf"):
+                htf = self._refresh(symbol, HTF_TIMEFRAME)
+        else:
+            with stage(timings, "resample_htf"):
+                htf = self._resample_htf(symbol, ltf)
+        if htf is None: return
+        
+        # 3. DataFrame для генератора
+        with stage(timings, "to_df"):
+            df = ltf.to_df(until=ts) # без свечей новее закрытой (текущей незакрытой)
+            htf_df = htf.to_df() # тут можно все, merge_asof разберется
+        
+        # Для символа важна только последняя закрытая свеча
+        with self._pending_lock:
+            self._pending[symbol] = (ts, df, htf_df)
+
+    def _on_late(self, symbol: str):
+        """Символ не успел к дедлайну (или ждал в очереди) - оцениваем, как только готов"""
+        self._score_pending()
+
+    def _score_pending(self):
+        """
+        4. Сигналы по всем подготовленным символам - один вызов модели.
+        Символы, не успевшие к дедлайну, оцениваются по завершении своей задачи
+        (_on_late), а не в следующем цикле: там их свечу заменила бы следующая.
+        """
+        with self._score_lock:
+            with self._pending_lock:
+                pending, self._pending = self._pending, {}
+            if pending:
+                self._score(pending)
+
+    def _score(self, pending: Dict[str, Tuple[int, pd.DataFrame, pd.DataFrame]]):
+        t0 = time.perf_counter()
+        signals = self.generator.generate_signals({symbol: (df, htf_df) for symbol, (_, df, htf_df) in pending.items()})
+        logger.info(f"Scored {len(pending)} symbols in one batch ({(time.perf_counter() - t0) * 1000:.0f}ms)")
+        
+        signaled = set()
+        close_ms = TF_MS.get(TIMEFRAME, 3600000)
+        for signal in signals:
+            logger.info(f"SIGNAL FOUND: {signal.symbol} {signal.side}")
+            signaled.add(signal.symbol)
+            SIGNALS.inc(signal.side.value)
+            try:
                 self.notifier.send_signal(signal)
-            else:
+            except Exception as e:
+                logger.error(f"Error sending signal for {signal.symbol}: {e}")
+            # От закрытия свечи (open time + интервал) до передачи сигнала notifier
+            SIGNAL_DELAY_SECONDS.observe(time.time() - (pending[signal.symbol][0] + close_ms) / 1000)
+        
+        for symbol, (ts, _, _) in pending.items():
+            if symbol not in signaled:
                 logger.info(f"Neutral for {symbol}")
-                
             self.last_candles[symbol] = ts
-
-    def _to_df(self, klines) -> pd.DataFrame:
-        data = []
-        for k in klines:
-            data.append({
-                "timestamp": k.timestamp,
-                "open": k.open,
-                "high": k.high,
-                "low": k.low,
-                "close": k.close,
-                "volume": k.volume
-            })
-        df = pd.DataFrame(data)
-        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
-        return df
@@ -0,0 +1,269 @@
+import os
+import time
+import queue
+import signal
+import logging
+import threading
+import multiprocessing as mp
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+from src.domain.contracts import ExchangeInterface, NotifierInterface, SignalDTO, SignalGeneratorInterface
+from src.application.service import SignalBotService
+from src.infrastructure.metrics import REGISTRY
+from config import BOT_WORKERS, WORKER_HEARTBEAT, WORKER_STALE_AFTER
+
+logger = logging.getLogger(__name__)
+
+
+def shard_symbols(symbols: List[str], shards: int) -> List[List[str]]:
+    """Раскладка символов по шардам по кругу (размеры отличаются не более чем на 1)"""
+    shards = max(1, min(shards, len(symbols)))
+    return [symbols[i::shards] for i in range(shards)]
+
+
+class QueueNotifier(NotifierInterface):
+    """Уведомления воркера уходят в общую очередь, отправляет их супервизор"""
+
+    def __init__(self, out: "mp.Queue", shard: int):
+        self.out = out
+        self.shard = shard
+        self.signals_sent = 0
+
+    def send_signal(self, signal: SignalDTO):
+        self.signals_sent += 1
+        self.out.put(("signal", self.shard, signal))
+
+    def send_message(self, message: str):
+        self.out.put(("message", self.shard, message))
+
+
+def _heartbeat_loop(service: SignalBotService, notifier: QueueNotifier, shard: int, status: "mp.Queue", parent: int):
+    while True:
+        if os.getppid() != parent:
+            os._exit(0)  # супервизор умер - не оставляем осиротевших воркеров
+        report = service.last_report
+        status.put({
+            "shard": shard,
+            "pid": os.getpid(),
+            # Не время отправки, а последний шаг цикла сервиса: зависший цикл = устаревший heartbeat
+            "at": service.alive_at,
+            "symbols": len(service.symbols),
+            "signals": notifier.signals_sent,
+            "metrics": REGISTRY.snapshot(),
+            "last_cycle": None if report is None else {
+                "started_at": report.started_at,
+                "duration": round(report.duration, 3),
+                "completed": len(report.completed),
+                "missed": len(report.missed),
+                "errors": len(report.errors),
+            },
+        })
+        time.sleep(WORKER_HEARTBEAT)
+
+
+def _worker_main(
+    shard: int,
+    symbols: List[str],
+    generator: SignalGeneratorInterface,
+    exchange_factory: Callable[[], ExchangeInterface],
+    notify: "mp.Queue",
+    status: "mp.Queue",
+):
+    # Генератор (модель) загружен супервизором и передан сюда при запуске процесса (pickle)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C обрабатывает супервизор
+    notifier = QueueNotifier(notify, shard)
+    service = SignalBotService(exchange_factory(), notifier, generator, symbols=symbols)
+    threading.Thread(
+        target=_heartbeat_loop, args=(service, notifier, shard, status, os.getppid()), daemon=True
+    ).start()
+    logger.info(f"Worker {shard} (pid {os.getpid()}): {len(symbols)} symbols")
+    service.run(announce=False)
+
+
+@dataclass
+class WorkerState:
+    shard: int
+    symbols: List[str]
+    process: Optional[mp.Process] = None
+    started_at: float = 0.0
+    restarts: int = 0
+    last_heartbeat: Optional[dict] = None
+    last_exit_code: Optional[int] = None
+    restart_at: float = 0.0  # не раньше этого времени (backoff после падений)
+    failures: List[float] = field(default_factory=list)  # времена падений
+
+
+class ShardSupervisor:
+    """
+    Шардированный live-режим: символы делятся между процессами-воркерами, в каждом -
+    свой SignalBotService и своя сессия биржи. Модель загружается один раз здесь и
+    передается воркерам при запуске. Уведомления всех воркеров идут через одну
+    очередь к настоящему notifier. Упавшие и зависшие (цикл сервиса не продвигался
+    дольше WORKER_STALE_AFTER) воркеры перезапускаются с нарастающей задержкой.
+    Воркеры запускаются через spawn: перезапуск идет из потока монитора, а fork
+    многопоточного процесса может унаследовать захваченную блокировку (logging,
+    очереди, отправка уведомлений) и повиснуть.
+    """
+
+    def __init__(
+        self,
+        symbols: List[str],
+        notifier: NotifierInterface,
+        generator: SignalGeneratorInterface,
+        exchange_factory: Callable[[], ExchangeInterface],
+        workers: int = BOT_WORKERS,
+        stale_after: float = WORKER_STALE_AFTER,
+    ):
+        self.notifier = notifier
+        self.generator = generator
+        self.exchange_factory = exchange_factory
+        self.stale_after = stale_after
+        self.ctx = mp.get_context("spawn")
+        self.notify_queue = self.ctx.Queue()
+        self.status_queue = self.ctx.Queue()
+        self.workers: Dict[int, WorkerState] = {
+            shard: WorkerState(shard, chunk) for shard, chunk in enumerate(shard_symbols(symbols, workers))
+        }
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self):
+        for state in self.workers.values():
+            self._spawn(state)
+        self._threads = [
+            threading.Thread(target=self._dispatch_loop, name="notify-dispatch", daemon=True),
+            threading.Thread(target=self._monitor_loop, name="worker-monitor", daemon=True),
+        ]
+        for t in self._threads:
+            t.start()
+        self.notifier.send_message(
+            f"🤖 Bot started: {sum(len(w.symbols) for w in self.workers.values())} symbols on {len(self.workers)} workers"
+        )
+
+    def run(self):
+        """Блокирующий запуск (для run_bot): до Ctrl+C / SIGTERM"""
+        signal.signal(signal.SIGTERM, lambda *_: self._stop.set())
+        self.start()
+        try:
+            while not self._stop.wait(1.0):
+                pass
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def stop(self):
+        self._stop.set()
+        # Сначала потоки супервизора: монитор не перезапустит воркер во время остановки
+        for t in self._threads:
+            t.join(timeout=5)
+        for state in self.workers.values():
+            if state.process is not None and state.process.is_alive():
+                state.process.terminate()
+        for state in self.workers.values():
+            if state.process is not None:
+                state.process.join(timeout=5)
+
+    def _spawn(self, state: WorkerState):
+        process = self.ctx.Process(
+            target=_worker_main,
+            args=(state.shard, state.symbols, self.generator, self.exchange_factory, self.notify_queue, self.status_queue),
+            name=f"bot-worker-{state.shard}",
+            daemon=True,
+        )
+        process.start()
+        with self._lock:
+            state.process = process
+            state.started_at = time.time()
+            state.last_heartbeat = None
+
+    def _dispatch_loop(self):
+        while not self._stop.is_set():
+            try:
+                kind, shard, payload = self.notify_queue.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            try:
+                if kind == "signal":
+                    self.notifier.send_signal(payload)
+                else:
+                    self.notifier.send_message(payload)
+            except Exception as e:
+                logger.error(f"Error dispatching {kind} from worker {shard}: {e}")
+
+    def _monitor_loop(self):
+        while not self._stop.wait(1.0):
+            self._drain_status()
+            now = time.time()
+            for state in self.workers.values():
+                process = state.process
+                if process is None:
+                    continue
+                if process.is_alive():
+                    seen = state.last_heartbeat["at"] if state.last_heartbeat else state.started_at
+                    if now - seen > self.stale_after:
+                        logger.error(f"Worker {state.shard} made no progress for {now - seen:.0f}s, killing")
+                        process.kill()
+                    continue
+                if not state.restart_at:
+                    self._on_exit(state, now)
+                if now >= state.restart_at:
+                    state.restart_at = 0.0
+                    self._spawn(state)
+
+    def _on_exit(self, state: WorkerState, now: float):
+        state.last_exit_code = state.process.exitcode
+        state.restarts += 1
+        # Задержка растет с числом падений за последние 10 минут: 1, 2, 4 ... 60 сек.
+        state.failures = [t for t in state.failures if now - t < 600] + [now]
+        delay = min(2 ** (len(state.failures) - 1), 60)
+        state.restart_at = now + delay
+        logger.error(f"Worker {state.shard} exited with code {state.last_exit_code}, restarting in {delay}s")
+        self.notify_queue.put(("message", state.shard, f"⚠️ Worker {state.shard} crashed (code {state.last_exit_code}), restarting"))
+
+    def _drain_status(self):
+        while True:
+            try:
+                beat = self.status_queue.get_nowait()
+            except queue.Empty:
+                return
+            state = self.workers.get(beat["shard"])
+            # Отчеты убитого процесса могли задержаться в очереди
+            if state is not None and state.process is not None and beat["pid"] == state.process.pid:
+                with self._lock:
+                    state.last_heartbeat = beat
+
+    def metric_snapshots(self) -> List[dict]:
+        """Последние снимки метрик воркеров (из heartbeat) для общего /metrics"""
+        with self._lock:
+            return [w.last_heartbeat["metrics"] for w in self.workers.values() if w.last_heartbeat]
+
+    def health(self) -> dict:
+        """Сводка по воркерам для health-эндпоинта"""
+        now = time.time()
+        shards = []
+        with self._lock:
+            for state in self.workers.values():
+                alive = state.process is not None and state.process.is_alive()
+                beat = state.last_heartbeat or {}
+                shards.append({
+                    "shard": state.shard,
+                    "pid": state.process.pid if state.process else None,
+                    "alive": alive,
+                    "symbols": len(state.symbols),
+                    "restarts": state.restarts,
+                    "last_exit_code": state.last_exit_code,
+                    "heartbeat_age": round(now - beat["at"], 1) if beat else None,
+                    "signals": beat.get("signals", 0),
+                    "last_cycle": beat.get("last_cycle"),
+                })
+        return {
+            "uptime": round(now - self.started_at),
+            "workers": len(shards),
+            "alive": sum(s["alive"] for s in shards),
+            "symbols": sum(s["symbols"] for s in shards),
+            "restarts": sum(s["restarts"] for s in shards),
+            "shards": shards,
+        }
@@ -1,7 +1,8 @@
 from dataclasses import dataclass
 from enum import Enum
-from typing import List, Optional
+from typing import Callable, ClassVar, Dict, List, Optional, Tuple
 from abc import ABC, abstractmethod
+import numpy as np
 import pandas as pd
 
 class SignalSide(Enum):
@@ -19,7 +20,7 @@ class SignalDTO:
     stop_loss: float
     expected_move_pct: float
 
-@dataclass
+@dataclass(slots=True)
 class KlineDTO:
     symbol: str
     timestamp: int
@@ -29,6 +30,52 @@ class KlineDTO:
     close: float
     volume: float
 
+@dataclass
+class KlineBatch:
+    """
+    Свечи одного символа колонками: open time в мс (int64) и OHLCV (float64),
+    непрерывные массивы одинаковой длины по возрастанию времени.
+    Срезы и to_df() не копируют OHLCV.
+    """
+    symbol: str
+    timestamp: np.ndarray
+    open: np.ndarray
+    high: np.ndarray
+    low: np.ndarray
+    close: np.ndarray
+    volume: np.ndarray
+
+    FIELDS: ClassVar[Tuple[str, ...]] = ('open', 'high', 'low', 'close', 'volume')
+
+    @classmethod
+    def from_block(cls, symbol: str, block: np.ndarray) -> "KlineBatch":
+        """block: float64 (6, n) - строки timestamp, open, high, low, close, volume"""
+        block = np.ascontiguousarray(block, dtype=np.float64)
+        return cls(symbol, block[0].astype(np.int64), *block[1:6])
+
+    @classmethod
+    def from_klines(cls, symbol: str, klines: List[KlineDTO]) -> "KlineBatch":
+        timestamp = np.fromiter((k.timestamp for k in klines), dtype=np.int64, count=len(klines))
+        cols = np.array([(k.open, k.high, k.low, k.close, k.volume) for k in klines], dtype=np.float64)
+        return cls(symbol, timestamp, *np.ascontiguousarray(cols.reshape(-1, 5).T))
+
+    def __len__(self) -> int:
+        return len(self.timestamp)
+
+    def __getitem__(self, index: slice) -> "KlineBatch":
+        return KlineBatch(self.symbol, self.timestamp[index], *(getattr(self, f)[index] for f in self.FIELDS))
+
+    def klines(self) -> List[KlineDTO]:
+        """Построчные объекты - только там, где они действительно нужны"""
+        return [KlineDTO(self.symbol, t, o, h, l, c, v) for t, o, h, l, c, v in zip(
+            self.timestamp.tolist(), *(getattr(self, f).tolist() for f in self.FIELDS))]
+
+    def to_df(self) -> pd.DataFrame:
+        """DataFrame в формате etl_pipeline.load_from_db"""
+        data = {'timestamp': pd.to_datetime(self.timestamp, unit='ms')}
+        data.update((f, getattr(self, f)) for f in self.FIELDS)
+        return pd.DataFrame(data, copy=False)
+
 class NotifierInterface(ABC):
     @abstractmethod
     def send_signal(self, signal: SignalDTO):
@@ -40,10 +87,33 @@ class NotifierInterface(ABC):
 
 class ExchangeInterface(ABC):
     @abstractmethod
-    def get_latest_klines(self, symbol: str, timeframe: str, limit: int = 200) -> List[KlineDTO]:
+    def get_latest_klines(self, symbol: str, timeframe: str, limit: int = 200) -> KlineBatch:
+        pass
+
+class KlineStreamInterface(ABC):
+    """Источник событий закрытия свечей (push вместо опроса по таймеру)"""
+    @abstractmethod
+    def subscribe(self, symbols: List[str], timeframe: str, callback: Callable[[KlineDTO], None]):
+        pass
+
+    @abstractmethod
+    def start(self):
+        pass
+
+    @abstractmethod
+    def stop(self):
         pass
 
 class SignalGeneratorInterface(ABC):
     @abstractmethod
     def generate_signal(self, symbol: str, klines_df: pd.DataFrame, htf_klines_df: pd.DataFrame) -> Optional[SignalDTO]:
         pass
+
+    @abstractmethod
+    def generate_signals(self, inputs: Dict[str, Tuple[pd.DataFrame, pd.DataFrame]]) -> List[SignalDTO]:
+        """Пачка символов за один вызов модели: symbol -> (klines_df, htf_klines_df)"""
+        pass
+
+    def required_history(self) -> Dict[str, int]:
+        """Закрытых свечей на символ, нужных признакам модели: timeframe -> bars (пусто - не известно)"""
+        return {}
@@ -0,0 +1,301 @@
+import time
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Dict, List, Optional, Tuple
+import requests
+from requests.adapters import HTTPAdapter
+from config import BASE_URL, BINANCE_LIMIT, TF_MS, BINANCE_WEIGHT_LIMIT, BACKFILL_WORKERS
+
+logger = logging.getLogger(__name__)
+
+# Окно загрузки: (symbol, timeframe, start_ts, end_ts) в мс, включительно
+Window = Tuple[str, str, int, int]
+
+
+def kline_weight(limit: int) -> int:
+    """Вес запроса /fapi/v1/klines по документации Binance (зависит от limit)"""
+    if limit < 100:
+        return 1
+    if limit < 500:
+        return 2
+    if limit <= 1000:
+        return 5
+    return 10
+
+
+class TokenBucket:
+    """
+    Потокобезопасное ведро токенов под лимит веса Binance (вес в минуту).
+    pause() останавливает всех потребителей (429/418 + Retry-After).
+    """
+
+    def __init__(self, capacity: float = BINANCE_WEIGHT_LIMIT, refill_per_sec: Optional[float] = None):
+        self.capacity = float(capacity)
+        self.refill_per_sec = refill_per_sec if refill_per_sec is not None else capacity / 60.0
+        self.tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.refill_per_sec)
+        self._updated = now
+
+    def acquire(self, tokens: float = 1.0):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                elif self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                else:
+                    wait = (tokens - self.tokens) / self.refill_per_sec
+            time.sleep(wait)
+
+    def pause(self, seconds: float):
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self.tokens = 0.0
+
+    def observe_used(self, used_weight: int):
+        """Синхронизация с заголовком X-MBX-USED-WEIGHT-1M (вес, уже потраченный на сервере)"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens = min(self.tokens, max(self.capacity - used_weight, 0.0))
+
+
+class KlineBackfill:
+    """
+    Параллельная загрузка истории свечей: диапазон [start, end] режется на окна
+    по BINANCE_LIMIT свечей, окна качаются пулом потоков через общую сессию
+    с keep-alive и общим ведром веса. В SQLite пишет один поток (вызывающий)
+    пачками; по каждому (symbol, timeframe) записывается только непрерывный
+    префикс окон, чтобы дозагрузка по MAX(open_time) не оставляла дыр.
+    Ряд держит в работе не больше ahead окон от первого незаписанного (в памяти
+    ждут записи не больше ahead окон), после ошибки окна остальные окна ряда
+    не качаются - их догрузит следующий запуск.
+    """
+
+    def __init__(
+        self,
+        base_url: str = BASE_URL,
+        workers: int = BACKFILL_WORKERS,
+        limit: int = BINANCE_LIMIT,
+        bucket: Optional[TokenBucket] = None,
+        session: Optional[requests.Session] = None,
+        max_retries: int = 5,
+        write_batch: int = 20_000,
+        ahead: Optional[int] = None,
+    ):
+        self.base_url = base_url
+        self.workers = max(1, workers)
+        self.limit = limit
+        self.bucket = bucket or TokenBucket()
+        self.max_retries = max_retries
+        self.write_batch = write_batch
+        self.ahead = max(1, ahead if ahead is not None else self.workers)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=self.workers, pool_maxsize=self.workers)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+        self.session = session
+
+    def windows(self, symbol: str, timeframe: str, start_ts: int, end_ts: int) -> List[Window]:
+        step = self.limit * TF_MS.get(timeframe, 3_600_000)
+        return [(symbol, timeframe, s, min(s + step - 1, end_ts)) for s in range(start_ts, end_ts + 1, step)]
+
+    def fetch_window(self, window: Window) -> list:
+        symbol, timeframe, start_ts, end_ts = window
+        params = {
+            "symbol": symbol.replace("/", ""),
+            "interval": timeframe,
+            "startTime": start_ts,
+            "endTime": end_ts,
+            "limit": self.limit,
+        }
+        weight = kline_weight(self.limit)
+        delay = 1.0
+
+        for attempt in range(1, self.max_retries + 1):
+            self.bucket.acquire(weight)
+            try:
+                r = self.session.get(self.base_url, params=params, timeout=10)
+            except requests.RequestException as e:
+                logger.warning(f"[{symbol}-{timeframe}] {e}, повтор {attempt}/{self.max_retries}")
+                time.sleep(delay)
+                delay = min(delay * 2, 30)
+                continue
+
+            used = r.headers.get("X-MBX-USED-WEIGHT-1M")
+            if used and used.isdigit():
+                self.bucket.observe_used(int(used))
+
+            if r.status_code in (418, 429):
+                retry_after = float(r.headers.get("Retry-After", delay))
+                logger.warning(f"[{symbol}-{timeframe}] HTTP {r.status_code}, пауза всех потоков на {retry_after}s")
+                self.bucket.pause(retry_after)
+                delay = min(delay * 2, 30)
+                continue
+            if r.status_code >= 500:
+                time.sleep(delay)
+                delay = min(delay * 2, 30)
+                continue
+
+            r.raise_for_status()
+            return r.json()
+
+        raise RuntimeError(f"[{symbol}-{timeframe}] window {start_ts}-{end_ts} failed after {self.max_retries} retries")
+
+    def run(self, conn, jobs: List[Tuple[str, str, int, int]]) -> Dict[Tuple[str, str], int]:
+        """jobs: (symbol, timeframe, start_ts, end_ts). Возвращает число записанных свечей по ключу"""
+        plan: Dict[Tuple[str, str], List[Window]] = {}
+        for symbol, timeframe, start_ts, end_ts in jobs:
+            if start_ts <= end_ts:
+                plan[(symbol, timeframe)] = self.windows(symbol, timeframe, start_ts, end_ts)
+
+        loaded = {key: 0 for key in plan}
+        done: Dict[Tuple[str, str], Dict[int, list]] = {key: {} for key in plan}
+        next_idx = {key: 0 for key in plan}
+        buffer = []
+
+        def flush():
+            if buffer:
+                conn.executemany("INSERT OR IGNORE INTO candles VALUES (?,?,?,?,?,?,?,?,?)", buffer)
+                conn.commit()
+                buffer.clear()
+
+        total = sum(len(w) for w in plan.values())
+        logger.info(f"Параллельная загрузка: {total} окон по {len(plan)} рядам, {self.workers} потоков")
+
+        submitted = {key: 0 for key in plan}
+        running: Dict[Future, Tuple[Tuple[str, str], int]] = {}
+        failed = set()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            def submit(key):
+                # Окна ряда от первого незаписанного, не дальше ahead
+                windows = plan[key]
+                while submitted[key] < min(len(windows), next_idx[key] + self.ahead):
+                    idx = submitted[key]
+                    running[pool.submit(self.fetch_window, windows[idx])] = (key, idx)
+                    submitted[key] += 1
+
+            for key in plan:
+                submit(key)
+            while running:
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    key, idx = running.pop(future)
+                    if key in failed:
+                        continue  # отменено или уже не нужно: ряд оборвался раньше
+                    try:
+                        data = future.result()
+                    except Exception as e:
+                        # Окно не попадет в префикс - ряд обрывается на нем, следующие окна не нужны
+                        logger.error(f"Ошибка загрузки {key[0]}-{key[1]}: {e}")
+                        failed.add(key)
+                        done[key].clear()
+                        for other, (other_key, _) in running.items():
+                            if other_key == key:
+                                other.cancel()
+                        continue
+
+                    symbol, timeframe = key
+                    done[key][idx] = [
+                        (symbol, timeframe, int(k[0]), float(k[1]), float(k[2]), float(k[3]), float(k[4]),
+                         float(k[5]), float(k[7]))
+                        for k in data
+                    ]
+                    # Пишем окна строго по порядку: только непрерывный префикс
+                    while next_idx[key] in done[key]:
+                        rows = done[key].pop(next_idx[key])
+                        buffer.extend(rows)
+                        loaded[key] += len(rows)
+                        next_idx[key] += 1
+                    submit(key)
+                if len(buffer) >= self.write_batch:
+                    flush()
+        flush()
+
+        for key, windows in plan.items():
+            if next_idx[key] < len(windows):
+                logger.error(f"[{key[0]}-{key[1]}] записано {next_idx[key]} из {len(windows)} окон, остаток - при следующем запуске")
+        return loaded
+
+
+def check_backfill(timeout: float = 30.0) -> dict:
+    """
+    KlineBackfill против BinanceStub: 429 и 418 с Retry-After останавливают все
+    потоки, 5xx повторяется, после окна, которое так и не скачалось, окна ряда
+    дальше ahead не запрашиваются, в БД - только непрерывный префикс окон.
+    Возвращает статистику или бросает AssertionError.
+    """
+    import sqlite3
+    from src.infrastructure.binance_stub import BinanceStub
+
+    timeframe, limit, retries, ahead = "1h", 10, 2, 2
+    step = TF_MS[timeframe]
+    start = 1_704_067_200_000  # 2024-01-01
+    windows = {"ETH/USDT": 6, "BTC/USDT": 6, "SOL/USDT": 8}
+    window_start = lambda idx: start + idx * limit * step
+    faults = {
+        ("ETHUSDT", window_start(1)): [429],
+        ("BTCUSDT", window_start(2)): [502],
+        ("BTCUSDT", window_start(4)): [418],
+        ("SOLUSDT", window_start(3)): [500] * retries,  # окно 3 не скачается
+    }
+    conn = sqlite3.connect(":memory:", check_same_thread=False)
+    conn.execute("""
+        CREATE TABLE candles (
+            symbol TEXT, timeframe TEXT, open_time INTEGER, open REAL, high REAL, low REAL, close REAL,
+            volume REAL, quote_volume REAL, PRIMARY KEY (symbol, timeframe, open_time)
+        )
+    """)
+    with BinanceStub(faults=faults, retry_after=1.0) as stub:
+        backfill = KlineBackfill(
+            base_url=f"{stub.url}/fapi/v1/klines", workers=4, limit=limit, max_retries=retries,
+            write_batch=25, ahead=ahead,
+        )
+        jobs = [(symbol, timeframe, start, window_start(n) - 1) for symbol, n in windows.items()]
+        worker = threading.Thread(target=lambda: result.update(backfill.run(conn, jobs)), daemon=True)
+        result: Dict[Tuple[str, str], int] = {}
+        worker.start()
+        worker.join(timeout)
+        if worker.is_alive():
+            raise AssertionError(f"Backfill did not finish in {timeout:g}s")
+        log = list(stub.requests)
+
+    # Пока идет пауза после 429/418, запросов нет ни по одному ряду (кроме уже отправленных)
+    for _, _, status, at in log:
+        if status in (418, 429):
+            during = [r for r in log if at + 0.1 < r[3] < at + stub.retry_after - 0.05]
+            if during:
+                raise AssertionError(f"{len(during)} requests during the {status} pause: {during}")
+    retried = [s for s, t, status, _ in log if (s, t) in faults and status == 200]
+    if sorted(retried) != ["BTCUSDT", "BTCUSDT", "ETHUSDT"]:
+        raise AssertionError(f"Rate-limited and 5xx windows not retried once: {retried}")
+    sol = {(t - start) // (limit * step) for s, t, _, _ in log if s == "SOLUSDT"}
+    if max(sol) > 3 + ahead - 1:
+        raise AssertionError(f"SOL/USDT windows {sorted(sol)} requested after window 3 failed")
+
+    for symbol, n in windows.items():
+        written = n if symbol != "SOL/USDT" else 3
+        rows = conn.execute(
+            "SELECT open_time, close FROM candles WHERE symbol = ? ORDER BY open_time", (symbol,)
+        ).fetchall()
+        expected = [(t, float(BinanceStub.kline(t, step)[4])) for t in range(start, window_start(written), step)]
+        if rows != expected:
+            raise AssertionError(f"{symbol}: {len(rows)} rows written, expected a prefix of {len(expected)}")
+        if result.get((symbol, timeframe)) != len(expected):
+            raise AssertionError(f"{symbol}: run() reported {result.get((symbol, timeframe))}, wrote {len(expected)}")
+    return {"requests": len(log), "written": sum(result.values()), "sol_windows_requested": len(sol)}
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    logger.info(f"Backfill OK: {check_backfill()}")
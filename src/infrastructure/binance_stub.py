@@ -0,0 +1,129 @@
+import json
+import time
+import logging
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+from config import TF_MS
+
+logger = logging.getLogger(__name__)
+
+
+class BinanceStub:
+    """
+    Локальная замена fapi.binance.com для проверок загрузки истории: отвечает на
+    GET /fapi/v1/klines свечами в формате Binance (цены строками, цена свечи
+    зависит только от open_time) и заголовком X-MBX-USED-WEIGHT-1M.
+    faults[(symbol, startTime)] - коды ответов на очередные запросы этого окна
+    (429/418 - с Retry-After retry_after сек.), когда список кончается - 200.
+    requests - журнал (symbol, startTime, status, time.monotonic()).
+    KlineBackfill(base_url=stub.url + "/fapi/v1/klines").
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0,
+                 faults: Optional[Dict[Tuple[str, int], List[int]]] = None, retry_after: float = 1.0):
+        self.latency = latency
+        self.faults = {key: list(codes) for key, codes in (faults or {}).items()}
+        self.retry_after = retry_after
+        self.requests: List[Tuple[str, int, int, float]] = []
+        self.used_weight = 0
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "BinanceStub":
+        self._thread = threading.Thread(target=self.server.serve_forever, name="binance-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self) -> "BinanceStub":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @staticmethod
+    def kline(open_time: int, step: int) -> list:
+        price = 100 + (open_time // step) % 1000 / 10
+        return [
+            open_time, f"{price:.2f}", f"{price + 1:.2f}", f"{price - 1:.2f}", f"{price + 0.5:.2f}",
+            "10.000", open_time + step - 1, f"{(price + 0.5) * 10:.4f}", 100, "5.000", "500.0000", "0",
+        ]
+
+    def _handle(self, params: Dict[str, str]) -> Tuple[int, Dict[str, str], object]:
+        symbol = params.get("symbol", "")
+        step = TF_MS.get(params.get("interval", ""))
+        if step is None or "startTime" not in params:
+            return 400, {}, {"code": -1120, "msg": "Invalid interval or startTime."}
+        start = int(params["startTime"])
+        end = int(params.get("endTime", start + 1500 * step))
+        limit = int(params.get("limit", 500))
+        with self._lock:
+            codes = self.faults.get((symbol, start))
+            status = codes.pop(0) if codes else 200
+            self.requests.append((symbol, start, status, time.monotonic()))
+            self.used_weight += 10 if limit > 1000 else 5 if limit >= 500 else 2 if limit >= 100 else 1
+            headers = {"X-MBX-USED-WEIGHT-1M": str(self.used_weight)}
+        if self.latency:
+            time.sleep(self.latency)
+        if status in (418, 429):
+            headers["Retry-After"] = f"{self.retry_after:g}"
+            return status, headers, {"code": -1003, "msg": "Too many requests."}
+        if status != 200:
+            return status, headers, {"code": -1000, "msg": "An unknown error occurred."}
+        klines = [self.kline(t, step) for t in range(start, end + 1, step)][:limit]
+        return 200, headers, klines
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, как у настоящего API
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path != "/fapi/v1/klines":
+                    status, headers, body = 404, {}, {"code": -1, "msg": "Not Found"}
+                else:
+                    status, headers, body = stub._handle({k: v[-1] for k, v in parse_qs(url.query).items()})
+                data = json.dumps(body, separators=(",", ":")).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        return Handler
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Заглушка Binance Futures /fapi/v1/klines")
+    parser.add_argument('--port', type=int, default=8082)
+    parser.add_argument('--latency', type=float, default=0.0, help="задержка ответа, сек.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG)
+    stub = BinanceStub(port=args.port, latency=args.latency).start()
+    print(f"Binance stub on {stub.url}/fapi/v1/klines")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        stub.stop()
@@ -1,13 +1,14 @@
 import requests
 import logging
-from typing import List
-from src.domain.contracts import ExchangeInterface, KlineDTO
+import numpy as np
+from src.domain.contracts import ExchangeInterface, KlineBatch
+from src.infrastructure.metrics import EXCHANGE_REQUEST_SECONDS, EXCHANGE_REQUESTS
 from config import BASE_URL
 
 logger = logging.getLogger(__name__)
 
 class BinanceExchange(ExchangeInterface):
-    def get_latest_klines(self, symbol: str, timeframe: str, limit: int = 1500) -> List[KlineDTO]:
+    def get_latest_klines(self, symbol: str, timeframe: str, limit: int = 1500) -> KlineBatch:
         """
         Fetched Klines from Binance Futures API.
         """
@@ -19,22 +20,20 @@ class BinanceExchange(ExchangeInterface):
         }
         
         try:
-            r = requests.get(BASE_URL, params=params, timeout=10)
-            r.raise_for_status()
-            data = r.json()
-            
-            klines = []
-            for k in data:
-                klines.append(KlineDTO(
-                    symbol=symbol,
-                    timestamp=int(k[0]),
-                    open=float(k[1]),
-                    high=float(k[2]),
-                    low=float(k[3]),
-                    close=float(k[4]),
-                    volume=float(k[5])
-                ))
+            with EXCHANGE_REQUEST_SECONDS.time(timeframe):
+                klines = self._fetch(symbol, params)
+            EXCHANGE_REQUESTS.inc("ok")
             return klines
         except Exception as e:
+            EXCHANGE_REQUESTS.inc("error")
             logger.error(f"Error fetching klines for {symbol}: {e}")
-            return []
+            return KlineBatch.from_block(symbol, np.empty((6, 0)))
+
+    def _fetch(self, symbol: str, params: dict) -> KlineBatch:
+        r = requests.get(BASE_URL, params=params, timeout=10)
+        r.raise_for_status()
+        data = r.json()
+        
+        # [open_time, "open", "high", "low", "close", "volume", ...] -> колонки float64 за один проход NumPy
+        block = np.array([k[:6] for k in data], dtype=np.float64).reshape(-1, 6)
+        return KlineBatch.from_block(symbol, block.T)
@@ -0,0 +1,123 @@
+import os
+import inspect
+import hashlib
+import logging
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Optional
+import numpy as np
+import pandas as pd
+from config import FEATURE_CACHE_DIR, FEATURE_CACHE_MAX_MB
+
+logger = logging.getLogger(__name__)
+
+INDEX = "__index__"
+
+
+@lru_cache(maxsize=None)
+def code_version(*functions: Callable) -> str:
+    """Версия кода признаков: хэш исходников функций (и модулей) и версий pandas/numpy"""
+    h = hashlib.sha256(f"pandas={pd.__version__};numpy={np.__version__}".encode())
+    for fn in functions:
+        h.update(inspect.getsource(fn).encode())
+    return h.hexdigest()[:16]
+
+
+def candles_checksum(df: pd.DataFrame) -> str:
+    """Контрольная сумма свечей: имена, типы и сырые байты колонок (быстрее hash_pandas_object)"""
+    h = hashlib.sha256()
+    for col in df.columns:
+        arr = np.ascontiguousarray(df[col].to_numpy())
+        if arr.dtype == object:
+            raise TypeError(f"Column {col!r} has object dtype")
+        h.update(f"{col}:{arr.dtype.str}:{len(arr)};".encode())
+        h.update(arr.view(np.uint8))
+    return h.hexdigest()
+
+
+class FeatureCache:
+    """
+    Кэш результатов чистых функций признаков (add_features, add_htf_features) на диске.
+    Ключ: symbol, timeframe, контрольная сумма входных свечей и версия кода функции,
+    так что изменение данных или кода дает промах, а не устаревший результат.
+    Один файл .npz (без сжатия) на результат: колонки с исходными типами и индекс.
+    Размер ограничен max_bytes: при превышении удаляются давно не читавшиеся
+    файлы (mtime обновляется при каждом попадании).
+    """
+
+    def __init__(self, root: Path = FEATURE_CACHE_DIR, max_bytes: int = FEATURE_CACHE_MAX_MB << 20):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, symbol: str, timeframe: str, key: str) -> Path:
+        return self.root / f"{symbol.replace('/', '_')}_{timeframe}_{key}.npz"
+
+    def key(self, fn: Callable, *frames: pd.DataFrame, depends: tuple = ()) -> str:
+        h = hashlib.sha256(f"{fn.__module__}.{fn.__qualname__}:{code_version(fn, *depends)}".encode())
+        for df in frames:
+            h.update(candles_checksum(df).encode())
+        return h.hexdigest()[:32]
+
+    def memoize(
+        self, fn: Callable, *frames: pd.DataFrame, symbol: str = "", timeframe: str = "", depends: tuple = ()
+    ) -> pd.DataFrame:
+        """
+        fn(*frames) из кэша или с вычислением и сохранением.
+        depends - функции, которые вызывает fn: их код тоже входит в версию.
+        """
+        path = self.path(symbol, timeframe, self.key(fn, *frames, depends=depends))
+        df = self.load(path)
+        if df is not None:
+            self.hits += 1
+            return df
+        self.misses += 1
+        df = fn(*frames)
+        self.save(path, df)
+        return df
+
+    def load(self, path: Path) -> Optional[pd.DataFrame]:
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                arrays = {name: data[name] for name in data.files}
+        except (FileNotFoundError, ValueError, OSError):
+            return None
+        try:
+            os.utime(path)  # LRU: время последнего чтения
+        except FileNotFoundError:
+            pass  # вытеснен другим процессом после чтения
+        index = arrays.pop(INDEX)
+        return pd.DataFrame(arrays, index=pd.Index(index), copy=False)
+
+    def save(self, path: Path, df: pd.DataFrame):
+        arrays = {str(col): df[col].to_numpy() for col in df.columns}
+        if any(arr.dtype == object for arr in arrays.values()) or INDEX in arrays:
+            logger.warning(f"Not caching {path.name}: unsupported columns")
+            return
+        arrays[INDEX] = df.index.to_numpy()
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.name}.tmp{os.getpid()}")
+        with open(tmp, "wb") as f:  # через файл: np.savez не добавит .npz к имени
+            np.savez(f, **arrays)
+        os.replace(tmp, path)
+        self.evict()
+
+    def size(self) -> int:
+        return sum(p.stat().st_size for p in self.root.glob("*.npz"))
+
+    def evict(self):
+        """Удаляет самые давно использованные файлы, пока кэш больше max_bytes"""
+        entries = []
+        for p in self.root.glob("*.npz"):
+            try:
+                st = p.stat()
+            except FileNotFoundError:
+                continue  # удален другим процессом
+            entries.append((st.st_mtime, st.st_size, p))
+        total = sum(size for _, size, _ in entries)
+        for _, size, p in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            p.unlink(missing_ok=True)
+            total -= size
@@ -0,0 +1,364 @@
+import math
+import logging
+from collections import deque
+from typing import Dict, List, Optional
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+SR_LOOKBACK = 50
+
+# Порядок колонок такой же, как после add_features + add_htf_features
+LTF_COLUMNS = [
+    'RSI', 'MACD_line', 'MACD_signal', 'MACD_hist', 'ATR', 'Log_Ret',
+    'volume_ma_20', 'Vol_Rel',
+    'RSI_lag_1', 'RSI_lag_2', 'RSI_lag_3',
+    'Log_Ret_lag_1', 'Log_Ret_lag_2', 'Log_Ret_lag_3',
+    'Vol_Rel_lag_1', 'Vol_Rel_lag_2', 'Vol_Rel_lag_3',
+    'hour_sin', 'day_of_week', 'EMA_200', 'Trend',
+    'Resistance', 'Support', 'Dist_to_Resistance', 'Dist_to_Support', 'SR_Position',
+]
+HTF_COLUMNS = ['HTF_RSI', 'HTF_ATR', 'HTF_MACD_hist', 'HTF_EMA_50', 'HTF_Trend', 'HTF_Log_Ret']
+
+
+def asof_rows(left_ts: np.ndarray, right_ts: np.ndarray) -> np.ndarray:
+    """
+    Для каждого left_ts - номер последней строки right_ts с временем <= него, -1 если
+    такой нет (строки merge_asof direction='backward'). Оба массива по возрастанию.
+    """
+    return np.searchsorted(right_ts, left_ts, side='right') - 1
+
+
+def _div(a: float, b: float) -> float:
+    """Деление с семантикой numpy (inf/nan вместо исключения)"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return float(np.float64(a) / np.float64(b))
+
+
+class _EWM:
+    """ewm(alpha, adjust=False), опционально с SMA-инициализацией как в pandas_ta (presma)"""
+    __slots__ = ('alpha', 'presma', 'value', '_seed')
+
+    def __init__(self, alpha: float, presma: int = 0):
+        self.alpha = alpha
+        self.presma = presma
+        self.value = math.nan
+        self._seed: List[float] = []
+
+    def update(self, x: float) -> float:
+        if self.presma and len(self._seed) < self.presma:
+            self._seed.append(x)
+            if len(self._seed) == self.presma:
+                self.value = sum(self._seed) / self.presma
+            return self.value
+        if math.isnan(self.value):
+            self.value = x
+        else:
+            self.value = (1 - self.alpha) * self.value + self.alpha * x
+        return self.value
+
+
+class _RollingExtreme:
+    """Скользящий max/min за окно на монотонной очереди (амортизированно O(1))"""
+    __slots__ = ('window', 'is_max', '_q', '_i')
+
+    def __init__(self, window: int, is_max: bool):
+        self.window = window
+        self.is_max = is_max
+        self._q: deque = deque()  # (index, value)
+        self._i = 0
+
+    def update(self, x: float) -> float:
+        q = self._q
+        if self.is_max:
+            while q and q[-1][1] <= x:
+                q.pop()
+        else:
+            while q and q[-1][1] >= x:
+                q.pop()
+        q.append((self._i, x))
+        if q[0][0] <= self._i - self.window:
+            q.popleft()
+        self._i += 1
+        return q[0][1]
+
+
+class StreamingFeatureEngine:
+    """
+    Инкрементальный аналог etl_pipeline.add_features для одного символа.
+    Каждая новая закрытая свеча обновляет состояние индикаторов за O(1).
+    """
+
+    def __init__(self):
+        self.last_ts: Optional[pd.Timestamp] = None
+        self.bars = 0
+        self._prev_close = math.nan
+        # RSI(14): RMA приростов/падений
+        self._rsi_up = _EWM(1 / 14)
+        self._rsi_down = _EWM(1 / 14)
+        # MACD(12, 26, 9): EMA с SMA-инициализацией
+        self._ema_fast = _EWM(2 / 13, presma=12)
+        self._ema_slow = _EWM(2 / 27, presma=26)
+        self._macd_signal = _EWM(2 / 10, presma=9)
+        # ATR(14): RMA true range, первые 14 значений усредняются
+        self._atr = _EWM(1 / 14, presma=14)
+        self._ema_200 = _EWM(2 / 201)
+        self._vol_window: deque = deque(maxlen=20)
+        self._vol_sum = 0.0
+        self._history: Dict[str, deque] = {c: deque([math.nan] * 3, maxlen=3) for c in ('RSI', 'Log_Ret', 'Vol_Rel')}
+        self._high_max = _RollingExtreme(SR_LOOKBACK, is_max=True)
+        self._low_min = _RollingExtreme(SR_LOOKBACK, is_max=False)
+        self._resistance = math.nan
+        self._support = math.nan
+
+    def update(self, timestamp: pd.Timestamp, open_: float, high: float, low: float,
+               close: float, volume: float) -> Dict[str, float]:
+        """Добавляет закрытую свечу и возвращает строку признаков (с NaN в период прогрева)"""
+        row: Dict[str, float] = {}
+        prev_close = self._prev_close
+
+        # RSI
+        if math.isnan(prev_close):
+            rsi = math.nan
+        else:
+            diff = close - prev_close
+            up = self._rsi_up.update(max(diff, 0.0))
+            down = self._rsi_down.update(min(diff, 0.0))
+            rsi = _div(100 * up, up + abs(down))
+        row['RSI'] = rsi
+
+        # MACD
+        macd = self._ema_fast.update(close) - self._ema_slow.update(close)
+        signal = self._macd_signal.update(macd) if not math.isnan(macd) else math.nan
+        row['MACD_line'] = macd
+        row['MACD_signal'] = signal
+        row['MACD_hist'] = macd - signal
+
+        # ATR
+        tr = high - low
+        if not math.isnan(prev_close):
+            tr = max(tr, abs(high - prev_close), abs(prev_close - low))
+        atr = self._atr.update(tr)
+        row['ATR'] = atr
+
+        row['Log_Ret'] = math.log(close / prev_close) if not math.isnan(prev_close) else math.nan
+
+        # Объем
+        if len(self._vol_window) == self._vol_window.maxlen:
+            self._vol_sum -= self._vol_window[0]
+        self._vol_window.append(volume)
+        self._vol_sum += volume
+        vol_ma = self._vol_sum / len(self._vol_window)
+        row['volume_ma_20'] = vol_ma
+        row['Vol_Rel'] = _div(volume, vol_ma)
+
+        # Лаги: история хранит значения трех предыдущих баров (новейшее справа)
+        for col in ('RSI', 'Log_Ret', 'Vol_Rel'):
+            hist = self._history[col]
+            for i in range(1, 4):
+                row[f'{col}_lag_{i}'] = hist[-i]
+            hist.append(row[col])
+
+        row['hour_sin'] = np.sin(2 * np.pi * timestamp.hour / 24)
+        row['day_of_week'] = timestamp.dayofweek
+
+        ema_200 = self._ema_200.update(close)
+        row['EMA_200'] = ema_200
+        row['Trend'] = int(close > ema_200)
+
+        # S/R по прошлым барам: значения окна, посчитанные на предыдущей свече
+        resistance, support = self._resistance, self._support
+        row['Resistance'] = resistance
+        row['Support'] = support
+        row['Dist_to_Resistance'] = _div(resistance - close, atr)
+        row['Dist_to_Support'] = _div(close - support, atr)
+        sr_pos = _div(close - support, resistance - support)
+        row['SR_Position'] = sr_pos if math.isnan(sr_pos) else min(max(sr_pos, 0.0), 1.0)
+        self._resistance = self._high_max.update(high)
+        self._support = self._low_min.update(low)
+
+        self._prev_close = close
+        self.last_ts = timestamp
+        self.bars += 1
+        return row
+
+
+class StreamingHTFEngine:
+    """
+    Инкрементальный аналог HTF части add_htf_features.
+    Состояние обновляется только ЗАКРЫТЫМИ HTF свечами; строка для текущей
+    HTF свечи строится из состояния предыдущей (shift(1)) и её close (Log_Ret).
+    """
+
+    def __init__(self):
+        self.last_ts: Optional[pd.Timestamp] = None
+        self.bars = 0
+        self._prev_close = math.nan
+        self._rsi_up = _EWM(1 / 14)
+        self._rsi_down = _EWM(1 / 14)
+        self._atr = _EWM(1 / 14, presma=14)
+        self._ema_fast = _EWM(2 / 13, presma=12)
+        self._ema_slow = _EWM(2 / 27, presma=26)
+        self._macd_signal = _EWM(2 / 10, presma=9)
+        self._ema_50 = _EWM(2 / 51)
+        self._state = {'HTF_RSI': math.nan, 'HTF_ATR': math.nan, 'HTF_MACD_hist': math.nan, 'HTF_EMA_50': math.nan}
+
+    def update(self, timestamp: pd.Timestamp, high: float, low: float, close: float):
+        prev_close = self._prev_close
+        if math.isnan(prev_close):
+            rsi = math.nan
+            tr = high - low
+        else:
+            diff = close - prev_close
+            up = self._rsi_up.update(max(diff, 0.0))
+            down = self._rsi_down.update(min(diff, 0.0))
+            rsi = _div(100 * up, up + abs(down))
+            tr = max(high - low, abs(high - prev_close), abs(prev_close - low))
+        macd = self._ema_fast.update(close) - self._ema_slow.update(close)
+        signal = self._macd_signal.update(macd) if not math.isnan(macd) else math.nan
+        self._state = {
+            'HTF_RSI': rsi,
+            'HTF_ATR': self._atr.update(tr),
+            'HTF_MACD_hist': macd - signal,
+            'HTF_EMA_50': self._ema_50.update(close),
+        }
+        self._prev_close = close
+        self.last_ts = timestamp
+        self.bars += 1
+
+    def row(self, close: float) -> Dict[str, float]:
+        """Признаки для HTF свечи, идущей следом за последней закрытой"""
+        prev_close = self._prev_close
+        row = dict(self._state)
+        row['HTF_Trend'] = int(prev_close > row['HTF_EMA_50'])
+        row['HTF_Log_Ret'] = math.log(close / prev_close) if not math.isnan(prev_close) else math.nan
+        return row
+
+
+class SymbolFeatureStream:
+    """
+    Потоковые признаки одного символа для живого бота.
+    Принимает те же DataFrame, что и add_features/add_htf_features, но
+    прогоняет через состояние только свечи, появившиеся с прошлого вызова.
+    Если история не стыкуется с состоянием (первый вызов, разрыв) - пересев.
+    """
+
+    def __init__(self):
+        self.ltf = StreamingFeatureEngine()
+        self.htf = StreamingHTFEngine()
+        self._last_row: Optional[Dict[str, float]] = None
+
+    def _sync_ltf(self, df: pd.DataFrame):
+        ts = df['timestamp'].values
+        start = 0
+        if self.ltf.last_ts is not None:
+            pos = int(np.searchsorted(ts, np.datetime64(self.ltf.last_ts), side='left'))
+            if pos < len(ts) and ts[pos] == np.datetime64(self.ltf.last_ts):
+                start = pos + 1
+            else:
+                logger.info("Feature stream out of sync, reseeding from history")
+                self.ltf = StreamingFeatureEngine()
+                self._last_row = None
+
+        if start >= len(df):
+            return
+        tail = df.iloc[start:]
+        o, h, l, c, v = (tail[col].to_numpy(dtype=float) for col in ('open', 'high', 'low', 'close', 'volume'))
+        stamps = pd.DatetimeIndex(tail['timestamp'])
+        for i in range(len(tail)):
+            row = self.ltf.update(stamps[i], o[i], h[i], l[i], c[i], v[i])
+            row.update({'timestamp': stamps[i], 'open': o[i], 'high': h[i], 'low': l[i], 'close': c[i], 'volume': v[i]})
+            self._last_row = row
+
+    def _htf_row(self, ts: pd.Timestamp, htf_df: pd.DataFrame) -> Optional[Dict[str, float]]:
+        htf_ts = htf_df['timestamp'].values
+        # Строка HTF, которую выбрал бы merge_asof(direction='backward')
+        r = int(np.searchsorted(htf_ts, np.datetime64(ts), side='right')) - 1
+        if r < 0:
+            return None
+
+        start = 0
+        if self.htf.last_ts is not None:
+            pos = int(np.searchsorted(htf_ts, np.datetime64(self.htf.last_ts), side='left'))
+            if pos < r and htf_ts[pos] == np.datetime64(self.htf.last_ts):
+                start = pos + 1
+            else:
+                # Разрыв или состояние ушло дальше нужной строки - пересчитываем
+                self.htf = StreamingHTFEngine()
+
+        h, l, c = (htf_df[col].to_numpy(dtype=float) for col in ('high', 'low', 'close'))
+        for i in range(start, r):
+            self.htf.update(pd.Timestamp(htf_ts[i]), h[i], l[i], c[i])
+        return self.htf.row(c[r])
+
+    def latest(self, df: pd.DataFrame, htf_df: pd.DataFrame, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        Строка признаков последней свечи df - то же, что
+        add_htf_features(add_features(df), htf_df).iloc[[-1]], либо пустой DataFrame.
+        columns - признаки модели: строка отбрасывается только из-за NaN в них
+        (остальные колонки могут быть NaN, пока история короче их разогрева).
+        """
+        if df.empty or htf_df.empty:
+            return pd.DataFrame()
+        self._sync_ltf(df)
+        row = self._last_row
+        if row is None:
+            return pd.DataFrame()
+        htf_row = self._htf_row(row['timestamp'], htf_df)
+        if htf_row is None:
+            return pd.DataFrame()
+
+        out = pd.DataFrame([{**row, **htf_row}])
+        out = out[list(df.columns) + LTF_COLUMNS + HTF_COLUMNS]
+        out['day_of_week'] = out['day_of_week'].astype('int32')
+        out['HTF_Trend'] = out['HTF_Trend'].astype(float)  # после merge_asof колонка float
+        return out.dropna(subset=columns)
+
+
+def check_parity(df: pd.DataFrame, htf_df: pd.DataFrame, rtol: float = 1e-7, atol: float = 1e-9) -> pd.Series:
+    """
+    Сверка потокового движка с пакетным путем (add_features + add_htf_features).
+    Свечи подаются по одной, как в живом боте. Возвращает максимальное
+    отклонение по каждой колонке; AssertionError при расхождении.
+    """
+    from etl_pipeline import add_features, add_htf_features
+
+    batch = add_htf_features(add_features(df), htf_df).set_index('timestamp')
+    stream = SymbolFeatureStream()
+    rows = []
+    for i in range(len(df)):
+        row = stream.latest(df.iloc[:i + 1], htf_df)
+        if not row.empty:
+            rows.append(row)
+    if not rows:
+        raise AssertionError("Streaming engine produced no rows")
+    live = pd.concat(rows).set_index('timestamp')
+
+    missing = batch.index.symmetric_difference(live.index)
+    if len(missing):
+        raise AssertionError(f"Row sets differ at {len(missing)} timestamps, first: {missing[0]}")
+
+    cols = LTF_COLUMNS + HTF_COLUMNS
+    a = batch.loc[live.index, cols].to_numpy(dtype=float)
+    b = live[cols].to_numpy(dtype=float)
+    diff = pd.Series(np.nanmax(np.abs(a - b), axis=0), index=cols)
+    bad = ~np.isclose(a, b, rtol=rtol, atol=atol, equal_nan=True)
+    if bad.any():
+        worst = diff[bad.any(axis=0)]
+        raise AssertionError(f"Feature drift between batch and stream:\n{worst}")
+    return diff
+
+
+if __name__ == '__main__':
+    import sqlite3
+    from config import DB_PATH, SYMBOLS, TIMEFRAME
+    from etl_pipeline import load_from_db, load_htf
+
+    conn = sqlite3.connect(DB_PATH)
+    for symbol in SYMBOLS:
+        df = load_from_db(conn, symbol, TIMEFRAME).tail(3000).reset_index(drop=True)
+        htf_df = load_htf(conn, symbol)
+        diff = check_parity(df, htf_df)
+        logger.info(f"{symbol}: parity OK, max abs diff {diff.max():.3e}")
+    conn.close()
@@ -0,0 +1,243 @@
+"""
+Реестр признаков: у каждого - входы (колонки свечей или другие признаки), расчет
+на панели символов (ядра indicators.py) и сколько истории ему нужно. По
+feature_names модели resolve() отбирает нужный подграф, evaluate() считает только
+его, а required_history() - минимальную историю по таймфреймам (лимит свечей
+живого бота и разогрев инкрементального ETL).
+"""
+import sys
+import pickle
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+from src.infrastructure import indicators
+from src.infrastructure.feature_engine import LTF_COLUMNS, HTF_COLUMNS, SR_LOOKBACK
+
+logger = logging.getLogger(__name__)
+
+RAW_COLUMNS = ('timestamp', 'open', 'high', 'low', 'close', 'volume')
+LTF, HTF = 'ltf', 'htf'
+
+
+def warmup_bars(alpha: float, tol: float = np.finfo(np.float64).eps) -> int:
+    """Баров истории, за которые вклад начального значения EMA/RMA с коэффициентом alpha падает ниже tol"""
+    return int(np.ceil(np.log(tol) / np.log(1 - alpha)))
+
+
+@dataclass(frozen=True)
+class Feature:
+    """
+    Узел графа признаков.
+    lookback - свечей входов до первого значения (окно - 1, сдвиг, presma);
+    alpha - коэффициент EMA/RMA: значение зависит от всей истории, вклад отброшенной
+    убывает как (1 - alpha)^n, поэтому к lookback добавляется warmup_bars(alpha, tol);
+    timeframe - LTF (TIMEFRAME) или HTF (HTF_TIMEFRAME, история в свечах старшего ТФ);
+    dtype - тип колонки в DataFrame (None - как вернул compute).
+    """
+    name: str
+    inputs: Tuple[str, ...]
+    compute: Callable[..., np.ndarray]
+    lookback: int = 0
+    alpha: Optional[float] = None
+    timeframe: str = LTF
+    dtype: Optional[str] = None
+
+    def warmup(self, tol: float) -> int:
+        return self.lookback + (warmup_bars(self.alpha, tol) if self.alpha else 0)
+
+
+def _macd_line(close):
+    return indicators.ema(close, 12, presma=True) - indicators.ema(close, 26, presma=True)
+
+
+def _hour(ts):
+    return ts // 3_600_000 % 24
+
+
+def _registry(*groups: Iterable[Feature]) -> Dict[str, Feature]:
+    features = {}
+    for f in (f for group in groups for f in group):
+        if f.name in features or f.name in RAW_COLUMNS:
+            raise ValueError(f"Duplicate feature {f.name}")
+        features[f.name] = f
+    return features
+
+
+def _lags(column: str) -> List[Feature]:
+    return [
+        Feature(f'{column}_lag_{i}', (column,), lambda x, i=i: indicators.shift(x, i), lookback=i)
+        for i in range(1, 4)
+    ]
+
+
+# Те же формулы, что были в add_features / htf_indicators (значения pandas_ta)
+FEATURES: Dict[str, Feature] = _registry(
+    [
+        Feature('RSI', ('close',), lambda c: indicators.rsi(c, 14), lookback=1, alpha=1 / 14),
+        Feature('MACD_line', ('close',), _macd_line, lookback=25, alpha=2 / 27),
+        Feature('MACD_signal', ('MACD_line',), lambda m: indicators.ema(m, 9, presma=True), lookback=8, alpha=2 / 10),
+        Feature('MACD_hist', ('MACD_line', 'MACD_signal'), lambda m, s: m - s),
+        Feature('ATR', ('high', 'low', 'close'), lambda h, l, c: indicators.atr(h, l, c, 14), lookback=14, alpha=1 / 14),
+        Feature('Log_Ret', ('close',), lambda c: np.log(c / indicators.shift(c, 1)), lookback=1),
+        # Скользящее среднее текущего момента (включая текущий бар)
+        Feature('volume_ma_20', ('volume',), lambda v: indicators.rolling_mean(v, 20), lookback=19),
+        Feature('Vol_Rel', ('volume', 'volume_ma_20'), lambda v, ma: v / ma),
+    ],
+    _lags('RSI'), _lags('Log_Ret'), _lags('Vol_Rel'),
+    [
+        # timestamp в панели - мс от эпохи, int64 (1970-01-01 - четверг, dayofweek 3)
+        Feature('hour_sin', ('timestamp',), lambda ts: np.sin(2 * np.pi * _hour(ts) / 24)),
+        Feature('day_of_week', ('timestamp',), lambda ts: (ts // 86_400_000 + 3) % 7, dtype='int32'),
+        Feature('EMA_200', ('close',), lambda c: indicators.ema(c, 200), alpha=2 / 201),
+        # NaN в сравнении -> 0, как astype(int) у pandas
+        Feature('Trend', ('close', 'EMA_200'), lambda c, e: (c > e).astype(int)),
+        # Уровни по ПРОШЛЫМ данным (shift(1) ОБЯЗАТЕЛЕН)
+        Feature('Resistance', ('high',), lambda h: indicators.shift(indicators.rolling_max(h, SR_LOOKBACK), 1),
+                lookback=SR_LOOKBACK),
+        Feature('Support', ('low',), lambda l: indicators.shift(indicators.rolling_min(l, SR_LOOKBACK), 1),
+                lookback=SR_LOOKBACK),
+        Feature('Dist_to_Resistance', ('Resistance', 'close', 'ATR'), lambda r, c, a: (r - c) / a),
+        Feature('Dist_to_Support', ('close', 'Support', 'ATR'), lambda c, s, a: (c - s) / a),
+        Feature('SR_Position', ('close', 'Resistance', 'Support'), lambda c, r, s: np.clip((c - s) / (r - s), 0, 1)),
+    ],
+    [
+        # HTF: shift(1) - только ЗАВЕРШЕННЫЕ свечи старшего ТФ (timestamp - open time)
+        Feature('HTF_RSI', ('close',), lambda c: indicators.shift(indicators.rsi(c, 14), 1),
+                lookback=2, alpha=1 / 14, timeframe=HTF),
+        Feature('HTF_ATR', ('high', 'low', 'close'), lambda h, l, c: indicators.shift(indicators.atr(h, l, c, 14), 1),
+                lookback=15, alpha=1 / 14, timeframe=HTF),
+        Feature('HTF_MACD_line', ('close',), _macd_line, lookback=25, alpha=2 / 27, timeframe=HTF),
+        Feature('HTF_MACD_signal', ('HTF_MACD_line',), lambda m: indicators.ema(m, 9, presma=True),
+                lookback=8, alpha=2 / 10, timeframe=HTF),
+        Feature('HTF_MACD_hist', ('HTF_MACD_line', 'HTF_MACD_signal'), lambda m, s: indicators.shift(m - s, 1),
+                lookback=1, timeframe=HTF),
+        Feature('HTF_EMA_50', ('close',), lambda c: indicators.shift(indicators.ema(c, 50), 1),
+                lookback=1, alpha=2 / 51, timeframe=HTF),
+        Feature('HTF_Trend', ('close', 'HTF_EMA_50'), lambda c, e: (indicators.shift(c, 1) > e).astype(int),
+                lookback=1, timeframe=HTF),
+        Feature('HTF_Log_Ret', ('close',), lambda c: np.log(c / indicators.shift(c, 1)), lookback=1, timeframe=HTF),
+    ],
+)
+
+
+def split(names: Iterable[str]) -> Tuple[List[str], List[str]]:
+    """Признаки по таймфреймам: (LTF в порядке LTF_COLUMNS, HTF в порядке HTF_COLUMNS)"""
+    names = set(names) - set(RAW_COLUMNS)
+    unknown = names - set(FEATURES)
+    if unknown:
+        raise KeyError(f"Unknown features: {sorted(unknown)}")
+    ltf = [c for c in LTF_COLUMNS if c in names]
+    htf = [c for c in HTF_COLUMNS if c in names]
+    # Промежуточные узлы (например, HTF_MACD_line) - после колонок хранилища
+    ltf += sorted(c for c in names if FEATURES[c].timeframe == LTF and c not in ltf)
+    htf += sorted(c for c in names if FEATURES[c].timeframe == HTF and c not in htf)
+    return ltf, htf
+
+
+def resolve(names: Iterable[str]) -> List[str]:
+    """Признаки names со всеми зависимостями в порядке расчета (колонки свечей не входят)"""
+    order: List[str] = []
+    seen = set(RAW_COLUMNS)
+
+    def visit(name: str, path: Tuple[str, ...]):
+        if name in seen:
+            return
+        if name in path:
+            raise ValueError(f"Cycle in feature graph: {' -> '.join(path + (name,))}")
+        if name not in FEATURES:
+            raise KeyError(f"Unknown feature {name}")
+        for dep in FEATURES[name].inputs:
+            visit(dep, path + (name,))
+        seen.add(name)
+        order.append(name)
+
+    for name in names:
+        visit(name, ())
+    return order
+
+
+def node_history(names: Iterable[str], tol: float) -> Dict[str, int]:
+    """
+    Свечей своего таймфрейма, нужных каждому узлу подграфа names: значение есть и
+    отброшенная история влияет на EMA/RMA меньше чем на tol. Разогрев зависимостей
+    складывается (MACD_signal разогревается после MACD_line).
+    """
+    need: Dict[str, int] = {}
+    for name in resolve(names):
+        f = FEATURES[name]
+        need[name] = f.warmup(tol) + max((need.get(i, 0) for i in f.inputs), default=0)
+    return {name: n + 1 for name, n in need.items()}
+
+
+def required_history(names: Iterable[str], tol: float) -> Dict[str, int]:
+    """
+    Минимум свечей на символ для признаков names: {LTF: n, HTF: m}. Хотя бы одна
+    свеча каждого ТФ нужна всегда (к LTF свече присоединяется HTF строка).
+    """
+    bars = {LTF: 1, HTF: 1}
+    for name, n in node_history(names, tol).items():
+        tf = FEATURES[name].timeframe
+        bars[tf] = max(bars[tf], n)
+    return bars
+
+
+def evaluate(names: Iterable[str], frames: List[pd.DataFrame]) -> Dict[str, np.ndarray]:
+    """
+    Признаки names (одного таймфрейма) для свечей нескольких символов: считается
+    только нужный подграф, каждый узел - одним вызовом на панель (символы × время,
+    короткие истории дополнены NaN слева). Возвращает панели всех посчитанных узлов.
+    """
+    order = resolve(names)
+    if len({FEATURES[name].timeframe for name in order}) > 1:
+        raise ValueError("evaluate() takes features of one timeframe (see split())")
+    raw = sorted({i for name in order for i in FEATURES[name].inputs if i in RAW_COLUMNS})
+    values: Dict[str, np.ndarray] = {}
+    for column in raw:
+        if column == 'timestamp':
+            # мс от эпохи, int64 (слева от истории - 0: эти ячейки в результат не попадают)
+            values[column] = indicators.stack([
+                f['timestamp'].to_numpy().astype('datetime64[ms]').astype(np.int64) for f in frames
+            ], fill=0, dtype=np.int64)
+        else:
+            values[column] = indicators.panel(frames, column)
+    for name in order:
+        f = FEATURES[name]
+        values[name] = f.compute(*(values[i] for i in f.inputs))
+    return {name: values[name] for name in order}
+
+
+def load_feature_names(models_dir: Path) -> List[str]:
+    with open(Path(models_dir) / "features.pkl", "rb") as f:
+        return pickle.load(f)
+
+
+def describe(names: List[str], tol: float) -> pd.DataFrame:
+    """Подграф модели: таймфрейм, входы и нужная история каждого узла"""
+    history = node_history(names, tol)
+    return pd.DataFrame([
+        {
+            'feature': name,
+            'timeframe': FEATURES[name].timeframe,
+            'inputs': ', '.join(FEATURES[name].inputs),
+            'bars': bars,
+            'model': name in names,
+        }
+        for name, bars in history.items()
+    ])
+
+
+if __name__ == '__main__':
+    from config import MODELS_DIR, FEATURE_WARMUP_TOL, TIMEFRAME, HTF_TIMEFRAME
+
+    models_dir = Path(sys.argv[1]) if len(sys.argv) > 1 else MODELS_DIR
+    names = load_feature_names(models_dir)
+    print(describe(names, FEATURE_WARMUP_TOL).to_string(index=False))
+    history = required_history(names, FEATURE_WARMUP_TOL)
+    nodes = resolve(names)
+    skipped = [c for c in LTF_COLUMNS + HTF_COLUMNS if c not in nodes]
+    print(f"\n{len(names)} model features -> {len(nodes)} of {len(FEATURES)} graph nodes, "
+          f"not computed: {', '.join(skipped) or '-'}")
+    print(f"History (tol {FEATURE_WARMUP_TOL:g}): {history[LTF]} x {TIMEFRAME}, {history[HTF]} x {HTF_TIMEFRAME}")
@@ -0,0 +1,154 @@
+import os
+import json
+import shutil
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional
+import numpy as np
+import pandas as pd
+from config import FEATURE_STORE_DIR
+
+logger = logging.getLogger(__name__)
+
+META_FILE = "_meta.json"
+TIMESTAMP = "timestamp"
+
+
+class FeatureStore:
+    """
+    Колоночное хранилище признаков: на каждую пару (symbol, timeframe) - каталог,
+    в нем по файлу на колонку (сырые little-endian массивы) и _meta.json
+    (число строк, типы). Чтение через np.memmap: проекция колонок, отбор по
+    диапазону timestamp через searchsorted и срезы без копирования.
+    timestamp хранится как datetime64[ns] и должен быть отсортирован.
+    """
+
+    def __init__(self, root: Path = FEATURE_STORE_DIR):
+        self.root = Path(root)
+
+    def path(self, symbol: str, timeframe: str) -> Path:
+        return self.root / f"{symbol.replace('/', '_')}_{timeframe}"
+
+    def exists(self, symbol: str, timeframe: str) -> bool:
+        return (self.path(symbol, timeframe) / META_FILE).exists()
+
+    def meta(self, symbol: str, timeframe: str) -> dict:
+        with open(self.path(symbol, timeframe) / META_FILE) as f:
+            return json.load(f)
+
+    def columns(self, symbol: str, timeframe: str) -> List[str]:
+        return list(self.meta(symbol, timeframe)["columns"])
+
+    # --- запись ---
+
+    @staticmethod
+    def _column_array(series: pd.Series) -> np.ndarray:
+        if pd.api.types.is_datetime64_any_dtype(series):
+            return series.to_numpy().astype("datetime64[ns]").view("<i8")
+        arr = series.to_numpy()
+        if arr.dtype.kind not in "biuf":
+            raise TypeError(f"Column {series.name!r} has unsupported dtype {arr.dtype}")
+        return arr.astype(arr.dtype.newbyteorder("<"), copy=False)
+
+    @staticmethod
+    def _write_meta(path: Path, meta: dict):
+        tmp = path / (META_FILE + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, path / META_FILE)
+
+    def write(self, symbol: str, timeframe: str, df: pd.DataFrame):
+        """Полная перезапись (через временный каталог и rename)"""
+        path = self.path(symbol, timeframe)
+        tmp = path.with_name(path.name + ".tmp")
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+
+        meta = {"rows": len(df), "columns": {}}
+        for col in df.columns:
+            arr = self._column_array(df[col])
+            arr.tofile(tmp / f"{col}.bin")
+            meta["columns"][col] = "datetime64[ns]" if col == TIMESTAMP else arr.dtype.str
+        self._write_meta(tmp, meta)
+
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp, path)
+
+    def upsert(self, symbol: str, timeframe: str, df: pd.DataFrame):
+        """
+        Замена хвоста: строки с timestamp >= df.timestamp[0] отбрасываются, df
+        дописывается в конец файлов колонок. Набор колонок должен совпадать
+        с хранимым, иначе ValueError (хвост без истории не заменит хранилище -
+        нужна полная перезапись write). Не атомарно: meta пишется последней,
+        при сбое посередине нужна полная перезапись.
+        """
+        if len(df) == 0:
+            return
+        if not self.exists(symbol, timeframe):
+            return self.write(symbol, timeframe, df)
+
+        path = self.path(symbol, timeframe)
+        meta = self.meta(symbol, timeframe)
+        if list(df.columns) != list(meta["columns"]):
+            raise ValueError(f"{symbol} {timeframe}: columns differ from the store, full rewrite required")
+        # Типы - по хранимым (int/float одной колонки зависит от NaN в срезе, напр. после merge_asof)
+        arrays = {
+            col: self._column_array(df[col]) if col == TIMESTAMP else self._column_array(df[col]).astype(dtype)
+            for col, dtype in meta["columns"].items()
+        }
+
+        ts = self._memmap(path, TIMESTAMP, meta["columns"][TIMESTAMP], meta["rows"])
+        keep = int(np.searchsorted(ts, arrays[TIMESTAMP][0].view("datetime64[ns]"), side="left"))
+        del ts
+
+        for col, arr in arrays.items():
+            with open(path / f"{col}.bin", "r+b") as f:
+                f.truncate(keep * arr.itemsize)
+                f.seek(0, os.SEEK_END)
+                arr.tofile(f)
+        meta["rows"] = keep + len(df)
+        self._write_meta(path, meta)
+
+    # --- чтение ---
+
+    def _memmap(self, path: Path, col: str, dtype: str, rows: int) -> np.ndarray:
+        if rows == 0:
+            return np.empty(0, dtype=dtype)
+        if dtype == "datetime64[ns]":
+            return np.memmap(path / f"{col}.bin", dtype="<i8", mode="r", shape=(rows,)).view("datetime64[ns]")
+        return np.memmap(path / f"{col}.bin", dtype=dtype, mode="r", shape=(rows,))
+
+    def read_arrays(
+        self,
+        symbol: str,
+        timeframe: str,
+        columns: Optional[List[str]] = None,
+        start=None,
+        end=None,
+    ) -> Dict[str, np.ndarray]:
+        """
+        Колонки как memmap-срезы (без копирования). start/end - включительные
+        границы по timestamp (все, что понимает pd.Timestamp).
+        """
+        path = self.path(symbol, timeframe)
+        meta = self.meta(symbol, timeframe)
+        rows = meta["rows"]
+        dtypes = meta["columns"]
+        columns = list(dtypes) if columns is None else columns
+        missing = [c for c in columns if c not in dtypes]
+        if missing:
+            raise KeyError(f"{symbol} {timeframe}: no columns {missing}")
+
+        lo, hi = 0, rows
+        if start is not None or end is not None:
+            ts = self._memmap(path, TIMESTAMP, dtypes[TIMESTAMP], rows)
+            if start is not None:
+                lo = int(np.searchsorted(ts, np.datetime64(pd.Timestamp(start), "ns"), side="left"))
+            if end is not None:
+                hi = int(np.searchsorted(ts, np.datetime64(pd.Timestamp(end), "ns"), side="right"))
+
+        return {col: self._memmap(path, col, dtypes[col], rows)[lo:hi] for col in columns}
+
+    def read(self, symbol: str, timeframe: str, columns: Optional[List[str]] = None, start=None, end=None) -> pd.DataFrame:
+        arrays = self.read_arrays(symbol, timeframe, columns, start, end)
+        return pd.DataFrame(arrays, copy=False)
@@ -1,38 +1,83 @@
 import logging
 import pandas as pd
 import numpy as np
-import pickle
-from typing import Optional
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
 from catboost import CatBoostClassifier
 from src.domain.contracts import SignalGeneratorInterface, SignalDTO, SignalSide
-from config import MODELS_DIR, CONFIDENCE_THRESHOLD, SL_PCT, TP_PCT
-from etl_pipeline import add_features, add_htf_features
+from config import MODELS_DIR, CONFIDENCE_THRESHOLD, SL_PCT, TP_PCT, TIMEFRAME, HTF_TIMEFRAME, FEATURE_WARMUP_TOL
+from src.infrastructure.feature_engine import SymbolFeatureStream
+from src.infrastructure import feature_graph
+from src.infrastructure.tree_evaluator import ObliviousTreeModel
+from src.infrastructure.metrics import STAGE_SECONDS
 
 logger = logging.getLogger(__name__)
 
+# До этого размера пачки NumPy-вычисление деревьев быстрее вызова CatBoost (benchmark.py tree_eval)
+NUMPY_EVAL_MAX_ROWS = 256
+
 class MLSignalGenerator(SignalGeneratorInterface):
-    def __init__(self):
+    def __init__(self, models_dir: Path = MODELS_DIR):
         self.model = CatBoostClassifier()
-        self.model.load_model(str(MODELS_DIR / "catboost_model.cbm"))
+        self.model.load_model(str(Path(models_dir) / "catboost_model.cbm"))
         
-        with open(MODELS_DIR / "features.pkl", "rb") as f:
-            self.feature_names = pickle.load(f)
+        self.feature_names = feature_graph.load_feature_names(models_dir)
+        # История, после которой признаки модели не зависят от отброшенных свечей (до FEATURE_WARMUP_TOL)
+        history = feature_graph.required_history(self.feature_names, FEATURE_WARMUP_TOL)
+        self.history = {TIMEFRAME: history[feature_graph.LTF], HTF_TIMEFRAME: history[feature_graph.HTF]}
+        logger.info(f"Model needs {self.history[TIMEFRAME]} x {TIMEFRAME} and {self.history[HTF_TIMEFRAME]} x {HTF_TIMEFRAME} candles")
+
+        try:
+            self.evaluator: Optional[ObliviousTreeModel] = ObliviousTreeModel.from_catboost(self.model)
+        except ValueError as e:
+            logger.warning(f"NumPy tree evaluator unavailable, using CatBoost: {e}")
+            self.evaluator = None
+
+        # Потоковые признаки по символам: пересчитываются только новые свечи
+        self.streams: Dict[str, SymbolFeatureStream] = {}
+
+    def required_history(self) -> Dict[str, int]:
+        return dict(self.history)
 
     def generate_signal(self, symbol: str, df: pd.DataFrame, htf_df: pd.DataFrame) -> Optional[SignalDTO]:
-        # ВАЖНО: Используем ту же логику что и в ETL / Backtest
-        df = add_features(df)
-        df = add_htf_features(df, htf_df)
-        
-        if df.empty:
-            logger.warning(f"Empty DataFrame after feature generation for {symbol}")
-            return None
-            
-        current_row = df.iloc[[-1]] # Последняя закрытая свеча
-        current_price = current_row['close'].values[0]
-        
-        # Предсказание
-        probs = self.model.predict_proba(current_row[self.feature_names])[0]
-        
+        signals = self.generate_signals({symbol: (df, htf_df)})
+        return signals[0] if signals else None
+
+    def generate_signals(self, inputs: Dict[str, Tuple[pd.DataFrame, pd.DataFrame]]) -> List[SignalDTO]:
+        # ВАЖНО: Та же логика что и в ETL / Backtest (паритет: feature_engine.check_parity)
+        symbols, rows = [], []
+        for symbol, (df, htf_df) in inputs.items():
+            stream = self.streams.setdefault(symbol, SymbolFeatureStream())
+            with STAGE_SECONDS.time("features"):
+                row = stream.latest(df, htf_df, self.feature_names) # Последняя закрытая свеча
+            if row.empty:
+                logger.warning(f"Empty DataFrame after feature generation for {symbol}")
+                continue
+            symbols.append(symbol)
+            rows.append(row)
+
+        if not rows:
+            return []
+
+        # Один вызов модели на все символы
+        batch = pd.concat(rows, ignore_index=True)
+        with STAGE_SECONDS.time("inference"):
+            probs = self._predict_proba(batch[self.feature_names])
+        prices = batch['close'].to_numpy()
+
+        signals = []
+        for symbol, price, p in zip(symbols, prices, probs):
+            signal = self._to_signal(symbol, float(price), p)
+            if signal:
+                signals.append(signal)
+        return signals
+
+    def _predict_proba(self, X: pd.DataFrame) -> np.ndarray:
+        if self.evaluator is not None and len(X) <= NUMPY_EVAL_MAX_ROWS:
+            return self.evaluator.predict_proba(X)
+        return self.model.predict_proba(X)
+
+    def _to_signal(self, symbol: str, current_price: float, probs: np.ndarray) -> Optional[SignalDTO]:
         p_short, p_neutral, p_long = 0, 0, 0
         if len(probs) == 2:
             p_short, p_long = probs
@@ -0,0 +1,293 @@
+"""
+Индикаторы на NumPy для панели свечей: 2-D float64 (символы × время), один вызов
+на весь набор символов. Значения совпадают с pandas_ta / pandas, которыми
+считались признаки раньше (сверка: check_pandas_ta).
+Короткие истории дополняются NaN слева (panel); внутри строки после первого
+значения пропусков быть не должно - свечи идут подряд.
+"""
+import sys
+import logging
+from typing import Dict, List, Tuple
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+_SCAN_GROWTH = 2.0 ** 40  # предел роста множителя в блоке ewm (точность как у последовательного ewm)
+
+
+def panel(frames: List[pd.DataFrame], column: str) -> np.ndarray:
+    """Колонка нескольких символов: строки выровнены по последней свече, слева NaN"""
+    return stack([f[column].to_numpy(dtype=np.float64) for f in frames])
+
+
+def stack(rows: List[np.ndarray], fill=np.nan, dtype=np.float64) -> np.ndarray:
+    """Ряды разной длины в панель: выравнивание по концу, слева fill"""
+    width = max((len(r) for r in rows), default=0)
+    out = np.full((len(rows), width), fill, dtype=dtype)
+    for i, r in enumerate(rows):
+        if len(r):
+            out[i, width - len(r):] = r
+    return out
+
+
+def first_valid(x: np.ndarray) -> np.ndarray:
+    """Номер первого не-NaN значения в каждой строке (ширина строки, если таких нет)"""
+    valid = ~np.isnan(x)
+    idx = valid.argmax(axis=1)
+    idx[~valid.any(axis=1)] = x.shape[1]
+    return idx
+
+
+def shift(x: np.ndarray, periods: int = 1) -> np.ndarray:
+    """Series.shift по времени"""
+    out = np.full_like(x, np.nan)
+    if periods < x.shape[1]:
+        out[:, periods:] = x[:, :x.shape[1] - periods]
+    return out
+
+
+def _ewm(x: np.ndarray, alpha: float, start: np.ndarray) -> np.ndarray:
+    """
+    ewm(alpha, adjust=False).mean() по строкам, начиная с позиции start строки
+    (там значение = x[start]), до нее NaN. Рекурсия s_t = d*s_{t-1} + alpha*x_t
+    (d = 1 - alpha) в блоках длины B решается в закрытой форме
+        s_{t0+j} = d^(j+1) * s_{t0-1} + alpha * d^j * cumsum(x_k * d^-k),
+    B ограничивает d^-k. Все блоки считаются сразу от нулевого состояния, а
+    состояния на входе блоков c_b = d^B * c_{b-1} + L_b - сканом с удвоением
+    шага (множитель d^B, d^2B, ... быстро уходит в 0, шагов несколько).
+    """
+    rows, width = x.shape
+    if width == 0:
+        return x.copy()
+    # Строки без значений (start == width) считаются от последней позиции и целиком маскируются
+    seed = x[np.arange(rows), np.minimum(start, width - 1)]
+    before = np.arange(width)[None, :] < start[:, None]
+    d = 1.0 - alpha
+    block = width if d <= 0 else min(width, max(1, int(np.log(_SCAN_GROWTH) / -np.log(d))))
+    blocks = -(-width // block)
+    res = np.zeros((rows, blocks * block))
+    res[:, :width] = x
+    # До start подставляем x[start]: постоянный вход рекурсия не меняет
+    np.copyto(res[:, :width], seed[:, None], where=before)
+
+    if d > 0:
+        local = res.reshape(rows, blocks, block)
+        decay = d ** np.arange(block)
+        np.divide(local, decay, out=local)
+        np.cumsum(local, axis=2, out=local)
+        local *= alpha * decay  # каждый блок от нулевого состояния
+
+        carry = np.empty((rows, blocks))  # состояние перед блоком b
+        carry[:, 0] = seed
+        carry[:, 1:] = local[:, :-1, -1]
+        factor, step = d ** block, 1
+        while factor > 0 and step < blocks:
+            carry[:, step:] += factor * carry[:, :-step]
+            factor, step = factor * factor, step * 2
+        local += (d * decay) * carry[:, :, None]
+    res = res[:, :width]
+    res[before] = np.nan
+    return res
+
+
+def _presma_start(x: np.ndarray, length: int) -> Tuple[np.ndarray, np.ndarray]:
+    """pandas_ta presma: среднее первых length значений ставится в их последнюю позицию"""
+    first = first_valid(x)
+    start = first + length - 1
+    ok = start < x.shape[1]
+    x = x.copy()
+    if ok.any():
+        idx = first[ok, None] + np.arange(length)[None, :]
+        x[ok, start[ok]] = np.take_along_axis(x[ok], idx, axis=1).mean(axis=1)
+    return x, np.where(ok, start, x.shape[1])
+
+
+def ema(x: np.ndarray, length: int, presma: bool = False) -> np.ndarray:
+    """
+    presma=False - Series.ewm(span=length, adjust=False).mean();
+    presma=True - pandas_ta ema (инициализация SMA первых length значений).
+    """
+    if presma:
+        x, start = _presma_start(x, length)
+    else:
+        start = first_valid(x)
+    return _ewm(x, 2.0 / (length + 1), start)
+
+
+def rma(x: np.ndarray, length: int, presma: bool = False) -> np.ndarray:
+    """Скользящее Уайлдера (pandas_ta rma): ewm(alpha=1/length, adjust=False)"""
+    if presma:
+        x, start = _presma_start(x, length)
+    else:
+        start = first_valid(x)
+    return _ewm(x, 1.0 / length, start)
+
+
+def rsi(close: np.ndarray, length: int = 14) -> np.ndarray:
+    """pandas_ta rsi (mamode rma)"""
+    diff = close - shift(close, 1)
+    positive = np.where(diff < 0, 0.0, diff)
+    negative = np.where(diff > 0, 0.0, diff)
+    positive_avg = rma(positive, length)
+    negative_avg = rma(negative, length)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return 100 * positive_avg / (positive_avg + np.abs(negative_avg))
+
+
+def macd(close: np.ndarray, fast: int = 12, slow: int = 26, signal: int = 9) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """pandas_ta macd: (линия, сигнальная, гистограмма)"""
+    line = ema(close, fast, presma=True) - ema(close, slow, presma=True)
+    signal_line = ema(line, signal, presma=True)
+    return line, signal_line, line - signal_line
+
+
+def true_range(high: np.ndarray, low: np.ndarray, close: np.ndarray) -> np.ndarray:
+    """pandas_ta true_range: как non_zero_range, epsilon ко всей строке, если где-то high == low"""
+    hl = high - low
+    hl = hl + np.where((hl == 0).any(axis=1), sys.float_info.epsilon, 0.0)[:, None]
+    prev_close = shift(close, 1)
+    return np.fmax(np.fmax(np.abs(hl), np.abs(high - prev_close)), np.abs(prev_close - low))
+
+
+def atr(high: np.ndarray, low: np.ndarray, close: np.ndarray, length: int = 14) -> np.ndarray:
+    """pandas_ta atr (rma true range с presma)"""
+    return rma(true_range(high, low, close), length, presma=True)
+
+
+def _window_sum(x: np.ndarray, window: int) -> np.ndarray:
+    """
+    Сумма последних window значений (в начале строки - сколько есть) за log2(window)
+    сложений: суммы блоков 1, 2, 4, ... складываются по двоичной записи window.
+    Разность накопленных сумм быстрее, но теряет точность на длинной истории, и
+    хвост, пересчитанный инкрементально, не совпал бы с полной пересборкой.
+    """
+    total, covered, power, size = None, 0, x, 1
+    while window:
+        if window & 1:
+            if total is None:
+                total = power.copy()
+            else:
+                total[:, covered:] += power[:, :power.shape[1] - covered]
+            covered += size
+        window >>= 1
+        if window:
+            power = power.copy() if power is x else power
+            power[:, size:] += power[:, :power.shape[1] - size].copy()
+            size *= 2
+    return total
+
+
+def rolling_mean(x: np.ndarray, window: int) -> np.ndarray:
+    """rolling(window, min_periods=1).mean() (NaN только в начале строки)"""
+    rows, width = x.shape
+    first = first_valid(x)
+    out = _window_sum(np.nan_to_num(x), window)
+    out /= window
+    # Первые window - 1 значений строки - среднее неполного окна
+    head = np.arange(min(window - 1, width))
+    cols = first[:, None] + head[None, :]
+    inside = cols < width
+    r = np.broadcast_to(np.arange(rows)[:, None], cols.shape)[inside]
+    out[r, cols[inside]] *= (window / (head + 1.0))[np.nonzero(inside)[1]]
+    out[np.arange(width)[None, :] < first[:, None]] = np.nan
+    return out
+
+
+def _rolling_extreme(x: np.ndarray, window: int, op: np.ufunc) -> np.ndarray:
+    """
+    rolling(window, min_periods=1).max()/min() за O(n) алгоритмом van Herk / Gil-Werman:
+    в блоках по window накопленный экстремум слева направо и справа налево, ответ
+    для окна - op двух значений. Монотонная очередь (как _RollingExtreme в потоковом
+    движке) последовательна; эта схема дает те же значения целыми массивами.
+    op - np.fmax/np.fmin: NaN пропускаются, окно из одних NaN дает NaN.
+    """
+    rows, width = x.shape
+    if width == 0:
+        return x.copy()
+    padded_width = -(-(width + window - 1) // window) * window
+    padded = np.full((rows, padded_width), np.nan)
+    padded[:, window - 1:window - 1 + width] = x  # окно, заканчивающееся на t, = padded[t : t + window]
+    blocks = padded.reshape(rows, -1, window)
+    prefix = op.accumulate(blocks, axis=2).reshape(rows, -1)
+    suffix = op.accumulate(blocks[:, :, ::-1], axis=2)[:, :, ::-1].reshape(rows, -1)
+    return op(suffix[:, :width], prefix[:, window - 1:window - 1 + width])
+
+
+def rolling_max(x: np.ndarray, window: int) -> np.ndarray:
+    return _rolling_extreme(x, window, np.fmax)
+
+
+def rolling_min(x: np.ndarray, window: int) -> np.ndarray:
+    return _rolling_extreme(x, window, np.fmin)
+
+
+def pandas_ta_reference(df: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """Те же индикаторы через pandas_ta / pandas по одному символу (эталон)"""
+    import pandas_ta  # noqa: F401 - регистрирует df.ta
+    macd_df = df.ta.macd()
+    return {
+        'rsi': df.ta.rsi(length=14).to_numpy(dtype=float),
+        'macd_line': macd_df['MACD_12_26_9'].to_numpy(),
+        'macd_signal': macd_df['MACDs_12_26_9'].to_numpy(),
+        'macd_hist': macd_df['MACDh_12_26_9'].to_numpy(),
+        'atr': df.ta.atr(length=14).to_numpy(dtype=float),
+        'ema_200': df['close'].ewm(span=200, adjust=False).mean().to_numpy(),
+        'ema_50': df['close'].ewm(span=50, adjust=False).mean().to_numpy(),
+        'volume_ma_20': df['volume'].rolling(20, min_periods=1).mean().to_numpy(),
+        'high_max_50': df['high'].rolling(50, min_periods=1).max().to_numpy(),
+        'low_min_50': df['low'].rolling(50, min_periods=1).min().to_numpy(),
+    }
+
+
+def panel_indicators(frames: List[pd.DataFrame]) -> Dict[str, np.ndarray]:
+    """Индикаторы pandas_ta_reference для всех символов одним проходом (панели)"""
+    close, high, low, volume = (panel(frames, c) for c in ('close', 'high', 'low', 'volume'))
+    line, signal_line, hist = macd(close)
+    return {
+        'rsi': rsi(close),
+        'macd_line': line,
+        'macd_signal': signal_line,
+        'macd_hist': hist,
+        'atr': atr(high, low, close),
+        'ema_200': ema(close, 200),
+        'ema_50': ema(close, 50),
+        'volume_ma_20': rolling_mean(volume, 20),
+        'high_max_50': rolling_max(high, 50),
+        'low_min_50': rolling_min(low, 50),
+    }
+
+
+def check_pandas_ta(frames: List[pd.DataFrame], rtol: float = 1e-9, atol: float = 1e-9) -> pd.Series:
+    """
+    Сверка ядер с pandas_ta по каждому символу (истории разной длины - одной панелью).
+    Возвращает максимальное отклонение по индикатору; AssertionError при расхождении.
+    """
+    batch = panel_indicators(frames)
+    width = max(len(f) for f in frames)
+    diffs = {}
+    for i, df in enumerate(frames):
+        expected = pandas_ta_reference(df)
+        for name, values in expected.items():
+            got = batch[name][i, width - len(df):]
+            if not np.array_equal(np.isnan(got), np.isnan(values)):
+                raise AssertionError(f"{name}: NaN positions differ for frame {i}")
+            ok = ~np.isnan(values)
+            if not np.allclose(got[ok], values[ok], rtol=rtol, atol=atol):
+                raise AssertionError(f"{name}: max diff {np.max(np.abs(got[ok] - values[ok])):.3e} for frame {i}")
+            if ok.any():
+                diffs[name] = max(diffs.get(name, 0.0), float(np.max(np.abs(got[ok] - values[ok]))))
+    return pd.Series(diffs)
+
+
+if __name__ == '__main__':
+    import sqlite3
+    from config import DB_PATH, SYMBOLS, TIMEFRAME
+    from etl_pipeline import load_from_db
+
+    logging.basicConfig(level=logging.INFO)
+    conn = sqlite3.connect(DB_PATH)
+    frames = [load_from_db(conn, symbol, TIMEFRAME) for symbol in SYMBOLS]
+    conn.close()
+    diff = check_pandas_ta([f for f in frames if len(f)])
+    logger.info(f"NumPy indicators match pandas_ta for {len(SYMBOLS)} symbols, max abs diff:\n{diff}")
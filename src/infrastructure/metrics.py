@@ -0,0 +1,168 @@
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Tuple
+from config import METRICS_ENABLED
+
+# Границы корзин гистограмм задержек (сек.): от миллисекунды до минуты
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Counter:
+    """Монотонный счетчик с метками; значения - {кортеж значений меток: число}"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def snapshot(self) -> Dict[Tuple[str, ...], float]:
+        with self._lock:
+            return dict(self._values)
+
+    @staticmethod
+    def merge(a, b):
+        return a + b
+
+    def lines(self, values) -> List[str]:
+        return [f"{self.name}{_labels(self.labelnames, key)} {value:g}" for key, value in sorted(values.items())]
+
+
+class Histogram:
+    """
+    Гистограмма с фиксированными корзинами: observe - bisect и два инкремента под
+    блокировкой, кумулятивные суммы считаются только при выдаче /metrics.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        # значения меток -> (счетчики по корзинам + корзина +Inf, сумма наблюдений)
+        self._values: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str):
+        if not METRICS_ENABLED:
+            return
+        i = bisect_left(self.buckets, value)  # первая граница >= value (le)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][i] += 1
+            state[1] += value
+
+    @contextmanager
+    def time(self, *labels: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, *labels)
+
+    def snapshot(self) -> Dict[Tuple[str, ...], tuple]:
+        with self._lock:
+            return {key: (list(counts), total) for key, (counts, total) in self._values.items()}
+
+    @staticmethod
+    def merge(a, b):
+        return [x + y for x, y in zip(a[0], b[0])], a[1] + b[1]
+
+    def lines(self, values) -> List[str]:
+        out = []
+        for key, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                out.append(f"{self.name}_bucket{_labels(self.labelnames + ('le',), key + (le,))} {cumulative}")
+            out.append(f"{self.name}_sum{_labels(self.labelnames, key)} {total:.9g}")
+            out.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return out
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+class MetricsRegistry:
+    """
+    Метрики процесса. snapshot() - сырые значения (пиклятся, уходят в heartbeat
+    воркера), render() - текстовый формат Prometheus; снимки других процессов
+    складываются с собственными значениями.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def snapshot(self) -> Dict[str, dict]:
+        return {name: metric.snapshot() for name, metric in self._metrics.items()}
+
+    def render(self, others: Iterable[Dict[str, dict]] = ()) -> str:
+        merged = self.snapshot()
+        for snapshot in others:
+            for name, values in snapshot.items():
+                metric = self._metrics.get(name)
+                if metric is None:
+                    continue
+                target = merged[name]
+                for key, value in values.items():
+                    target[key] = metric.merge(target[key], value) if key in target else value
+
+        lines = []
+        for name, metric in self._metrics.items():
+            lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            lines.extend(metric.lines(merged[name]))
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "signal_bot_stage_seconds", "Duration of a per-symbol processing stage", ("stage",)))
+CYCLE_SECONDS = REGISTRY.register(Histogram(
+    "signal_bot_cycle_seconds", "Wall time of a processing cycle (until results or deadline)"))
+CYCLE_SYMBOLS = REGISTRY.register(Counter(
+    "signal_bot_cycle_symbols_total", "Symbols per cycle outcome", ("outcome",)))
+SIGNAL_DELAY_SECONDS = REGISTRY.register(Histogram(
+    "signal_bot_signal_delay_seconds", "Candle close to signal sent through the notifier"))
+SIGNALS = REGISTRY.register(Counter(
+    "signal_bot_signals_total", "Signals generated", ("side",)))
+EXCHANGE_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "signal_bot_exchange_request_seconds", "Binance REST kline request incl. parsing", ("timeframe",)))
+EXCHANGE_REQUESTS = REGISTRY.register(Counter(
+    "signal_bot_exchange_requests_total", "Binance REST kline requests", ("result",)))
+CLOSED_CANDLES = REGISTRY.register(Counter(
+    "signal_bot_closed_candles_total", "Closed candles delivered by the kline stream", ("source",)))
+NOTIFY_SECONDS = REGISTRY.register(Histogram(
+    "signal_bot_notify_seconds", "Telegram delivery of one message"))
+NOTIFICATIONS = REGISTRY.register(Counter(
+    "signal_bot_notifications_total", "Telegram messages", ("result",)))
+NOTIFY_QUEUE_SECONDS = REGISTRY.register(Histogram(
+    "signal_bot_notify_queue_seconds", "Wait in the notification queue before delivery"))
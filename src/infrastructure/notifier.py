@@ -1,37 +1,305 @@
-import requests
+import time
+import queue
 import logging
+import threading
+from typing import List, Optional
+import requests
 from src.domain.contracts import NotifierInterface, SignalDTO, SignalSide
-from config import TG_TOKEN, TG_CHAT_ID
+from src.infrastructure.metrics import NOTIFY_SECONDS, NOTIFICATIONS, NOTIFY_QUEUE_SECONDS
+from config import (
+    TG_TOKEN, TG_CHAT_ID, TG_API_URL, NOTIFY_QUEUE_SIZE, NOTIFY_RATE, NOTIFY_BURST,
+    NOTIFY_DIGEST_MIN, NOTIFY_LINGER, NOTIFY_RETRIES
+)
 
 logger = logging.getLogger(__name__)
 
+MAX_MESSAGE_LEN = 4096  # лимит Telegram на текст сообщения (в единицах UTF-16: эмодзи - две)
+
+
+def _length(text: str) -> int:
+    return len(text.encode("utf-16-le")) // 2
+
+
+class TelegramError(Exception):
+    """Отказ Telegram; retry_after - сколько ждать (сек.) при 429 Too Many Requests"""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _retryable(error: Exception) -> bool:
+    """Повторять ли доставку: 429, 5xx и сетевые ошибки; прочие 4xx (например, 400 на разметке) - нет"""
+    if isinstance(error, TelegramError):
+        return error.retry_after is not None
+    if isinstance(error, requests.HTTPError):
+        return error.response is not None and error.response.status_code >= 500
+    return isinstance(error, (requests.ConnectionError, requests.Timeout))
+
+
+def format_signal(signal: SignalDTO) -> str:
+    emoji = "🟢 LONG" if signal.side == SignalSide.LONG else "🔴 SHORT"
+    return (
+        f"🚀 *NEW SIGNAL: {signal.symbol}*\n"
+        f"Direction: {emoji}\n"
+        f"Confidence: `{signal.confidence:.2%}`\n"
+        f"Current Price: `{signal.current_price:.4f}`\n"
+        f"-------------------\n"
+        f"🎯 *TAKE PROFIT*: `{signal.take_profit:.4f}`\n"
+        f"🛑 *STOP LOSS*: `{signal.stop_loss:.4f}`\n"
+        f"📈 *Expected Move*: `{signal.expected_move_pct:.2%}`"
+    )
+
+
+def format_digest(signals: List[SignalDTO]) -> List[str]:
+    """Сводка нескольких сигналов: строка на сигнал, при длинной пачке - несколько сообщений"""
+    lines = [
+        f"{'🟢' if s.side == SignalSide.LONG else '🔴'} *{s.symbol}* {s.side.value} `{s.confidence:.2%}` "
+        f"@ `{s.current_price:.4f}` 🎯 `{s.take_profit:.4f}` 🛑 `{s.stop_loss:.4f}`"
+        for s in signals
+    ]
+    header = f"🚀 *{len(signals)} NEW SIGNALS*"
+    messages, current = [], header
+    for line in lines:
+        if _length(current) + 1 + _length(line) > MAX_MESSAGE_LEN:
+            messages.append(current)
+            current = f"{header} (cont.)"
+        current += "\n" + line
+    messages.append(current)
+    return messages
+
+
 class TelegramNotifier(NotifierInterface):
-    def __init__(self):
-        self.base_url = f"https://api.telegram.org/bot{TG_TOKEN}/sendMessage"
+    """
+    Синхронная отправка в Telegram через одну keep-alive сессию (TLS рукопожатие
+    один раз, а не на каждое сообщение). В живом боте оборачивается в
+    NotificationDispatcher, чтобы медленный Telegram не задерживал анализ.
+    """
 
-    def send_message(self, text: str):
+    def __init__(self, api_url: str = TG_API_URL, token: str = TG_TOKEN, chat_id: str = TG_CHAT_ID, timeout: float = 10):
+        self.base_url = f"{api_url.rstrip('/')}/bot{token}/sendMessage"
+        self.chat_id = chat_id
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def deliver(self, text: str):
+        """Одно сообщение; TelegramError или исключение requests при отказе"""
         params = {
-            "chat_id": TG_CHAT_ID,
+            "chat_id": self.chat_id,
             "text": text,
             "parse_mode": "Markdown"
         }
+        with NOTIFY_SECONDS.time():
+            r = self.session.post(self.base_url, json=params, timeout=self.timeout)
+        if r.status_code == 429:
+            try:
+                retry_after = float(r.json().get("parameters", {}).get("retry_after", 1))
+            except ValueError:
+                retry_after = 1.0
+            raise TelegramError(f"Too Many Requests, retry after {retry_after:g}s", retry_after)
+        r.raise_for_status()
+
+    def send_message(self, text: str):
         try:
-            r = requests.get(self.base_url, params=params, timeout=10)
-            r.raise_for_status()
+            self.deliver(text)
+            NOTIFICATIONS.inc("ok")
         except Exception as e:
+            NOTIFICATIONS.inc("error")
             logger.error(f"Error sending TG message: {e}")
 
     def send_signal(self, signal: SignalDTO):
-        emoji = "🟢 LONG" if signal.side == SignalSide.LONG else "🔴 SHORT"
-        
-        message = (
-            f"🚀 *NEW SIGNAL: {signal.symbol}*\n"
-            f"Direction: {emoji}\n"
-            f"Confidence: `{signal.confidence:.2%}`\n"
-            f"Current Price: `{signal.current_price:.4f}`\n"
-            f"-------------------\n"
-            f"🎯 *TAKE PROFIT*: `{signal.take_profit:.4f}`\n"
-            f"🛑 *STOP LOSS*: `{signal.stop_loss:.4f}`\n"
-            f"📈 *Expected Move*: `{signal.expected_move_pct:.2%}`"
+        self.send_message(format_signal(signal))
+
+
+class NotificationDispatcher(NotifierInterface):
+    """
+    Неблокирующий notifier: send_signal/send_message только кладут сообщение в
+    ограниченную очередь, доставляет фоновый поток через sender.deliver с
+    ограничением частоты (token bucket: rate в секунду, до burst подряд) и
+    паузой retry_after на 429. Сигналы, накопившиеся в очереди (пачка одного
+    цикла или всё, что пришло, пока ждали лимит), уходят одним сводным
+    сообщением, если их не меньше digest_min. Переполненная очередь отбрасывает
+    новое сообщение - цикл анализа Telegram не ждет никогда.
+    """
+
+    def __init__(
+        self,
+        sender: TelegramNotifier,
+        maxsize: int = NOTIFY_QUEUE_SIZE,
+        rate: float = NOTIFY_RATE,
+        burst: int = NOTIFY_BURST,
+        digest_min: int = NOTIFY_DIGEST_MIN,
+        linger: float = NOTIFY_LINGER,
+        retries: int = NOTIFY_RETRIES,
+    ):
+        self.sender = sender
+        self.queue: queue.Queue = queue.Queue(maxsize)
+        self.rate = rate
+        self.burst = burst
+        self.digest_min = digest_min
+        self.linger = linger
+        self.retries = retries
+        self.sent = 0
+        self.dropped = 0
+        self._tokens = float(burst)
+        self._refilled = time.monotonic()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._closing = threading.Event()
+
+    def send_signal(self, signal: SignalDTO):
+        self._put("signal", signal)
+
+    def send_message(self, text: str):
+        self._put("message", text)
+
+    def _put(self, kind: str, payload):
+        self._ensure_started()
+        try:
+            self.queue.put_nowait((time.monotonic(), kind, payload))
+        except queue.Full:
+            self.dropped += 1
+            NOTIFICATIONS.inc("dropped")
+            logger.warning(f"Notification queue full, dropping {kind}")
+
+    def _ensure_started(self):
+        # Поток стартует при первом сообщении и перезапускается, если упал
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="notify-sender", daemon=True)
+                self._thread.start()
+
+    def close(self, timeout: float = 10.0):
+        """Дослать очередь и остановить поток (не дольше timeout); run_bot вызывает при выходе"""
+        self._closing.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            try:
+                first = self.queue.get(timeout=0.5)
+            except queue.Empty:
+                if self._closing.is_set():
+                    return
+                continue
+            self._acquire()  # пока ждем лимит, в очереди копятся следующие сообщения
+            if first[1] == "signal" and self.linger > 0 and not self._closing.is_set():
+                time.sleep(self.linger)  # остальные сигналы того же цикла
+            batch = [first] + self._drain()
+            now = time.monotonic()
+            for enqueued, _, _ in batch:
+                NOTIFY_QUEUE_SECONDS.observe(now - enqueued)
+            try:
+                for i, text in enumerate(self._compose(batch)):
+                    if i:
+                        self._acquire()
+                    self._deliver(text)
+            except Exception as e:
+                logger.error(f"Error dispatching notifications: {e}")
+
+    def _drain(self) -> list:
+        items = []
+        while True:
+            try:
+                items.append(self.queue.get_nowait())
+            except queue.Empty:
+                return items
+
+    def _compose(self, batch: list) -> List[str]:
+        """Тексты по порядку поступления; подряд идущие сигналы от digest_min - сводкой"""
+        texts, signals = [], []
+
+        def flush():
+            if len(signals) >= self.digest_min:
+                texts.extend(format_digest(signals))
+            else:
+                texts.extend(format_signal(s) for s in signals)
+            signals.clear()
+
+        for _, kind, payload in batch:
+            if kind == "signal":
+                signals.append(payload)
+                continue
+            flush()
+            texts.append(payload)
+        flush()
+        return texts
+
+    def _acquire(self):
+        """Token bucket: ждет, пока можно отправить следующее сообщение"""
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled) * self.rate)
+        self._refilled = now
+        if self._tokens < 1:
+            time.sleep((1 - self._tokens) / self.rate)
+            self._tokens = 1.0
+            self._refilled = time.monotonic()
+        self._tokens -= 1
+
+    def _deliver(self, text: str):
+        for attempt in range(self.retries + 1):
+            try:
+                self.sender.deliver(text)
+                self.sent += 1
+                NOTIFICATIONS.inc("ok")
+                return
+            except Exception as e:
+                retry_after = getattr(e, "retry_after", None)
+                if retry_after is not None:
+                    NOTIFICATIONS.inc("rate_limited")
+                    logger.warning(f"Telegram rate limit, retrying in {retry_after:g}s")
+                    delay = retry_after
+                else:
+                    NOTIFICATIONS.inc("error")
+                    logger.error(f"Error sending TG message (attempt {attempt + 1}): {e}")
+                    if not _retryable(e):
+                        return  # повтор получит тот же отказ
+                    delay = min(2 ** attempt, 30)
+            if attempt < self.retries:
+                time.sleep(delay)
+                self._tokens, self._refilled = 0.0, time.monotonic()  # после паузы - по лимиту с нуля
+        logger.error(f"Giving up on TG message after {self.retries + 1} attempts")
+
+
+def check_delivery(timeout: float = 15.0) -> dict:
+    """
+    Доставка через NotificationDispatcher на TelegramStub: повтор после 429 не
+    раньше retry_after и после 5xx, 400 не повторяется, close() досылает очередь.
+    Возвращает статистику или бросает AssertionError.
+    """
+    from src.infrastructure.telegram_stub import TelegramStub
+
+    with TelegramStub(rate_limited=1, retry_after=0.5) as stub:
+        dispatcher = NotificationDispatcher(
+            TelegramNotifier(api_url=stub.url, token="TEST", chat_id="1", timeout=timeout),
+            rate=100, burst=10, linger=0, retries=2,
         )
-        self.send_message(message)
+        started = time.monotonic()
+        dispatcher.send_message("*429* first")
+        dispatcher.close(timeout)
+        waited = time.monotonic() - started
+        if [m["text"] for m in stub.messages] != ["*429* first"] or stub.requests != 2:
+            raise AssertionError(f"429 not retried once: {stub.requests} requests, {stub.messages}")
+        if waited < stub.retry_after:
+            raise AssertionError(f"Retried after {waited:.2f}s, retry_after is {stub.retry_after:g}s")
+
+        stub.server_errors = 1
+        dispatcher = NotificationDispatcher(dispatcher.sender, rate=100, burst=10, linger=0, retries=2)
+        dispatcher.send_message("after 500")
+        dispatcher.send_message("broken *markdown")
+        for i in range(5):
+            dispatcher.send_message(f"queued {i}")
+        dispatcher.close(timeout)
+        texts = [m["text"] for m in stub.messages]
+        if texts != ["*429* first", "after 500"] + [f"queued {i}" for i in range(5)]:
+            raise AssertionError(f"Unexpected delivered messages: {texts}")
+        # 429 + 200, 500 + 200, 400 без повтора, 5 сообщений из очереди
+        if stub.requests != 10:
+            raise AssertionError(f"{stub.requests} requests to Telegram, expected 10 (400 must not be retried)")
+        return {"requests": stub.requests, "delivered": len(texts), "waited_429": round(waited, 2)}
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    logger.info(f"Telegram delivery OK: {check_delivery()}")
@@ -0,0 +1,183 @@
+import json
+import time
+import logging
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+from src.domain.contracts import KlineDTO, KlineStreamInterface
+from src.infrastructure.exchange import BinanceExchange
+from src.infrastructure.metrics import CLOSED_CANDLES
+from config import WS_URL, TF_MS, STREAM_FALLBACK_GRACE
+
+logger = logging.getLogger(__name__)
+
+FALLBACK_MAX_DELAY = 60  # сек., предел backoff REST-запросов по одной (symbol, timeframe)
+
+
+def _websocket_app(url, **callbacks):
+    import websocket
+    return websocket.WebSocketApp(url, **callbacks)
+
+
+class BinanceStreamExchange(BinanceExchange, KlineStreamInterface):
+    """
+    Биржа с push-событиями закрытия свечей через kline stream Binance Futures.
+    REST (get_latest_klines) остается для истории и как резерв: если событие о
+    закрытии не пришло за STREAM_FALLBACK_GRACE сек., свеча берется по REST.
+    transport_factory(url, on_open=, on_message=, on_error=, on_close=) должен
+    вернуть объект с API websocket.WebSocketApp (run_forever/send/close).
+    """
+
+    def __init__(
+        self,
+        url: str = WS_URL,
+        transport_factory: Optional[Callable] = None,
+        fallback_grace: float = STREAM_FALLBACK_GRACE,
+    ):
+        self.url = url
+        self.transport_factory = transport_factory or _websocket_app
+        self.fallback_grace = fallback_grace
+        self._subs: Dict[Tuple[str, str], Callable[[KlineDTO], None]] = {}
+        self._api_symbols: Dict[str, str] = {}  # ETHUSDT -> ETH/USDT
+        self._last_emitted: Dict[Tuple[str, str], int] = {}
+        self._rest_retry: Dict[Tuple[str, str], Tuple[float, float]] = {}  # key -> (monotonic следующего запроса, задержка)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._ws = None
+        self._threads: List[threading.Thread] = []
+        self.connected = threading.Event()
+
+    def subscribe(self, symbols: List[str], timeframe: str, callback: Callable[[KlineDTO], None]):
+        for symbol in symbols:
+            self._subs[(symbol, timeframe)] = callback
+            self._api_symbols[symbol.replace("/", "")] = symbol
+
+    def start(self):
+        # Уже закрытые к старту свечи считаем обработанными (их разбирает первый цикл по REST)
+        now_ms = time.time() * 1000
+        for key in self._subs:
+            interval = TF_MS.get(key[1], 3600000)
+            self._last_emitted[key] = int((now_ms // interval) * interval - interval)
+
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self._stream_loop, name="kline-stream", daemon=True),
+            threading.Thread(target=self._fallback_loop, name="kline-fallback", daemon=True),
+        ]
+        for t in self._threads:
+            t.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._ws is not None:
+            self._ws.close()
+        for t in self._threads:
+            t.join(timeout=5)
+
+    # --- websocket ---
+
+    def _stream_names(self) -> List[str]:
+        return [f"{symbol.replace('/', '').lower()}@kline_{tf}" for symbol, tf in self._subs]
+
+    def _stream_loop(self):
+        delay = 1
+        while not self._stop.is_set():
+            self._ws = self.transport_factory(
+                self.url,
+                on_open=self._on_open,
+                on_message=self._on_message,
+                on_error=self._on_error,
+                on_close=self._on_close,
+            )
+            opened_at = time.monotonic()
+            try:
+                self._ws.run_forever(ping_interval=180, ping_timeout=10)
+            except Exception as e:
+                logger.error(f"Kline stream crashed: {e}")
+            self.connected.clear()
+            if self._stop.is_set():
+                break
+            # Соединение прожило долго - начинаем backoff заново
+            if time.monotonic() - opened_at > 60:
+                delay = 1
+            logger.warning(f"Kline stream disconnected, reconnecting in {delay}s (REST fallback active)")
+            self._stop.wait(delay)
+            delay = min(delay * 2, 60)
+
+    def _on_open(self, ws):
+        # Переподписка на каждом (пере)подключении
+        ws.send(json.dumps({"method": "SUBSCRIBE", "params": self._stream_names(), "id": 1}))
+        self.connected.set()
+        logger.info(f"Kline stream connected, subscribed to {len(self._subs)} streams")
+
+    def _on_message(self, ws, message):
+        try:
+            msg = json.loads(message)
+        except ValueError:
+            return
+        data = msg.get("data", msg)  # combined stream оборачивает событие в data
+        if not isinstance(data, dict) or data.get("e") != "kline":
+            return
+        k = data["k"]
+        if not k.get("x"):
+            return  # свеча еще не закрыта
+        symbol = self._api_symbols.get(k["s"])
+        if symbol is None:
+            return
+        self._emit(k["i"], KlineDTO(
+            symbol=symbol,
+            timestamp=int(k["t"]),
+            open=float(k["o"]),
+            high=float(k["h"]),
+            low=float(k["l"]),
+            close=float(k["c"]),
+            volume=float(k["v"]),
+        ))
+
+    def _on_error(self, ws, error):
+        logger.error(f"Kline stream error: {error}")
+
+    def _on_close(self, ws, status_code=None, reason=None):
+        self.connected.clear()
+
+    # --- доставка ---
+
+    def _emit(self, timeframe: str, kline: KlineDTO, source: str = "stream"):
+        key = (kline.symbol, timeframe)
+        callback = self._subs.get(key)
+        if callback is None:
+            return
+        with self._lock:
+            if self._last_emitted.get(key, -1) >= kline.timestamp:
+                return  # уже доставлена (stream и REST могут прислать одну свечу)
+            self._last_emitted[key] = kline.timestamp
+        CLOSED_CANDLES.inc(source)
+        callback(kline)
+
+    def _fallback_loop(self):
+        while not self._stop.wait(1.0):
+            now_ms = time.time() * 1000
+            for (symbol, tf) in list(self._subs):
+                interval = TF_MS.get(tf, 3600000)
+                close_ms = (now_ms // interval) * interval
+                expected = int(close_ms - interval)  # open time последней закрытой свечи
+                if now_ms - close_ms < self.fallback_grace * 1000:
+                    continue
+                key = (symbol, tf)
+                if self._last_emitted.get(key, -1) >= expected:
+                    self._rest_retry.pop(key, None)
+                    continue
+                # Пока REST не отдает свечу, запросы по ключу реже: 1, 2, 4 ... FALLBACK_MAX_DELAY сек.
+                # (иначе при сбое биржи каждый символ шлет запрос раз в секунду - лимит веса и бан)
+                retry_at, delay = self._rest_retry.get(key, (0.0, 0.0))
+                if time.monotonic() < retry_at:
+                    continue
+                if not delay:
+                    logger.warning(f"No stream event for {symbol} {tf} candle {expected}, using REST")
+                klines = self.get_latest_klines(symbol, tf, limit=2)
+                closed = [k for k in klines.klines() if k.timestamp + interval <= now_ms]
+                if closed:
+                    self._emit(tf, closed[-1], source="rest")
+                if self._last_emitted.get(key, -1) < expected:
+                    delay = min(max(delay * 2, 1.0), FALLBACK_MAX_DELAY)
+                    self._rest_retry[key] = (time.monotonic() + delay, delay)
+                    logger.warning(f"REST has no closed {symbol} {tf} candle {expected}, retry in {delay:.0f}s")
@@ -0,0 +1,179 @@
+import json
+import math
+import queue
+import logging
+import threading
+import time
+from typing import Dict, List, Set
+from src.domain.contracts import KlineDTO, KlineBatch
+
+logger = logging.getLogger(__name__)
+
+
+class _SimConnection:
+    """Соединение с API websocket.WebSocketApp, обслуживаемое симулятором"""
+
+    def __init__(self, sim: "KlineStreamSimulator", url, on_open=None, on_message=None, on_error=None, on_close=None):
+        self.sim = sim
+        self.url = url
+        self.on_open = on_open
+        self.on_message = on_message
+        self.on_close = on_close
+        self.streams: Set[str] = set()
+        self._inbox: queue.Queue = queue.Queue()
+
+    def run_forever(self, **kwargs):
+        self.sim._attach(self)
+        if self.on_open:
+            self.on_open(self)
+        while True:
+            msg = self._inbox.get()
+            if msg is None:
+                break
+            self.on_message(self, msg)
+        self.sim._detach(self)
+        if self.on_close:
+            self.on_close(self, 1000, "closed")
+        return False
+
+    def send(self, data: str):
+        req = json.loads(data)
+        if req.get("method") == "SUBSCRIBE":
+            with self.sim._changed:
+                self.streams.update(req["params"])
+                self.sim._changed.notify_all()  # wait_connected ждет подписку
+
+    def close(self):
+        self._inbox.put(None)
+
+
+class KlineStreamSimulator:
+    """
+    Внутрипроцессная замена kline stream Binance для тестов:
+    factory передается в BinanceStreamExchange(transport_factory=...),
+    push_kline() рассылает событие подписанным соединениям, drop() рвет их.
+    """
+
+    def __init__(self):
+        self.connections: List[_SimConnection] = []
+        self.connects = 0
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+
+    def factory(self, url, **callbacks) -> _SimConnection:
+        return _SimConnection(self, url, **callbacks)
+
+    def _attach(self, conn: _SimConnection):
+        with self._changed:
+            self.connections.append(conn)
+            self.connects += 1
+            self._changed.notify_all()
+
+    def _detach(self, conn: _SimConnection):
+        with self._changed:
+            if conn in self.connections:
+                self.connections.remove(conn)
+            self._changed.notify_all()
+
+    def wait_connected(self, count: int = 1, timeout: float = 5.0) -> bool:
+        """Ждет, пока число подключений за все время достигнет count и есть живое соединение"""
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while self.connects < count or not any(c.streams for c in self.connections):
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    return False
+                self._changed.wait(left)
+            return True
+
+    def push_kline(self, timeframe: str, kline: KlineDTO, closed: bool = True):
+        api_symbol = kline.symbol.replace("/", "")
+        stream = f"{api_symbol.lower()}@kline_{timeframe}"
+        event = {
+            "e": "kline",
+            "E": int(time.time() * 1000),
+            "s": api_symbol,
+            "k": {
+                "t": kline.timestamp, "s": api_symbol, "i": timeframe,
+                "o": str(kline.open), "h": str(kline.high), "l": str(kline.low),
+                "c": str(kline.close), "v": str(kline.volume), "x": closed,
+            },
+        }
+        payload = json.dumps(event)
+        with self._lock:
+            targets = [c for c in self.connections if stream in c.streams]
+        for conn in targets:
+            conn._inbox.put(payload)
+
+    def drop(self):
+        """Обрыв всех соединений (проверка переподключения и переподписки)"""
+        with self._lock:
+            targets = list(self.connections)
+        for conn in targets:
+            conn.close()
+
+
+def check_stream(timeframe: str = "1h", failing_for: float = 4.5, timeout: float = 15.0) -> Dict[str, int]:
+    """
+    Сверка BinanceStreamExchange с симулятором: доставка закрытых свечей по stream,
+    переподключение с переподпиской и резерв по REST с backoff, пока REST пуст.
+    Возвращает счетчики; AssertionError при расхождении.
+    """
+    from src.infrastructure.stream import BinanceStreamExchange
+    from config import TF_MS
+
+    interval = TF_MS[timeframe]
+    rest = {"calls": 0, "failing": True}
+
+    class _Exchange(BinanceStreamExchange):
+        def get_latest_klines(self, symbol, tf, limit=2):
+            rest["calls"] += 1
+            if rest["failing"]:
+                return KlineBatch.from_klines(symbol, [])  # так BinanceExchange отвечает на ошибку запроса
+            last = int(time.time() * 1000) // interval * interval - interval
+            return KlineBatch.from_klines(symbol, [KlineDTO(symbol, last, 1.0, 1.0, 1.0, 1.0, 1.0)])
+
+    sim = KlineStreamSimulator()
+    got: "queue.Queue[KlineDTO]" = queue.Queue()
+    exchange = _Exchange(transport_factory=sim.factory, fallback_grace=0)
+    exchange.subscribe(["ETH/USDT"], timeframe, got.put)
+    exchange.subscribe(["BTC/USDT"], timeframe, got.put)
+    exchange.start()
+    started = time.monotonic()
+    # Свеча BTC/USDT не пришла по stream - ее забирает резервный цикл
+    exchange._last_emitted[("BTC/USDT", timeframe)] -= interval
+    try:
+        if not sim.wait_connected(1, timeout):
+            raise AssertionError("Stream did not connect and subscribe")
+        ts = exchange._last_emitted[("ETH/USDT", timeframe)] + interval
+        sim.push_kline(timeframe, KlineDTO("ETH/USDT", ts, 1.0, 1.0, 1.0, 1.0, 1.0), closed=False)
+        sim.push_kline(timeframe, KlineDTO("ETH/USDT", ts, 1.0, 1.0, 1.0, 1.0, 1.0))
+        kline = got.get(timeout=timeout)
+        if (kline.symbol, kline.timestamp) != ("ETH/USDT", ts):
+            raise AssertionError(f"Unexpected stream kline {kline}")
+
+        sim.drop()
+        if not sim.wait_connected(2, timeout):
+            raise AssertionError("Stream did not reconnect and resubscribe")
+        sim.push_kline(timeframe, KlineDTO("ETH/USDT", ts + interval, 1.0, 1.0, 1.0, 1.0, 1.0))
+        kline = got.get(timeout=timeout)
+        if (kline.symbol, kline.timestamp) != ("ETH/USDT", ts + interval):
+            raise AssertionError(f"Unexpected kline after reconnect {kline}")
+
+        # Пустой REST: запросы 1, 2, 4 ... сек., а не каждую секунду
+        time.sleep(failing_for)
+        failed_calls, failing = rest["calls"], time.monotonic() - started
+        if not 1 <= failed_calls <= math.log2(failing) + 2:
+            raise AssertionError(f"{failed_calls} REST calls in {failing:.1f}s while REST is failing")
+        rest["failing"] = False
+        kline = got.get(timeout=timeout)
+        if kline.symbol != "BTC/USDT":
+            raise AssertionError(f"Unexpected fallback kline {kline}")
+        return {"connects": sim.connects, "failed_rest_calls": failed_calls, "rest_calls": rest["calls"]}
+    finally:
+        exchange.stop()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    logger.info(f"Kline stream OK: {check_stream()}")
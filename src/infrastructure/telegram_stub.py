@@ -0,0 +1,139 @@
+import json
+import time
+import logging
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Set, Tuple
+from urllib.parse import parse_qs, urlparse
+
+logger = logging.getLogger(__name__)
+
+
+class TelegramStub:
+    """
+    Локальная замена api.telegram.org: принимает sendMessage (GET с параметрами или
+    POST JSON), запоминает сообщения и отвечает как Telegram. Для проверок
+    notifier: задержка ответа (latency), 429 с retry_after на первые rate_limited
+    запросов, 500 на следующие server_errors, 400 на несбалансированную разметку
+    Markdown (как "can't parse entities"), число TCP соединений (keep-alive
+    переиспользует одно).
+    TelegramNotifier(api_url=stub.url) или TG_API_URL=http://127.0.0.1:<port>.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0,
+                 rate_limited: int = 0, retry_after: float = 1.0, server_errors: int = 0):
+        self.latency = latency
+        self.rate_limited = rate_limited
+        self.retry_after = retry_after
+        self.server_errors = server_errors
+        self.messages: List[Dict] = []
+        self.requests = 0
+        self.connections: Set[Tuple[str, int]] = set()
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "TelegramStub":
+        self._thread = threading.Thread(target=self.server.serve_forever, name="telegram-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self) -> "TelegramStub":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _handle(self, client: Tuple[str, int], params: Dict) -> Tuple[int, Dict]:
+        with self._lock:
+            self.requests += 1
+            self.connections.add(client)
+            if self.rate_limited > 0:
+                self.rate_limited -= 1
+                return 429, {
+                    "ok": False, "error_code": 429,
+                    "description": f"Too Many Requests: retry after {self.retry_after:g}",
+                    "parameters": {"retry_after": self.retry_after},
+                }
+            if self.server_errors > 0:
+                self.server_errors -= 1
+                return 500, {"ok": False, "error_code": 500, "description": "Internal Server Error"}
+        if self.latency:
+            time.sleep(self.latency)
+        if "chat_id" not in params or "text" not in params:
+            return 400, {"ok": False, "error_code": 400, "description": "Bad Request: message text is empty"}
+        if params.get("parse_mode") == "Markdown" and any(str(params["text"]).count(c) % 2 for c in "*_`"):
+            return 400, {"ok": False, "error_code": 400, "description": "Bad Request: can't parse entities"}
+        with self._lock:
+            self.messages.append({**params, "received": time.time()})
+            message_id = len(self.messages)
+        return 200, {"ok": True, "result": {"message_id": message_id, "text": params["text"]}}
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, как у настоящего API
+
+            def _reply(self, params: Dict):
+                if not urlparse(self.path).path.endswith("/sendMessage"):
+                    status, body = 404, {"ok": False, "error_code": 404, "description": "Not Found"}
+                else:
+                    status, body = stub._handle(self.client_address, params)
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                query = parse_qs(urlparse(self.path).query)
+                self._reply({k: v[-1] for k, v in query.items()})
+
+            def do_POST(self):
+                raw = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if self.headers.get("Content-Type", "").startswith("application/json"):
+                    params = json.loads(raw or b"{}")
+                else:
+                    params = {k: v[-1] for k, v in parse_qs(raw.decode()).items()}
+                self._reply(params)
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        return Handler
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Заглушка Telegram Bot API: печатает принятые сообщения")
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency', type=float, default=0.0, help="задержка ответа, сек.")
+    parser.add_argument('--rate-limited', type=int, default=0, help="первые N запросов получают 429")
+    parser.add_argument('--server-errors', type=int, default=0, help="следующие N запросов получают 500")
+    args = parser.parse_args()
+
+    stub = TelegramStub(
+        port=args.port, latency=args.latency, rate_limited=args.rate_limited, server_errors=args.server_errors
+    ).start()
+    print(f"Telegram stub on {stub.url} (TG_API_URL={stub.url})")
+    seen = 0
+    try:
+        while True:
+            time.sleep(0.5)
+            for message in stub.messages[seen:]:
+                print(f"--- chat {message['chat_id']} ---\n{message['text']}")
+            seen = len(stub.messages)
+    except KeyboardInterrupt:
+        stub.stop()
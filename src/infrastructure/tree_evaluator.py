@@ -0,0 +1,150 @@
+import os
+import json
+import tempfile
+from typing import List
+import numpy as np
+import pandas as pd
+
+
+class ObliviousTreeModel:
+    """
+    Вычисление модели CatBoost (симметричные деревья, только float-признаки) на NumPy.
+    Каждое дерево глубины d - d условий x[f] > border; бит j индекса листа =
+    результат j-го условия. Все уникальные условия считаются один раз на пачку,
+    индексы листьев собираются побитово сразу для всех деревьев одной глубины.
+    Сравнение во float32, как в CatBoost.
+    """
+
+    CHUNK_ROWS = 1024  # строк за проход: матрицы (условия x строки) остаются в кэше
+
+    def __init__(
+        self,
+        feature_names: List[str],
+        split_features: np.ndarray,
+        split_borders: np.ndarray,
+        nan_as_true: np.ndarray,
+        trees: list,
+        scale: float,
+        bias: np.ndarray,
+    ):
+        self.feature_names = feature_names
+        self.split_features = split_features            # (n_splits,) индекс признака условия
+        self.split_borders = split_borders[:, None]     # (n_splits, 1) float32
+        self.nan_as_true = nan_as_true                  # (n_features,) NaN -> условие выполнено
+        # По глубинам: индексы условий (T, d), смещения листьев дерева в плоской
+        # таблице (T, 1) и таблица значений листьев (dim, T * 2^d)
+        self.trees = [
+            (splits, (np.arange(len(splits)) << splits.shape[1])[:, None].astype(np.intp),
+             np.ascontiguousarray(leaves.reshape(-1, leaves.shape[2]).T))
+            for splits, leaves in trees
+        ]
+        self.scale = scale
+        self.bias = bias
+        self.dim = len(bias)
+
+    @classmethod
+    def from_json(cls, model_json: dict) -> "ObliviousTreeModel":
+        info = model_json["features_info"]
+        if set(info) - {"float_features"}:
+            raise ValueError(f"Only float features are supported, model has {sorted(info)}")
+        float_features = sorted(info["float_features"], key=lambda f: f["flat_feature_index"])
+        feature_names = [f.get("feature_id") or str(f["flat_feature_index"]) for f in float_features]
+        nan_as_true = np.array([f.get("nan_value_treatment") == "AsTrue" for f in float_features])
+
+        scale, bias = model_json.get("scale_and_bias", [1.0, [0.0]])
+        bias = np.atleast_1d(np.asarray(bias, dtype=np.float64))
+        dim = len(bias)
+
+        conditions = {}  # (feature, border) -> индекс условия
+        by_depth = {}
+        for tree in model_json["oblivious_trees"]:
+            split_ids = []
+            for split in tree["splits"]:
+                if split["split_type"] != "FloatFeature":
+                    raise ValueError(f"Unsupported split type {split['split_type']}")
+                key = (split["float_feature_index"], np.float32(split["border"]))
+                split_ids.append(conditions.setdefault(key, len(conditions)))
+            depth = len(split_ids)
+            leaves = np.asarray(tree["leaf_values"], dtype=np.float64).reshape(1 << depth, dim)
+            by_depth.setdefault(depth, ([], []))
+            by_depth[depth][0].append(split_ids)
+            by_depth[depth][1].append(leaves)
+
+        split_features = np.array([f for f, _ in conditions], dtype=np.int64)
+        split_borders = np.array([b for _, b in conditions], dtype=np.float32)
+        trees = [
+            (np.array(splits, dtype=np.int64).reshape(len(splits), depth), np.stack(leaves))
+            for depth, (splits, leaves) in sorted(by_depth.items())
+        ]
+        return cls(feature_names, split_features, split_borders, nan_as_true, trees, float(scale), bias)
+
+    @classmethod
+    def from_catboost(cls, model) -> "ObliviousTreeModel":
+        """Экспорт обученной CatBoostClassifier через JSON-дамп структуры деревьев"""
+        fd, path = tempfile.mkstemp(suffix=".json")
+        os.close(fd)
+        try:
+            model.save_model(path, format="json")
+            with open(path) as f:
+                return cls.from_json(json.load(f))
+        finally:
+            os.remove(path)
+
+    @classmethod
+    def load(cls, cbm_path) -> "ObliviousTreeModel":
+        from catboost import CatBoostClassifier
+        model = CatBoostClassifier()
+        model.load_model(str(cbm_path))
+        return cls.from_catboost(model)
+
+    def _matrix(self, X) -> np.ndarray:
+        if isinstance(X, pd.DataFrame):
+            if list(X.columns) != self.feature_names:
+                X = X[self.feature_names]
+            X = X.to_numpy(dtype=np.float32)
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X[None, :]
+        if self.nan_as_true.any():
+            X = np.where(np.isnan(X) & self.nan_as_true, np.float32(np.inf), X)
+        return X
+
+    def raw_predict(self, X) -> np.ndarray:
+        """Сумма листьев по деревьям (rows x dim), с масштабом и смещением модели"""
+        X = self._matrix(X)
+        out = np.empty((len(X), self.dim), dtype=np.float64)
+        for start in range(0, len(X), self.CHUNK_ROWS):
+            chunk = X[start:start + self.CHUNK_ROWS]
+            # (n_splits, rows); NaN > border = False: для AsIs/AsFalse условие не выполнено
+            conditions = (chunk.T[self.split_features] > self.split_borders).view(np.uint8)
+            total = np.zeros((self.dim, len(chunk)), dtype=np.float64)
+            for splits, offsets, leaves in self.trees:
+                depth = splits.shape[1]
+                bits = conditions if depth <= 8 else conditions.astype(np.uint16)
+                leaf = np.zeros((len(splits), len(chunk)), dtype=bits.dtype)  # (T, rows): бит j = условие j дерева
+                for j in range(depth):
+                    leaf |= bits[splits[:, j]] << j
+                index = leaf + offsets
+                for k in range(self.dim):
+                    total[k] += leaves[k].take(index).sum(axis=0)
+            out[start:start + len(chunk)] = total.T
+        return out * self.scale + self.bias
+
+    def predict_proba(self, X) -> np.ndarray:
+        raw = self.raw_predict(X)
+        if self.dim == 1:
+            p = 1.0 / (1.0 + np.exp(-raw[:, 0]))
+            return np.column_stack([1.0 - p, p])
+        raw = raw - raw.max(axis=1, keepdims=True)
+        e = np.exp(raw)
+        return e / e.sum(axis=1, keepdims=True)
+
+
+def check_against_catboost(model, X, atol: float = 1e-9) -> float:
+    """Сверка с CatBoostClassifier.predict_proba; возвращает макс. расхождение"""
+    expected = model.predict_proba(X)
+    actual = ObliviousTreeModel.from_catboost(model).predict_proba(X)
+    diff = float(np.max(np.abs(expected - actual))) if len(X) else 0.0
+    if diff > atol:
+        raise AssertionError(f"NumPy evaluator differs from CatBoost by {diff}")
+    return diff
@@ -0,0 +1,151 @@
+import os
+import time
+import argparse
+import itertools
+from multiprocessing import Pool, shared_memory
+import numpy as np
+import pandas as pd
+from backtest import load_test_set, build_market, strategy_params, simulate, compute_metrics
+
+# Массивы рынка/вероятностей воркера (view на shared memory), заполняются в _init_worker
+_MARKET = None
+_PROBS = None
+_SEGMENTS = []
+
+ARRAY_KEYS = ('open', 'high', 'low', 'close')
+
+
+def parse_specs(specs, samples=None, seed=0):
+    """
+    Наборы параметров из спецификаций вида name=v1,v2,... (сетка) или
+    name=lo:hi (равномерный диапазон, только со samples).
+    Без samples - полное декартово произведение, с samples - случайная выборка.
+    """
+    defaults = strategy_params()
+    axes = {}
+    for spec in specs:
+        name, _, values = spec.partition('=')
+        if name not in defaults:
+            raise ValueError(f"Unknown parameter {name!r}, expected one of {sorted(defaults)}")
+        if ':' in values:
+            lo, hi = (float(v) for v in values.split(':'))
+            axes[name] = (lo, hi)
+        else:
+            axes[name] = [float(v) for v in values.split(',')]
+
+    if samples is None:
+        ranges = [name for name, axis in axes.items() if isinstance(axis, tuple)]
+        if ranges:
+            raise ValueError(f"Ranges need --samples: {', '.join(ranges)}")
+        names = list(axes)
+        return [strategy_params(**dict(zip(names, combo))) for combo in itertools.product(*axes.values())]
+
+    rng = np.random.default_rng(seed)
+    configs = []
+    for _ in range(samples):
+        overrides = {}
+        for name, axis in axes.items():
+            overrides[name] = float(rng.uniform(*axis)) if isinstance(axis, tuple) else float(rng.choice(axis))
+        configs.append(strategy_params(**overrides))
+    return configs
+
+
+def _share(arrays):
+    """Копирует массивы в shared memory; возвращает сегменты и описание для воркеров"""
+    segments, layout = [], {}
+    for key, arr in arrays.items():
+        arr = np.ascontiguousarray(arr, dtype=np.float64)
+        shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+        np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[...] = arr
+        segments.append(shm)
+        layout[key] = (shm.name, arr.shape)
+    return segments, layout
+
+
+def _attach(layout):
+    arrays = {}
+    for key, (name, shape) in layout.items():
+        shm = shared_memory.SharedMemory(name=name)
+        _SEGMENTS.append(shm)
+        arrays[key] = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+    return arrays
+
+
+def _init_worker(layout, symbols, timestamps, months):
+    global _MARKET, _PROBS
+    arrays = _attach(layout)
+    _PROBS = arrays.pop('probs')
+    _MARKET = {'symbols': symbols, 'timestamps': timestamps, 'months': months, **arrays}
+
+
+def evaluate(params):
+    """Одна конфигурация: симуляция и метрики в одну строку таблицы"""
+    result = simulate(_MARKET, _PROBS, params, verbose=False)
+    metrics = compute_metrics(result)
+    trades = result['trades']
+    wins = sum(1 for t in trades if t['pnl_abs'] > 0)
+    return {
+        **params,
+        'pnl': result['balance'] - result['initial_balance'],
+        'pnl_pct': (result['balance'] / result['initial_balance'] - 1) * 100,
+        'sharpe': metrics['sharpe'],
+        'sortino': metrics['sortino'],
+        'calmar': metrics['calmar'],
+        'cagr': metrics['cagr'],
+        'profit_factor': metrics['profit_factor'],
+        'max_drawdown': result['max_drawdown'],
+        'trades': len(trades),
+        'win_rate': wins / len(trades) * 100 if trades else 0.0,
+    }
+
+
+def sweep(market, probs, configs, workers=None):
+    """
+    Прогон конфигураций по пулу процессов. Цены и вероятности копируются в
+    shared memory один раз; воркеры получают только словари параметров.
+    """
+    workers = workers or os.cpu_count() or 1
+    segments, layout = _share({**{k: market[k] for k in ARRAY_KEYS}, 'probs': probs})
+    try:
+        init_args = (layout, market['symbols'], market['timestamps'], market['months'])
+        chunksize = max(1, len(configs) // (workers * 4))
+        with Pool(workers, initializer=_init_worker, initargs=init_args) as pool:
+            rows = list(pool.imap(evaluate, configs, chunksize=chunksize))
+    finally:
+        for shm in segments:
+            shm.close()
+            shm.unlink()
+    return pd.DataFrame(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Перебор параметров стратегии на тестовом отрезке")
+    parser.add_argument('specs', nargs='+', help="name=v1,v2,... (сетка) или name=lo:hi (диапазон для --samples)")
+    parser.add_argument('--samples', type=int, default=None, help="случайная выборка вместо полной сетки")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None, help="процессов (по умолчанию - все ядра)")
+    parser.add_argument('--out', default="sweep_results.csv")
+    args = parser.parse_args()
+
+    configs = parse_specs(args.specs, args.samples, args.seed)
+    test_set = load_test_set()
+    if test_set is None:
+        return
+    all_dfs, all_probs, test_timestamps = test_set
+    market = build_market(all_dfs, test_timestamps)
+    probs = np.stack([all_probs[sym] for sym in market['symbols']])
+
+    print(f"Перебор {len(configs)} конфигураций на {len(test_timestamps)} свечах...")
+    t0 = time.perf_counter()
+    results = sweep(market, probs, configs, args.workers)
+    elapsed = time.perf_counter() - t0
+    print(f"Готово за {elapsed:.1f}с ({len(configs) / elapsed:.1f} конфигураций/с)")
+
+    results = results.sort_values('sharpe', ascending=False)
+    results.to_csv(args.out, index=False)
+    print(f"💾 Результаты: {args.out}")
+    print(results.head(10).to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,241 @@
+import os
+import json
+import time
+import pickle
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from catboost import CatBoostClassifier, Pool
+from sklearn.metrics import accuracy_score, log_loss
+from config import *
+from backtest import frame_hash, to_class_probs
+from etl_pipeline import label_column
+from src.infrastructure.feature_store import FeatureStore
+
+# Параметры поставляемой models/catboost_model.cbm (ранняя остановка по TotalF1 на eval set)
+CATBOOST_PARAMS = {
+    'loss_function': 'MultiClass',
+    'eval_metric': 'TotalF1',
+    'iterations': 1000,
+    'depth': 6,
+    'learning_rate': 0.05,
+    'l2_leaf_reg': 3,
+    'auto_class_weights': 'Balanced',
+    'od_type': 'Iter',
+    'od_wait': 200,
+    'use_best_model': True,
+    'random_seed': 0,
+}
+EARLY_STOPPING_PARAMS = ('od_type', 'od_wait', 'use_best_model')
+BORDER_COUNT = 254
+
+
+def make_folds(timestamps, n_folds=WF_FOLDS, min_train=WF_MIN_TRAIN, gap=HORIZON, valid=WF_VALID):
+    """
+    Walk-forward с расширяющимся окном: хвост после min_train делится на n_folds
+    тестовых окон, фолд учится на всем до своего окна. Между train и test
+    пропускается gap свечей - метки последних строк train смотрят на gap вперед.
+    Последняя доля valid окна обучения (тоже через gap) - eval set для ранней
+    остановки; тестовое окно в выборе модели не участвует.
+    """
+    n = len(timestamps)
+    bounds = np.linspace(int(n * min_train), n, n_folds + 1).astype(int)
+    folds = []
+    for k in range(n_folds):
+        lo, hi = bounds[k], bounds[k + 1]
+        valid_hi = lo - gap
+        valid_lo = valid_hi - int(valid_hi * valid)
+        train_hi = valid_lo - gap if valid_lo < valid_hi else valid_hi
+        if train_hi <= 0 or hi <= lo:
+            raise ValueError(f"Fold {k}: not enough candles ({n}) for {n_folds} folds")
+        folds.append({
+            'fold': k,
+            'train_start': str(timestamps[0]),
+            'train_end': str(timestamps[train_hi - 1]),
+            'valid_start': str(timestamps[valid_lo]) if valid_lo < valid_hi else None,
+            'valid_end': str(timestamps[valid_hi - 1]) if valid_lo < valid_hi else None,
+            'test_start': str(timestamps[lo]),
+            'test_end': str(timestamps[hi - 1]),
+        })
+    return folds
+
+
+def load_rows(store, symbols, columns, start, end):
+    """Строки всех монет в [start, end] (отбор по времени - в хранилище)"""
+    parts = [store.read(sym, TIMEFRAME, columns, start=start, end=end) for sym in symbols]
+    return pd.concat(parts, ignore_index=True)
+
+
+def quantized_pool(df, feature_names, target, threads):
+    """
+    Квантованный Pool фолда с кэшем на диске: ключ - хэш признаков и меток,
+    поэтому фолды с неизменными данными повторно не квантуются.
+    Возвращает (pool, cache_hit).
+    """
+    h = hashlib.sha256(frame_hash(df[feature_names + [target]]).encode())
+    h.update(f"borders={BORDER_COUNT}".encode())
+    path = POOL_CACHE_DIR / f"{h.hexdigest()[:24]}.bin"
+    if path.exists():
+        return Pool(f"quantized://{path}"), True
+
+    pool = Pool(
+        df[feature_names],
+        label=df[target].to_numpy() + 1,  # -1/0/1 -> классы 0/1/2, как у поставляемой модели
+        feature_names=feature_names,
+        thread_count=threads,
+    )
+    pool.quantize(border_count=BORDER_COUNT)
+    POOL_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f".tmp{os.getpid()}_{id(pool)}")
+    pool.save(str(tmp))
+    os.replace(tmp, path)
+    return pool, False
+
+
+def evaluate(model, df, feature_names, target, threshold=CONFIDENCE_THRESHOLD):
+    """Метрики на тестовом окне: accuracy/logloss и точность сигналов по порогу стратегии"""
+    y = df[target].to_numpy()
+    probs = to_class_probs(model.predict_proba(df[feature_names]))
+    metrics = {
+        'n_test': int(len(y)),
+        'accuracy': float(accuracy_score(y, probs.argmax(axis=1) - 1)),
+        'logloss': float(log_loss(y, probs, labels=[-1, 0, 1])),
+    }
+    for name, col, label in (('long', 2, 1), ('short', 0, -1)):
+        hit = probs[:, col] > threshold
+        metrics[f'{name}_signals'] = int(hit.sum())
+        metrics[f'{name}_precision'] = float((y[hit] == label).mean()) if hit.any() else 0.0
+    return metrics
+
+
+def train_fold(fold, store, symbols, feature_names, target, params, threads, out_dir):
+    t0 = time.perf_counter()
+    columns = ['timestamp'] + feature_names + [target]
+    train_df = load_rows(store, symbols, columns, fold['train_start'], fold['train_end'])
+    test_df = load_rows(store, symbols, columns, fold['test_start'], fold['test_end'])
+
+    pool, cache_hit = quantized_pool(train_df, feature_names, target, threads)
+    eval_set = None
+    if fold['valid_start'] is not None:
+        # Сырой Pool: CatBoost квантует его границами обучающего
+        valid_df = load_rows(store, symbols, columns, fold['valid_start'], fold['valid_end'])
+        eval_set = Pool(valid_df[feature_names], label=valid_df[target].to_numpy() + 1,
+                        feature_names=feature_names, thread_count=threads)
+    else:
+        params = {k: v for k, v in params.items() if k not in EARLY_STOPPING_PARAMS}
+    model = CatBoostClassifier(**params, thread_count=threads, verbose=False, allow_writing_files=False)
+    model.fit(pool, eval_set=eval_set)
+
+    model_path = out_dir / f"fold_{fold['fold']}" / "catboost_model.cbm"
+    model_path.parent.mkdir(parents=True, exist_ok=True)
+    model.save_model(str(model_path))
+
+    metrics = evaluate(model, test_df, feature_names, target)
+    metrics['n_train'] = int(len(train_df))
+    metrics['n_valid'] = 0 if eval_set is None else int(eval_set.num_row())
+    metrics['trees'] = int(model.tree_count_)
+    return {
+        **fold,
+        'model': str(model_path.relative_to(out_dir)),
+        'pool_cached': cache_hit,
+        'seconds': round(time.perf_counter() - t0, 2),
+        'metrics': metrics,
+    }
+
+
+def walk_forward(
+    symbols=SYMBOLS,
+    feature_names=None,
+    target='Target',
+    n_folds=WF_FOLDS,
+    min_train=WF_MIN_TRAIN,
+    valid=WF_VALID,
+    params=None,
+    threads=TRAIN_THREADS,
+    parallel=TRAIN_PARALLEL_FOLDS,
+    out_dir=WALK_FORWARD_DIR,
+    store=None,
+):
+    """
+    Обучение и оценка по фолдам. Фолды идут параллельно (parallel штук), каждому
+    достается threads // parallel потоков CatBoost. Пишет модели фолдов и
+    folds.json (границы окон, пути к моделям, метрики) - его читает backtest.
+    """
+    store = store or FeatureStore()
+    if feature_names is None:
+        with open(MODELS_DIR / "features.pkl", "rb") as f:
+            feature_names = pickle.load(f)
+    params = {**CATBOOST_PARAMS, **(params or {})}
+    symbols = [sym for sym in symbols if store.exists(sym, TIMEFRAME)]
+    if not symbols:
+        raise RuntimeError("Нет данных в хранилище признаков - сначала запустите etl_pipeline.py")
+
+    # Окна строятся по общим для всех монет свечам, как в backtest
+    stamps = [set(store.read_arrays(sym, TIMEFRAME, ['timestamp'])['timestamp']) for sym in symbols]
+    common = sorted(set.intersection(*stamps))
+    horizons = {label_column(h, m): h for h, m in LABEL_SETS}
+    folds = make_folds(pd.DatetimeIndex(common), n_folds, min_train, gap=horizons.get(target, HORIZON), valid=valid)
+
+    parallel = max(1, min(parallel, len(folds)))
+    fold_threads = max(1, threads // parallel)
+    print(f"Walk-forward: {len(folds)} фолдов, {parallel} параллельно по {fold_threads} потоков")
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=parallel) as executor:
+        results = list(executor.map(
+            lambda fold: train_fold(fold, store, symbols, feature_names, target, params, fold_threads, out_dir),
+            folds,
+        ))
+
+    manifest = {
+        'symbols': symbols,
+        'timeframe': TIMEFRAME,
+        'target': target,
+        'features': feature_names,
+        'params': params,
+        'folds': results,
+    }
+    with open(out_dir / "folds.json", "w") as f:
+        json.dump(manifest, f, indent=2)
+    with open(out_dir / "features.pkl", "wb") as f:
+        pickle.dump(feature_names, f)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Walk-forward обучение и оценка CatBoost")
+    parser.add_argument('--folds', type=int, default=WF_FOLDS)
+    parser.add_argument('--min-train', type=float, default=WF_MIN_TRAIN)
+    parser.add_argument('--valid', type=float, default=WF_VALID, help="доля train окна под eval set, 0 - без ранней остановки")
+    parser.add_argument('--target', default='Target')
+    parser.add_argument('--iterations', type=int, default=CATBOOST_PARAMS['iterations'])
+    parser.add_argument('--threads', type=int, default=TRAIN_THREADS, help="потоков CatBoost на все фолды")
+    parser.add_argument('--parallel', type=int, default=TRAIN_PARALLEL_FOLDS, help="фолдов одновременно")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    manifest = walk_forward(
+        target=args.target,
+        n_folds=args.folds,
+        min_train=args.min_train,
+        valid=args.valid,
+        params={'iterations': args.iterations},
+        threads=args.threads,
+        parallel=args.parallel,
+    )
+
+    print(f"\nГотово за {time.perf_counter() - t0:.1f}с -> {WALK_FORWARD_DIR / 'folds.json'}")
+    for fold in manifest['folds']:
+        m = fold['metrics']
+        print(
+            f"Фолд {fold['fold']}: {fold['test_start']} -> {fold['test_end']} | "
+            f"train {m['n_train']} / valid {m['n_valid']} / test {m['n_test']}, {m['trees']} деревьев | acc {m['accuracy']:.3f} logloss {m['logloss']:.3f} | "
+            f"long {m['long_signals']} ({m['long_precision']:.0%}) short {m['short_signals']} ({m['short_precision']:.0%}) | "
+            f"{fold['seconds']}с{' (pool из кэша)' if fold['pool_cached'] else ''}"
+        )
+
+
+if __name__ == '__main__':
+    main()